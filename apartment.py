@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+    The Dirichlet-Neumann iteration for an arbitrary layout (see layout.py)
+    on any number of MPI ranks.
+
+    Every rank owns the rooms that layout.schedule() gives it. One iteration
+    is the same as in Room.solve(): all Dirichlet rooms solve with the
+    interface temperatures and send the fluxes, then all Neumann rooms solve
+    with the fluxes and send back the new (relaxed) interface temperatures.
+    Interface data between two rooms on the same rank is copied directly.
+    The iteration has converged when the update of all Dirichlet rooms
+    together is smaller than tol, which every rank learns from an allreduce.
+
+        mpirun -np 8 python main.py -d 1/20 --layout layouts/floor.json
+"""
+import sys
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.ticker import MaxNLocator
+
+import communication
+import layout as layout_module
+from subdomain import Subdomain
+
+
+class Apartment(object):
+
+    def __init__(self, com, layout, dx, omega=0.9, max_iters=1000, tol=1e-6, debug=False, solver='splu',
+                 preconditioner='multigrid', wall_temp=None, heater_temp=None, win_temp=None):
+        self.com = com
+        self.layout = layout
+        self.dx = dx
+        self.omega = omega
+        self.max_iters = max_iters
+        self.tol = tol
+        self.debug = debug
+        for name, temp in (('wall', wall_temp), ('heater', heater_temp), ('window', win_temp)):
+            if temp is not None:
+                layout.temperatures[name] = temp
+        layout.check_mesh(dx)
+
+        self.rank = com.Get_rank()
+        self.owner = layout_module.schedule(layout, dx, com.Get_size())
+        self.subdomains = [Subdomain(room, layout, dx, solver=solver, tol=tol, preconditioner=preconditioner)
+                           for room in layout.rooms if self.owner[room.index] == self.rank]
+
+        # Buffers for the interface temperatures (received by the Dirichlet
+        # rooms) and the fluxes (received by the Neumann rooms).
+        self.gamma = {}
+        self.flux = {}
+        for interface in layout.interfaces:
+            n = interface.nodes(dx)
+            if self.owns(interface.dirichlet):
+                self.gamma[interface.index] = np.empty(n)
+            if self.owns(interface.neumann):
+                self.flux[interface.index] = np.empty(n)
+
+    def __getstate__(self):
+        """ An apartment is pickled (by the pipes backend of local_comm.py)
+            without its communicator and subdomains, which can not be pickled.
+        """
+        state = dict(self.__dict__)
+        state['com'] = None
+        state['subdomains'] = []
+        return state
+
+    def owns(self, room):
+        return self.owner[room.index] == self.rank
+
+    def exchange(self, values, buffers, to):
+        """ Delivers values[k] of every interface k to buffers[k] of the room
+            on the side 'to' ('dirichlet' or 'neumann') of the interface.
+        """
+        requests = []
+        for interface in self.layout.interfaces:
+            k = interface.index
+            target = interface.dirichlet if to == 'dirichlet' else interface.neumann
+            source = interface.neumann if to == 'dirichlet' else interface.dirichlet
+            tag = communication.TAG_LAYOUT + k
+            if self.owns(target) and self.owns(source):
+                buffers[k][:] = values[k]
+            elif self.owns(target):
+                requests.append(communication.irecv_interface(self.com, buffers[k], source=self.owner[source.index], tag=tag))
+            elif self.owns(source):
+                requests.append(communication.isend_interface(self.com, values[k], dest=self.owner[target.index], tag=tag))
+        communication.wait_all(requests)
+
+    def solve(self):
+        """ Runs the iteration. Afterwards every subdomain of this rank has
+            its final field in u, and self.iterations is the number of
+            iterations done.
+        """
+        dirichlet = [sub for sub in self.subdomains if sub.role == 'dirichlet']
+        neumann = [sub for sub in self.subdomains if sub.role == 'neumann']
+
+        # The Neumann rooms start with the mean temperature of their walls as
+        # interface values.
+        gamma = {}
+        for sub in neumann:
+            for interface, index in sub.interfaces:
+                gamma[interface.index] = np.ones(len(index))*sub.initial_temp
+        gamma_km1 = gamma
+        self.exchange(gamma, self.gamma, 'dirichlet')
+
+        self.iterations = self.max_iters
+        for j in range(self.max_iters):
+            fluxes = {}
+            change = 0.0
+            for sub in dirichlet:
+                sub.u = sub.solve(self.gamma)
+                for interface, index in sub.interfaces:
+                    fluxes[interface.index] = sub.u[index] - self.gamma[interface.index]
+                if j != 0:
+                    change += np.linalg.norm(sub.u - sub.u_km1)**2
+            change = communication.allreduce_sum(self.com, change)
+            if j != 0 and np.sqrt(change) < self.tol:
+                self.iterations = j+1
+                if self.rank == 0:
+                    print('Algorithm finished after ' + str(j+1) + ' iterations.')
+                    sys.stdout.flush()
+                break
+
+            # Relaxation:
+            for sub in dirichlet:
+                if j != 0:
+                    sub.u = self.omega*sub.u + (1-self.omega)*sub.u_km1
+                sub.u_km1 = sub.u
+            self.exchange(fluxes, self.flux, 'neumann')
+
+            gamma = {}
+            for sub in neumann:
+                sub.u = sub.solve(self.flux)
+                for interface, index in sub.interfaces:
+                    k = interface.index
+                    gamma[k] = sub.u[index] + self.flux[k]
+                    if j != 0:
+                        gamma[k] = self.omega*gamma[k] + (1-self.omega)*gamma_km1[k]
+                if j != 0:
+                    sub.u = self.omega*sub.u + (1-self.omega)*sub.u_km1
+                sub.u_km1 = sub.u
+            gamma_km1 = gamma
+            self.exchange(gamma, self.gamma, 'dirichlet')
+
+            if self.debug and self.rank == 0:
+                print('Iteration : ' + str(j) + ', update = ' + str(np.sqrt(change)))
+                sys.stdout.flush()
+
+    def gather(self, root=0):
+        """ Returns the list of the final fields of all rooms on rank root
+            (None on the other ranks).
+        """
+        if self.rank != root:
+            for sub in self.subdomains:
+                communication.send_field(self.com, sub.u, dest=root)
+            return None
+        fields = [None]*len(self.layout.rooms)
+        for sub in self.subdomains:
+            fields[sub.spec.index] = sub.u
+        for room in self.layout.rooms:
+            if fields[room.index] is None:
+                fields[room.index] = communication.recv_field(self.com, room.unknowns(self.dx), source=self.owner[room.index])
+        return fields
+
+    def plot(self, fields):
+        """ Plots the temperature of all rooms (on the grid nodes). """
+        fig, ax = plt.subplots()
+        dx = self.dx
+        levels = MaxNLocator(nbins=50).tick_values(min(U.min() for U in fields), max(U.max() for U in fields))
+        for room, U in zip(self.layout.rooms, fields):
+            M = int(round(room.height/dx)) - 1
+            N = int(round(room.width/dx)) - 1
+            X, Y = np.meshgrid(room.x + dx*(np.arange(N) + 1), room.y + room.height - dx*(np.arange(M) + 1))
+            cf = ax.contourf(X, Y, U.reshape((M, N)), levels=levels, cmap='RdBu_r')
+            ax.add_patch(plt.Rectangle((room.x, room.y), room.width, room.height, fill=False))
+        fig.colorbar(cf, ax=ax)
+        plt.axis('equal')
+        plt.title('Iterations = ' + str(self.iterations) + '. Mesh width = ' + str(self.dx) + 'm')
+        plt.show()
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+    Sparse assembly of the five-point operator used by the rooms.
+
+    The operator is built directly from its diagonals, so the memory needed
+    grows linearly with the number of unknowns (no dense N^2 x N^2 matrix is
+    ever created).
+"""
+import numpy as np
+import scipy.sparse as sp
+
+
+SIDES = ('left', 'right', 'top', 'bottom')
+
+
+def laplacian_1d(n, neumann_start=False, neumann_end=False):
+    """ Returns the (unscaled) 1D second difference tridiag(1,-2,1) of size n.
+        A Neumann end changes the corresponding diagonal element to -1,
+        which is what gives the -3 on the Neumann side of the 2D operator.
+    """
+    main = -2*np.ones(n)
+    if neumann_start:
+        main[0] += 1
+    if neumann_end:
+        main[-1] += 1
+    off = np.ones(n - 1)
+    return sp.diags([off, main, off], [-1, 0, 1], shape=(n, n), format='csr')
+
+
+def five_point_operator(M, N, neumann=(), format='csc', shift=0):
+    """ Returns the five-point Laplacian for a grid with M rows and N columns
+        of unknown nodes, numbered row by row (node i*N + j is in row i,
+        column j). The sides listed in neumann ('left', 'right', 'top',
+        'bottom') get the Neumann treatment, all other sides are Dirichlet.
+        With shift, the operator is A - shift*I (used for time stepping).
+    """
+    for side in neumann:
+        assert (side in SIDES), 'Unknown side: ' + str(side)
+    Tx = laplacian_1d(N, 'left' in neumann, 'right' in neumann)
+    Ty = laplacian_1d(M, 'top' in neumann, 'bottom' in neumann)
+    A = sp.kron(sp.identity(M), Tx) + sp.kron(Ty, sp.identity(N))
+    if shift:
+        A = A - shift*sp.identity(M*N)
+    return A.asformat(format)
@@ -0,0 +1,591 @@
+# -*- coding: utf-8 -*-
+"""
+    Benchmarks.
+
+    solvers:     for every mesh width, the setup time (assembly +
+                 factorization) and the time per Dirichlet-Neumann iteration
+                 (update of b + linear solve) of the linear solver backends in
+                 solvers.py, for room 1 and room 2, without MPI.
+
+                     python benchmark.py solvers --dx 1/10 1/20 --solvers spsolve splu
+
+    relaxation:  the number of Dirichlet-Neumann iterations and the time to
+                 solution of the relaxation modes in relaxation.py. Every run
+                 is a separate 'mpirun -np 3 python benchmark.py dn ...'.
+
+                     python benchmark.py relaxation --dx 1/20 1/40 --omega 0.5 0.9
+
+    phases:      the time of every phase of Room on every rank: assembly of
+                 A and b, factorization (setup of the linear solver), the
+                 updates of b, the linear solves, communication (sends,
+                 receives and waits) and relaxation (Aitken/Anderson; the
+                 fixed relaxation is inline in Room.solve() and counted in
+                 'other'), with the peak memory of every rank. It runs every
+                 mesh width with every number of ranks (strong scaling), or
+                 with --weak, refines the mesh with the number of ranks so that
+                 the ranks of room 2 keep the same number of unknowns. More
+                 than 3 ranks split room 2 into strips (see strips.py), which
+                 needs --backend mpi. The results are written as JSON.
+
+                     python benchmark.py phases --dx 1/40 1/80 --ranks 3 4 5 --backend mpi --output new.json
+
+    precision:   the savings of precision 'single' (see solvers.RefinedSolver)
+                 against 'double' for every mesh width: the memory of the
+                 factors, the bytes of the interface messages, the time of the
+                 linear solves (with the refinement steps) and the wall time,
+                 with one process per rank (pipes backend) by default.
+
+                     python benchmark.py precision --dx 1/40 1/80 --tol 1e-4
+
+    orderings:   the orderings of the interface iteration (see
+                 Room.solve_pipelined() and Room.solve_async()) against
+                 lockstep for every mesh width and omega: the iterations of
+                 room 2, the wall time to tolerance, the utilization of every
+                 rank (the time in linear solves over the wall time) and the
+                 largest difference of the fields to those of lockstep, with
+                 one process per rank (pipes backend) by default. The
+                 utilization of lockstep is at most about 1/2, since room 2
+                 and room 1 and 3 take turns; the other orderings only pay
+                 off with a core per rank.
+
+                     python benchmark.py orderings --dx 1/40 1/80 --omega 0.3 0.5 0.9
+
+    compare:     compares two JSON files of 'phases' and flags every time or
+                 memory that has grown by more than the threshold, and every
+                 change of the number of iterations. The exit code is 1 if
+                 there are regressions.
+
+                     python benchmark.py compare old.json new.json --threshold 0.2
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import scipy
+
+import communication
+import local_comm
+import room
+import solvers
+import tracing
+
+try:
+    import resource
+except ImportError: # not on Windows
+    resource = None
+
+
+def time_room(room_nr, dx, solver, iters):
+    """ Returns (setup time, time per iteration) in ms for one room. """
+    time1 = time.perf_counter()
+    room_object = room.Room(com=None, room=room_nr, dx=dx, solver=solver)
+    time2 = time.perf_counter()
+
+    N = room_object.N
+    gamma1 = np.ones(N)*room_object.wall_temp
+    gamma2 = np.ones(N)*room_object.wall_temp
+    u = None
+    for i in range(iters):
+        if room_nr == 2:
+            room_object.update_b_room2(gamma1=gamma1, gamma2=gamma2)
+        else:
+            room_object.update_b_room1_room3(gamma=gamma1)
+        u = room_object.linear_solver.solve(room_object.b, x0=u)
+    time3 = time.perf_counter()
+    return 1000*(time2 - time1), 1000*(time3 - time2)/iters
+
+
+def parse_dx(text):
+    frac = text.split('/')
+    assert(len(frac)==2), 'dx needs to be of the format "1/x"'
+    return float(int(frac[0])/int(frac[1]))
+
+
+def benchmark_solvers(args):
+    print('%-8s %-5s %-10s %12s %12s %10s' % ('dx', 'room', 'solver', 'setup [ms]', 'iter [ms]', 'speedup'))
+    for dx_text in args.dx:
+        dx = parse_dx(dx_text)
+        for room_nr in (1, 2):
+            reference = None
+            for solver in args.solvers:
+                try:
+                    setup, per_iter = time_room(room_nr, dx, solver, args.iters)
+                except (ImportError, MemoryError, ValueError) as error:
+                    print('%-8s %-5d %-10s  skipped (%s)' % (dx_text, room_nr, solver, error))
+                    continue
+                if reference is None:
+                    reference = per_iter
+                print('%-8s %-5d %-10s %12.2f %12.3f %9.1fx' % (dx_text, room_nr, solver, setup, per_iter, reference/per_iter))
+
+
+def run_dn(args):
+    """ One Dirichlet-Neumann solve under mpirun; room 2 prints the result
+        as a JSON line.
+    """
+    from mpi4py import MPI
+    com = MPI.COMM_WORLD
+    room_nr = com.Get_rank() + 1
+    room_object = room.Room(com=com, room=room_nr, dx=parse_dx(args.dx), omega=args.omega,
+                            relaxation=args.relaxation, solver=args.solver)
+    com.Barrier()
+    time1 = time.perf_counter()
+    room_object.solve()
+    com.Barrier()
+    time2 = time.perf_counter()
+    if room_nr == 2:
+        print(json.dumps({'iterations': room_object.max_iters, 'time': time2 - time1}))
+
+
+def spawn_dn(args, dx_text, relaxation, omega):
+    """ Runs 'benchmark.py dn' with 3 ranks and returns its JSON result. """
+    command = shlex.split(args.mpirun) + ['-np', '3', sys.executable, __file__, 'dn',
+               '--dx', dx_text, '--relaxation', relaxation, '--omega', str(omega), '--solver', args.solver]
+    # This process has initialized MPI itself (through room), so do not pass
+    # on its MPI environment to the new mpirun.
+    env = {key: value for key, value in os.environ.items() if not key.startswith(('OMPI_', 'PMIX_'))}
+    output = subprocess.run(command, check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def benchmark_relaxation(args):
+    print('%-8s %-10s %6s %8s %10s' % ('dx', 'relaxation', 'omega', 'iters', 'time [s]'))
+    for dx_text in args.dx:
+        for omega in args.omega:
+            for relaxation in args.relaxations:
+                result = spawn_dn(args, dx_text, relaxation, omega)
+                print('%-8s %-10s %6.2f %8d %10.3f' % (dx_text, relaxation, omega, result['iterations'], result['time']))
+
+
+# The profile of the rank that runs in this thread (each rank of the thread
+# backends has its own thread, MPI and pipes ranks their own process).
+current = threading.local()
+
+PHASES = ('assembly', 'factorization', 'update_b', 'linear_solve', 'communication', 'relaxation')
+
+
+class Profile(object):
+    """ Accumulated time [s] and number of calls per phase. """
+    def __init__(self):
+        self.time = {phase: 0.0 for phase in PHASES}
+        self.calls = {phase: 0 for phase in PHASES}
+
+    def add(self, phase, seconds):
+        self.time[phase] += seconds
+        self.calls[phase] += 1
+
+
+def timed(phase, function):
+    """ Returns function, timed as phase in the profile of the calling rank
+        (if it has one).
+    """
+    def wrapper(*args, **kwargs):
+        profile = getattr(current, 'profile', None)
+        if profile is None:
+            return function(*args, **kwargs)
+        time1 = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.add(phase, time.perf_counter() - time1)
+    wrapper.timed = True
+    return wrapper
+
+
+def instrument():
+    """ Times the assembly, the solver setup and the communication of all
+        rooms. Only calls from ranks with a profile are timed.
+    """
+    if getattr(solvers.make_solver, 'timed', False):
+        return
+    room.Room.create_A_and_b_room1_room3 = timed('assembly', room.Room.create_A_and_b_room1_room3)
+    room.Room.create_A_and_b_room2 = timed('assembly', room.Room.create_A_and_b_room2)
+    solvers.make_solver = timed('factorization', solvers.make_solver)
+    for name in ('send_interface', 'isend_interface', 'recv_interface', 'irecv_interface', 'wait_all', 'send_done'):
+        setattr(communication, name, timed('communication', getattr(communication, name)))
+
+
+def peak_memory():
+    """ The peak resident memory of this process in MB (None if unknown). """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak/2**20 if sys.platform == 'darwin' else peak/2**10
+
+
+def factor_bytes(linear_solver):
+    """ The memory of the factors of a direct solver backend in bytes
+        (None for the other backends).
+    """
+    if isinstance(linear_solver, solvers.RefinedSolver):
+        return factor_bytes(linear_solver.solver)
+    if isinstance(linear_solver, solvers.SparseLUSolver):
+        return sum(M.data.nbytes + M.indices.nbytes + M.indptr.nbytes for M in (linear_solver.lu.L, linear_solver.lu.U))
+    if hasattr(linear_solver, 'factors'):
+        factors = linear_solver.factors()
+        return sum(array.nbytes for array in factors.values()) if factors else None
+    return None
+
+
+def profile_rank(com, dx, solver, relaxation, omega, precision='double', tol=1e-6):
+    """ One rank of a profiled solve of the three rooms (set up as in
+        main.run_rooms()). Returns a dict with the phases of this rank.
+    """
+    instrument()
+    rank = com.Get_rank()
+    room_nr = rank + 1 if rank < 3 else 2
+    strip_com = None
+    if com.Get_size() > 3:
+        strip_com = com.Split(0 if room_nr == 2 else communication.namespace(com).UNDEFINED, key=rank)
+        if room_nr != 2:
+            strip_com = None
+
+    profile = current.profile = Profile()
+    time1 = time.perf_counter()
+    room_object = room.Room(com=com, room=room_nr, dx=dx, solver=solver, relaxation=relaxation, omega=omega,
+                            strip_com=strip_com, verbose=False, precision=precision, tol=tol)
+    setup = time.perf_counter() - time1
+    factors = factor_bytes(room_object.linear_solver)
+
+    # The extra ranks of room 2 only take part in its solves.
+    linear_solver = room_object.linear_solver
+    if rank >= 3:
+        linear_solver.parallel_solve = timed('linear_solve', linear_solver.parallel_solve)
+    else:
+        linear_solver.solve = timed('linear_solve', linear_solver.solve)
+        for name in ('update_b_room1_room3', 'update_b_room2', 'rhs'):
+            setattr(room_object, name, timed('update_b', getattr(room_object, name)))
+        if room_object.relax is not None:
+            room_object.relax.start = timed('relaxation', room_object.relax.start)
+            room_object.relax.update = timed('relaxation', room_object.relax.update)
+
+    com.Barrier()
+    time1 = time.perf_counter()
+    if rank >= 3:
+        linear_solver.serve()
+    else:
+        room_object.solve()
+        if strip_com is not None:
+            linear_solver.close()
+    solve = time.perf_counter() - time1
+    com.Barrier()
+    wall_time = time.perf_counter() - time1
+    current.profile = None
+
+    phases = dict(profile.time)
+    phases['other'] = solve - sum(phases[phase] for phase in PHASES if phase not in ('assembly', 'factorization'))
+    return {'rank': rank, 'room': room_nr, 'setup': setup, 'solve': solve, 'wall_time': wall_time,
+            'iterations': room_object.max_iters if rank == 1 else None,
+            'phases': phases, 'calls': dict(profile.calls), 'peak_memory_mb': peak_memory(),
+            'factor_bytes': factors, 'message_size': room_object.N*np.dtype(room_object.dtype).itemsize}
+
+
+def run_phases_mpi(args):
+    """ profile_rank() under mpirun; rank 0 prints the list of the results
+        of all ranks as a JSON line.
+    """
+    from mpi4py import MPI
+    com = MPI.COMM_WORLD
+    result = profile_rank(com, parse_dx(args.dx), args.solver, args.relaxation, args.omega)
+    results = com.gather(result, root=0)
+    if com.Get_rank() == 0:
+        print(json.dumps(results))
+
+
+def spawn_phases(args, dx_text, ranks):
+    """ Runs 'benchmark.py phases-rank' with the given number of ranks under
+        mpirun and returns its results.
+    """
+    command = shlex.split(args.mpirun) + ['-np', str(ranks), sys.executable, __file__, 'phases-rank',
+               '--dx', dx_text, '--solver', args.solver, '--relaxation', args.relaxation, '--omega', str(args.omega)]
+    env = {key: value for key, value in os.environ.items() if not key.startswith(('OMPI_', 'PMIX_'))}
+    output = subprocess.run(command, check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def configurations(args):
+    """ The (dx, ranks) pairs to run: every dx with every number of ranks
+        (strong scaling), or with --weak, the first dx for 3 ranks, refined
+        so that every rank of room 2 has about as many unknowns.
+    """
+    if not args.weak:
+        return [(dx_text, ranks) for dx_text in args.dx for ranks in args.ranks]
+    x = 1/parse_dx(args.dx[0])
+    return [('1/' + str(int(round(x*np.sqrt(ranks - 2)))), ranks) for ranks in args.ranks]
+
+
+def benchmark_phases(args):
+    if args.backend != 'mpi' and max(args.ranks) > 3:
+        raise ValueError('More than 3 ranks (room 2 in strips) needs --backend mpi.')
+    runs = []
+    print('%-8s %5s %8s %10s %10s %10s %10s %10s %10s %10s %10s' % ('dx', 'ranks', 'iters', 'wall [s]', 'setup [s]', 'update_b',
+          'solve', 'comm', 'relax', 'other', 'mem [MB]'))
+    for dx_text, ranks in configurations(args):
+        best = None
+        for repeat in range(args.repeat):
+            if args.backend == 'mpi':
+                results = spawn_phases(args, dx_text, ranks)
+            else:
+                results = local_comm.run(profile_rank, ranks, args.backend,
+                                         (parse_dx(dx_text), args.solver, args.relaxation, args.omega))
+            wall_time = max(result['wall_time'] for result in results)
+            if best is None or wall_time < best[0]:
+                best = (wall_time, results)
+        wall_time, results = best
+        run = {'dx': dx_text, 'ranks': ranks, 'solver': args.solver, 'relaxation': args.relaxation,
+               'omega': args.omega, 'backend': args.backend, 'iterations': results[1]['iterations'],
+               'wall_time': wall_time, 'setup': max(result['setup'] for result in results),
+               'peak_memory_mb': max(result['peak_memory_mb'] or 0 for result in results), 'per_rank': results}
+        runs.append(run)
+        # The slowest rank for every phase.
+        slowest = {phase: max(result['phases'][phase] for result in results) for phase in PHASES + ('other',)}
+        print('%-8s %5d %8d %10.3f %10.3f %10.3f %10.3f %10.3f %10.3f %10.3f %10.1f' % (dx_text, ranks, run['iterations'], wall_time,
+              run['setup'], slowest['update_b'], slowest['linear_solve'], slowest['communication'], slowest['relaxation'],
+              slowest['other'], run['peak_memory_mb']))
+        sys.stdout.flush()
+
+    output = {'created': datetime.datetime.now().isoformat(timespec='seconds'),
+              'machine': {'platform': platform.platform(), 'python': platform.python_version(),
+                          'numpy': np.__version__, 'scipy': scipy.__version__, 'cpus': os.cpu_count()},
+              'scaling': 'weak' if args.weak else 'strong', 'runs': runs}
+    with open(args.output, 'w') as f:
+        json.dump(output, f, indent=1)
+    print('Results written to ' + args.output)
+
+
+def benchmark_precision(args):
+    print('%-8s %-7s %8s %10s %10s %12s %12s %10s' % ('dx', 'prec.', 'iters', 'wall [s]', 'solve [s]', 'factors [MB]',
+          'messages [kB]', 'mem [MB]'))
+    for dx_text in args.dx:
+        rows = {}
+        for precision in solvers.PRECISIONS:
+            results = local_comm.run(profile_rank, 3, args.backend,
+                                     (parse_dx(dx_text), args.solver, args.relaxation, args.omega, precision, args.tol))
+            # Room 2 receives and sends two interface vectors per iteration.
+            room2 = results[1]
+            row = rows[precision] = (max(result['wall_time'] for result in results),
+                                     max(result['phases']['linear_solve'] for result in results),
+                                     sum(result['factor_bytes'] or 0 for result in results),
+                                     4*room2['message_size']*room2['iterations'],
+                                     max(result['peak_memory_mb'] or 0 for result in results))
+            print('%-8s %-7s %8d %10.3f %10.3f %12.2f %12.1f %10.1f' % ((dx_text, precision, room2['iterations'], row[0], row[1],
+                  row[2]/2**20, row[3]/2**10, row[4])))
+        double, single = rows['double'], rows['single']
+        print('%-8s savings: wall time %+.0f%%, solves %+.0f%%, factors %+.0f%%, messages %+.0f%%, memory %+.0f%%' %
+              ((dx_text,) + tuple(100*(1 - s/d) if d else 0.0 for s, d in zip(single, double))))
+        sys.stdout.flush()
+
+
+def ordering_rank(com, dx, ordering, omega, staleness=2, tol=1e-6):
+    """ One rank of a solve with the ordering. Returns the time in linear
+        solves and waiting for messages (from the trace of the rank), the
+        wall time and iterations of the solve, and the field of the room.
+    """
+    rank = com.Get_rank()
+    recorder = tracing.Recorder(rank)
+    room_object = room.Room(com=com, room=rank + 1, dx=dx, omega=omega, tol=tol, verbose=False, callback=recorder,
+                            ordering=ordering, staleness=staleness)
+    com.Barrier()
+    time1 = time.perf_counter()
+    U = room_object.solve()[0]
+    wall_time = time.perf_counter() - time1
+    return {'rank': rank, 'iterations': len(recorder.records), 'wall_time': wall_time,
+            'solve_time': sum(record['solve_time'] for record in recorder.records),
+            'recv_time': sum(record['recv_time'] for record in recorder.records), 'U': U}
+
+
+def benchmark_orderings(args):
+    print('%-8s %-10s %6s %6s %10s %24s %10s' % ('dx', 'ordering', 'omega', 'iters', 'wall [s]',
+                                                 'utilization (rank 0 1 2)', 'diff'))
+    for dx_text in args.dx:
+        for omega in args.omega:
+            reference = None
+            for ordering in room.ORDERINGS:
+                results = local_comm.run(ordering_rank, 3, args.backend,
+                                         (parse_dx(dx_text), ordering, omega, args.staleness, args.tol))
+                if reference is None:
+                    reference = results
+                wall_time = max(result['wall_time'] for result in results)
+                utilization = ' '.join('%7.2f' % (result['solve_time']/wall_time) for result in results)
+                diff = max(np.abs(result['U'] - other['U']).max() for result, other in zip(results, reference))
+                print('%-8s %-10s %6.2f %6d %10.3f %24s %10.1e' % (dx_text, ordering, omega, results[1]['iterations'],
+                                                               wall_time, utilization, diff))
+                sys.stdout.flush()
+
+
+def run_key(run):
+    return (run['dx'], run['ranks'], run['solver'], run['relaxation'], run['omega'], run['backend'])
+
+
+def run_metrics(run):
+    """ The compared numbers of a run: wall time, setup, memory and the
+        slowest rank of every phase.
+    """
+    metrics = {'wall_time': run['wall_time'], 'setup': run['setup'], 'peak_memory_mb': run['peak_memory_mb']}
+    for phase in PHASES + ('other',):
+        metrics[phase] = max(result['phases'][phase] for result in run['per_rank'])
+    return metrics
+
+
+def compare(old, new, threshold, min_time=1e-3):
+    """ Returns the list of regressions of the runs in new against the same
+        runs in old, as strings. Times below min_time [s] are ignored, they
+        are mostly noise.
+    """
+    old_runs = {run_key(run): run for run in old['runs']}
+    regressions = []
+    print('%-8s %5s %-14s %12s %12s %8s' % ('dx', 'ranks', 'metric', 'old', 'new', 'change'))
+    for run in new['runs']:
+        key = run_key(run)
+        if key not in old_runs:
+            print('%-8s %5d  not in the old results' % (run['dx'], run['ranks']))
+            continue
+        name = '%s with %d ranks' % (run['dx'], run['ranks'])
+        old_run = old_runs[key]
+        if run['iterations'] != old_run['iterations']:
+            regressions.append(name + ': ' + str(old_run['iterations']) + ' -> ' + str(run['iterations']) + ' iterations')
+        old_metrics = run_metrics(old_run)
+        for metric, value in run_metrics(run).items():
+            old_value = old_metrics[metric]
+            if metric != 'peak_memory_mb' and max(value, old_value) < min_time:
+                continue
+            change = (value - old_value)/old_value if old_value else 0.0
+            flag = ''
+            if change > threshold:
+                flag = '  REGRESSION'
+                regressions.append('%s: %s %.4g -> %.4g (%+.0f%%)' % (name, metric, old_value, value, 100*change))
+            elif change < -threshold:
+                flag = '  improved'
+            print('%-8s %5d %-14s %12.4g %12.4g %+7.0f%%%s' % (run['dx'], run['ranks'], metric, old_value, value, 100*change, flag))
+    return regressions
+
+
+def benchmark_compare(args):
+    with open(args.old) as f:
+        old = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+    regressions = compare(old, new, args.threshold)
+    if regressions:
+        print(str(len(regressions)) + ' regressions:')
+        for regression in regressions:
+            print('    ' + regression)
+        sys.exit(1)
+    print('No regressions.')
+
+
+if __name__=='__main__':
+    argparser = argparse.ArgumentParser(description='Benchmarks of the heat distribution solver')
+    subparsers = argparser.add_subparsers(dest='benchmark', required=True)
+
+    solvers_parser = subparsers.add_parser('solvers', help='Compare the linear solver backends')
+    solvers_parser.add_argument('--dx', nargs='+', default=['1/10', '1/20', '1/40', '1/80'],
+                                help='Mesh widths, in the form 1/x')
+    solvers_parser.add_argument('--solvers', nargs='+', default=['spsolve', 'dense', 'splu', 'cholesky', 'fft', 'multigrid'],
+                                help='Solver backends to compare')
+    solvers_parser.add_argument('--iters', type=int, default=10,
+                                help='Number of iterations to time')
+
+    relaxation_parser = subparsers.add_parser('relaxation', help='Compare the relaxation modes')
+    relaxation_parser.add_argument('--dx', nargs='+', default=['1/20', '1/40', '1/80'],
+                                   help='Mesh widths, in the form 1/x')
+    relaxation_parser.add_argument('--omega', nargs='+', type=float, default=[0.5, 0.9],
+                                   help='(Initial) relaxation parameters')
+    relaxation_parser.add_argument('--relaxations', nargs='+', default=['fixed', 'aitken', 'anderson'],
+                                   help='Relaxation modes to compare')
+    relaxation_parser.add_argument('--solver', default='splu',
+                                   help='Linear solver backend')
+    relaxation_parser.add_argument('--mpirun', default='mpirun',
+                                   help='Command used to start MPI programs')
+
+    dn_parser = subparsers.add_parser('dn', help='One solve (run under mpirun -np 3)')
+    dn_parser.add_argument('--dx', default='1/20')
+    dn_parser.add_argument('--omega', type=float, default=0.9)
+    dn_parser.add_argument('--relaxation', default='fixed')
+    dn_parser.add_argument('--solver', default='splu')
+
+    phases_parser = subparsers.add_parser('phases', help='Time the phases of the rooms on every rank, write JSON')
+    phases_parser.add_argument('--dx', nargs='+', default=['1/20', '1/40', '1/80'],
+                               help='Mesh widths, in the form 1/x (with --weak, the mesh width for 3 ranks)')
+    phases_parser.add_argument('--ranks', nargs='+', type=int, default=[3],
+                               help='Numbers of ranks (more than 3 split room 2 into strips)')
+    phases_parser.add_argument('--weak', action='store_true',
+                               help='Weak scaling: refine the mesh with the number of ranks')
+    phases_parser.add_argument('--backend', default='pipes',
+                               help='mpi, or one of the backends of local_comm.py (pipes: one process per rank)')
+    phases_parser.add_argument('--solver', default='splu',
+                               help='Linear solver backend')
+    phases_parser.add_argument('--relaxation', default='fixed',
+                               help='Relaxation mode')
+    phases_parser.add_argument('--omega', type=float, default=0.9,
+                               help='(Initial) relaxation parameter')
+    phases_parser.add_argument('--repeat', type=int, default=1,
+                               help='Run every configuration this many times and keep the fastest')
+    phases_parser.add_argument('--mpirun', default='mpirun',
+                               help='Command used to start MPI programs')
+    phases_parser.add_argument('--output', default='benchmark.json',
+                               help='JSON file for the results')
+
+    phases_rank_parser = subparsers.add_parser('phases-rank', help='One profiled solve (run under mpirun)')
+    phases_rank_parser.add_argument('--dx', default='1/20')
+    phases_rank_parser.add_argument('--solver', default='splu')
+    phases_rank_parser.add_argument('--relaxation', default='fixed')
+    phases_rank_parser.add_argument('--omega', type=float, default=0.9)
+
+    precision_parser = subparsers.add_parser('precision', help='Compare the single and double precision')
+    precision_parser.add_argument('--dx', nargs='+', default=['1/20', '1/40', '1/80'],
+                                  help='Mesh widths, in the form 1/x')
+    precision_parser.add_argument('--tol', type=float, default=1e-6,
+                                  help='Tolerance of the rooms (single precision messages need at least 1e-4)')
+    precision_parser.add_argument('--backend', default='pipes',
+                                  help='One of the backends of local_comm.py')
+    precision_parser.add_argument('--solver', default='splu',
+                                  help='Linear solver backend (one that factorizes)')
+    precision_parser.add_argument('--relaxation', default='fixed',
+                                  help='Relaxation mode')
+    precision_parser.add_argument('--omega', type=float, default=0.9,
+                                  help='(Initial) relaxation parameter')
+
+    orderings_parser = subparsers.add_parser('orderings', help='Compare the orderings of the interface iteration')
+    orderings_parser.add_argument('--dx', nargs='+', default=['1/20', '1/40', '1/80'],
+                                  help='Mesh widths, in the form 1/x')
+    orderings_parser.add_argument('--omega', type=float, nargs='+', default=[0.3, 0.5, 0.9],
+                                  help='Relaxation parameters')
+    orderings_parser.add_argument('--staleness', type=int, default=2,
+                                  help='Staleness of the ordering async')
+    orderings_parser.add_argument('--tol', type=float, default=1e-6,
+                                  help='Tolerance of the rooms')
+    orderings_parser.add_argument('--backend', default='pipes',
+                                  help='One of the backends of local_comm.py')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two JSON files of phases')
+    compare_parser.add_argument('old', help='JSON file of the reference run')
+    compare_parser.add_argument('new', help='JSON file of the new run')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help='Relative growth that counts as a regression')
+
+    args = argparser.parse_args()
+    if args.benchmark == 'solvers':
+        benchmark_solvers(args)
+    elif args.benchmark == 'relaxation':
+        benchmark_relaxation(args)
+    elif args.benchmark == 'phases':
+        benchmark_phases(args)
+    elif args.benchmark == 'phases-rank':
+        run_phases_mpi(args)
+    elif args.benchmark == 'precision':
+        benchmark_precision(args)
+    elif args.benchmark == 'orderings':
+        benchmark_orderings(args)
+    elif args.benchmark == 'compare':
+        benchmark_compare(args)
+    else:
+        run_dn(args)
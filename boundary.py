@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+    The boundary of a room as index maps.
+
+    A Boundary describes the segments of the sides of a grid of M x N
+    unknowns (numbered row by row, row 0 at the top): fixed segments (walls,
+    heaters, windows) with the name of their temperature, and interface
+    segments. The index maps are computed once, as slices where possible, so
+    that
+
+        assemble(temperatures)   builds the fixed part of b (b_fixed),
+        scatter(b, name, gamma)  writes interface data into b,
+        gather(u, name)          returns the values of u next to an interface
+
+    are a few vectorized NumPy operations instead of loops over the nodes.
+    The segments of a node on a corner all contribute to it, in the order
+    they were added.
+"""
+import numpy as np
+
+
+class Boundary(object):
+
+    def __init__(self, M, N):
+        self.M = M
+        self.N = N
+        self.fixed = []         # (index, temperature name), in the order of assembly
+        self.interfaces = {}    # name -> index
+        self.b_fixed = None
+
+    def side(self, side, start=0, stop=None):
+        """ The index map (a slice) of the nodes next to side, from node
+            start to node stop (exclusive) along it: left to right for top
+            and bottom, top to bottom for left and right.
+        """
+        M, N = self.M, self.N
+        if side in ('top', 'bottom'):
+            stop = N if stop is None else stop
+            offset = 0 if side == 'top' else (M - 1)*N
+            return slice(offset + start, offset + stop)
+        stop = M if stop is None else stop
+        column = 0 if side == 'left' else N - 1
+        return slice(start*N + column, stop*N, N)
+
+    def add_fixed(self, index, temperature):
+        """ Adds a segment with the fixed temperature of the given name. """
+        self.fixed.append((index, temperature))
+
+    def add_interface(self, name, index):
+        self.interfaces[name] = index
+
+    def assemble(self, temperatures, batch_shape=()):
+        """ Returns b with the contributions of all fixed segments (the
+            temperatures by name, scalars or arrays of shape batch_shape), and
+            keeps it as b_fixed for scatter().
+        """
+        b = np.zeros((self.M*self.N,) + batch_shape)
+        for index, temperature in self.fixed:
+            b[index] -= temperatures[temperature]
+        self.b_fixed = b
+        return b.copy()
+
+    def scatter(self, b, name, values):
+        """ Writes the interface data values into b: the fixed part of b on
+            the interface nodes minus values.
+        """
+        index = self.interfaces[name]
+        b[index] = self.b_fixed[index] - values
+
+    def gather(self, u, name):
+        """ The values of u on the nodes of an interface (a view for a
+            slice index map).
+        """
+        return u[self.interfaces[name]]
+
+    def indices(self, name):
+        """ The index map of an interface as an array of node indices. """
+        index = self.interfaces[name]
+        if isinstance(index, slice):
+            return np.arange(self.M*self.N)[index]
+        return index
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+    A persistent, content-addressed cache of operators and solutions.
+
+    Every entry is a directory <kind>-<hash> with one .npy file per array and
+    key.json, where the hash is that of the key (a JSON dict). Arrays are
+    loaded as read-only memmaps. Entries are written to a temporary directory
+    and renamed, so ranks that store the same entry at the same time do not
+    see half-written ones. The cache is kept below max_bytes by removing the
+    least recently used entries; the time of the last use is the mtime of
+    key.json.
+
+    The kinds used are
+
+        'operator':   factorizations of the solver backends that have
+                      factors()/from_factors() (see solvers.make_solver()),
+                      keyed by the backend and a digest of A. These are the
+                      dense ones: the factors of splu (SuperLU) can not be
+                      built again from arrays, so splu factorizes every run,
+                      and make_solver() warns about it.
+        'interface':  the assembled interface operator K of schur.py, keyed
+                      by the mesh, the solver, its precision and tol.
+        'solution':   converged fields and interface values, one entry per
+                      room (U1 and gamma1, U2, or U3 and gamma2), keyed by
+                      the room, dx, omega, the temperatures and the solver
+                      and precision that computed them.
+
+    The solution is linear in the temperatures (see sweep.py), so
+    warm_start() combines the cached solutions of the same mesh whose
+    temperatures are nearest to the new ones: if the new temperatures are a
+    combination of cached ones, the combination of their solutions is the
+    new solution, otherwise it is still a good first guess.
+
+        python main.py -d 1/40 --cache ~/.cache/apartment --backend threads
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+
+KEY_FILE = 'key.json'
+
+
+def digest(A):
+    """ A short hash of the contents of the (sparse or dense) matrix A. """
+    h = hashlib.sha1()
+    if sp.issparse(A):
+        A = sp.csc_matrix(A)
+        for part in (A.data, A.indices, A.indptr):
+            h.update(np.ascontiguousarray(part).tobytes())
+        h.update(str(A.shape).encode())
+    else:
+        h.update(np.ascontiguousarray(A).tobytes())
+    return h.hexdigest()
+
+
+class Cache(object):
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, kind, key):
+        name = hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()[:20]
+        return os.path.join(self.directory, kind + '-' + name)
+
+    def load(self, kind, key, names=None):
+        """ Returns the arrays (a dict of memmaps) of the entry, only those in
+            names if given, or None if it is not in the cache.
+        """
+        return self.load_entry(self.path(kind, key), names)
+
+    def load_entry(self, path, names=None):
+        try:
+            arrays = {}
+            for filename in os.listdir(path):
+                name, extension = os.path.splitext(filename)
+                if extension == '.npy' and (names is None or name in names):
+                    arrays[name] = np.load(os.path.join(path, filename), mmap_mode='r')
+            os.utime(os.path.join(path, KEY_FILE))
+        except OSError:     # not in the cache, or just evicted
+            return None
+        return arrays
+
+    def store(self, kind, key, arrays):
+        """ Stores the arrays (a dict) as the entry of key, then evicts the
+            least recently used entries if the cache has grown too large.
+        """
+        path = self.path(kind, key)
+        if os.path.exists(path):
+            return
+        temp = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        for name, array in arrays.items():
+            np.save(os.path.join(temp, name + '.npy'), np.asarray(array))
+        with open(os.path.join(temp, KEY_FILE), 'w') as f:
+            json.dump(dict(key, kind=kind, created=time.time()), f)
+        try:
+            os.rename(temp, path)
+        except OSError:     # stored by another rank in the meantime
+            shutil.rmtree(temp, ignore_errors=True)
+        self.evict(keep=path)
+
+    def entries(self, kind):
+        """ Returns the list of (key, path) of all entries of a kind. """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.startswith(kind + '-'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(os.path.join(path, KEY_FILE)) as f:
+                    entries.append((json.load(f), path))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def evict(self, keep=None):
+        """ Removes the least recently used entries (except keep) until the
+            cache is at most max_bytes.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith('.tmp-') or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, filename)) for filename in os.listdir(path))
+                used = os.path.getmtime(os.path.join(path, KEY_FILE))
+            except OSError:
+                continue
+            entries.append((used, path, size))
+            total += size
+        for used, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            # Memmaps of the entry that are still open stay valid.
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+
+def solution_key(dx, omega, temperatures, stencil='five', grading=None, solver='splu', precision='double',
+                 room=None):
+    return {'N': int(round(1/dx)) - 1, 'omega': omega, 'temperatures': [float(t) for t in temperatures],
+            'stencil': stencil, 'grading': list(grading) if grading is not None else None,
+            'solver': solver, 'precision': precision, 'room': room}
+
+
+def store_solution(cache, dx, omega, temperatures, fields, stencil='five', grading=None, solver='splu',
+                   precision='double', room=None):
+    """ Stores the converged fields of the temperatures (wall, heater,
+        window), computed with the solver in precision: those of one room
+        (U1 and gamma1, U2, or U3 and gamma2), so that every rank can store
+        its own, or with room None those of all rooms.
+    """
+    cache.store('solution', solution_key(dx, omega, temperatures, stencil, grading, solver, precision, room), fields)
+
+
+def warm_start(cache, dx, temperatures, names, count=3, stencil='five', grading=None, solver='splu',
+               precision='double', room=None):
+    """ Returns the arrays in names for the temperatures (wall, heater,
+        window), combined from the cached solutions of the same mesh (and
+        grading), stencil, solver and precision with the nearest
+        temperatures (at most count of them), or None if there are none.
+        Solutions of other solvers or precisions are not used, since they
+        are only as accurate as those were. With a room, only the entries of
+        that room (or of all rooms) are used.
+    """
+    grading = list(grading) if grading is not None else None
+    N = int(round(1/dx)) - 1
+    temperatures = np.asarray(temperatures, dtype=float)
+    candidates = [(np.linalg.norm(np.array(key['temperatures']) - temperatures), key, path)
+                  for key, path in cache.entries('solution')
+                  if key['N'] == N and key.get('stencil', 'five') == stencil and key.get('grading') == grading
+                  and key.get('solver') == solver and key.get('precision') == precision
+                  and (room is None or key.get('room') in (None, room))]
+    candidates.sort(key=lambda candidate: candidate[0])
+    solutions = []
+    for distance, key, path in candidates[:count]:
+        arrays = cache.load_entry(path, names)
+        if arrays is not None and all(name in arrays for name in names):
+            solutions.append((np.array(key['temperatures']), arrays))
+    if not solutions:
+        return None
+
+    # The coefficients of the combination of the cached temperatures that is
+    # nearest to the new ones.
+    T = np.column_stack([t for t, arrays in solutions])
+    c = np.linalg.lstsq(T, temperatures, rcond=None)[0]
+    return {name: sum(c[i]*np.asarray(arrays[name]) for i, (t, arrays) in enumerate(solutions)) for name in names}
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+    Checkpoints of the Dirichlet-Neumann iteration, to restart a long run
+    after a rank was killed.
+
+    The state of a room after iteration k-1 is all that iteration k needs:
+
+        room 1 and 3:  u_km1 and the interface values they sent last,
+        room 2:        u_km1 (the interface values come from room 1 and 3).
+
+    Every every-th iteration each rank hands a copy of its state to a
+    background thread, which writes it as an uncompressed .npz file
+    rank<r>-<k>.npz (written to a temporary file and renamed), so the
+    iteration does not wait for the disk. All rooms checkpoint after the same
+    iterations, so no messages are needed to agree on them. The rooms are at
+    most one iteration apart (room 2 needs the interface values of the
+    previous iteration of room 1 and 3, and they need its Neumann data), so
+    keeping the last two checkpoints of every rank always leaves one that
+    all ranks have written: latest() finds it. The state does not depend on
+    the solver backend, so a run can be resumed with another one.
+
+        python main.py -d 1/400 --checkpoint ckpt --checkpoint_every 20
+        python main.py -d 1/400 --checkpoint ckpt --resume --solver cg
+"""
+import glob
+import os
+import queue
+import re
+import threading
+
+import numpy as np
+
+KEEP = 2
+RANKS = (0, 1, 2)
+
+
+def checkpoint_file(directory, rank, iteration):
+    return os.path.join(directory, 'rank' + str(rank) + '-' + str(iteration) + '.npz')
+
+
+def iterations(directory, rank):
+    """ The iterations of the checkpoints of a rank in directory, sorted. """
+    found = []
+    for path in glob.glob(os.path.join(glob.escape(directory), 'rank' + str(rank) + '-*.npz')):
+        match = re.match(r'rank\d+-(\d+)\.npz$', os.path.basename(path))
+        if match:
+            found.append(int(match.group(1)))
+    return sorted(found)
+
+
+def latest(directory, ranks=RANKS):
+    """ The last iteration that all ranks have a checkpoint of, or 0. """
+    common = None
+    for rank in ranks:
+        found = set(iterations(directory, rank))
+        common = found if common is None else common & found
+    return max(common) if common else 0
+
+
+def load(directory, rank, iteration):
+    """ Returns the state (a dict of arrays) of a rank after iteration - 1. """
+    with np.load(checkpoint_file(directory, rank, iteration)) as data:
+        return {name: data[name] for name in data.files}
+
+
+class Checkpointer(object):
+    """ Writes the checkpoints of one rank in a background thread. """
+
+    def __init__(self, directory, rank, every=10):
+        self.directory = directory
+        self.rank = rank
+        self.every = every
+        self.queue = queue.Queue()
+        self.thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def clear(self, after=0):
+        """ Removes the checkpoints of this rank after the given iteration
+            (left over from an earlier run).
+        """
+        for iteration in iterations(self.directory, self.rank):
+            if iteration > after:
+                os.remove(checkpoint_file(self.directory, self.rank, iteration))
+
+    def save(self, iteration, **state):
+        """ Called after every iteration with the state the next one starts
+            from; copies it and queues it for writing every every-th time.
+        """
+        if iteration % self.every != 0:
+            return
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.write_loop, daemon=True)
+            self.thread.start()
+        self.queue.put((iteration, {name: np.array(value) for name, value in state.items()}))
+
+    def write_loop(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            iteration, state = item
+            path = checkpoint_file(self.directory, self.rank, iteration)
+            with open(path + '.tmp', 'wb') as f:
+                np.savez(f, iteration=iteration, **state)
+            os.replace(path + '.tmp', path)
+            for old in iterations(self.directory, self.rank)[:-KEEP]:
+                os.remove(checkpoint_file(self.directory, self.rank, old))
+
+    def close(self):
+        """ Waits until all queued checkpoints are written. """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['queue'] = None
+        state['thread'] = None
+        return state
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+    Buffer-based communication of interface vectors and results between the
+    rooms.
+
+    All messages are NumPy arrays sent with the uppercase (buffer) methods
+    Send/Recv/Isend/Irecv, so nothing is pickled. They are float64, except
+    the interface vectors of rooms in single precision, which are float32
+    (the MPI datatype follows the dtype of the buffer). The end of the
+    Dirichlet-Neumann iteration is signalled with an empty message with tag
+    TAG_DONE instead of an interface vector.
+
+    The communicator is either an mpi4py communicator or one of the
+    in-process communicators of local_comm.py. mpi4py is only imported for
+    the first, since importing it initializes MPI.
+"""
+import numpy as np
+
+import local_comm
+
+
+# Tags of the messages sent between the rooms.
+TAG_GAMMA = 10          # interface values / Neumann data, every iteration
+TAG_DONE = 11           # control message: the iteration has converged
+TAG_RESULT_U = 20       # final temperature field of a room
+TAG_RESULT_GAMMA = 21   # final interface values of a room
+TAG_LAYOUT = 100        # interface k of a layout (see apartment.py) uses TAG_LAYOUT + k
+
+EMPTY = np.empty(0)
+
+
+def namespace(com):
+    """ Returns the MPI namespace (datatypes, Status, Request, ...) that goes
+        with the communicator or request com.
+    """
+    if isinstance(com, (local_comm.LocalComm, local_comm.Request)):
+        return local_comm
+    from mpi4py import MPI
+    return MPI
+
+
+def datatype(MPI, buf):
+    """ The MPI datatype of the float32 or float64 array buf. """
+    return MPI.FLOAT if buf.dtype == np.float32 else MPI.DOUBLE
+
+
+def send_interface(com, gamma, dest, tag=TAG_GAMMA, dtype=np.float64):
+    """ Sends the interface vector gamma (blocking), converted to dtype. """
+    MPI = namespace(com)
+    gamma = np.ascontiguousarray(gamma, dtype=dtype)
+    com.Send([gamma, datatype(MPI, gamma)], dest=dest, tag=tag)
+
+
+def isend_interface(com, gamma, dest, tag=TAG_GAMMA):
+    """ Starts sending the interface vector gamma and returns the request.
+        gamma must not be modified before the request has completed.
+    """
+    MPI = namespace(com)
+    return com.Isend([gamma, datatype(MPI, gamma)], dest=dest, tag=tag)
+
+
+def post_interface(com, gamma, dest, pending, dtype=np.float64):
+    """ Starts sending a copy of the interface vector gamma (converted to
+        dtype) without waiting for rank dest to receive it, and keeps the
+        request and the copy in the list pending, from which the sends that
+        have completed are removed. Two ranks that send to each other at the
+        same time can not block each other this way, even for messages above
+        the eager limit of MPI, where a blocking Send waits for the receive.
+    """
+    pending[:] = [(request, buf) for request, buf in pending if not request.Test()]
+    buf = np.array(gamma, dtype=dtype)
+    pending.append((isend_interface(com, buf, dest), buf))
+
+
+def send_done(com, dest):
+    """ Tells the room on rank dest that the iteration is finished. """
+    MPI = namespace(com)
+    com.Send([EMPTY, MPI.DOUBLE], dest=dest, tag=TAG_DONE)
+
+
+def recv_interface(com, buf, source):
+    """ Receives an interface vector into the preallocated array buf.
+        Returns False if a TAG_DONE message was received instead.
+    """
+    MPI = namespace(com)
+    status = MPI.Status()
+    com.Recv([buf, datatype(MPI, buf)], source=source, tag=MPI.ANY_TAG, status=status)
+    return status.Get_tag() != TAG_DONE
+
+
+def irecv_interface(com, buf, source, tag=TAG_GAMMA):
+    """ Posts a receive of an interface vector into buf and returns the
+        request. buf must not be read before the request has completed.
+    """
+    MPI = namespace(com)
+    return com.Irecv([buf, datatype(MPI, buf)], source=source, tag=tag)
+
+
+def probe(com, source):
+    """ Returns True if a message (interface vector or TAG_DONE) from rank
+        source has arrived, without receiving it.
+    """
+    MPI = namespace(com)
+    return com.Iprobe(source=source, tag=MPI.ANY_TAG)
+
+
+def recv_latest(com, buf, source, block=False):
+    """ Receives all interface vectors from rank source that have arrived
+        into buf, so buf holds the newest one (waits for one if block).
+        Returns (count, done): the number of messages received, and whether
+        the last one was TAG_DONE (then nothing more is received).
+    """
+    count = 0
+    while (block and count == 0) or probe(com, source):
+        count += 1
+        if not recv_interface(com, buf, source):
+            return count, True
+    return count, False
+
+
+def wait_all(requests):
+    """ Waits for all requests that are not None. """
+    requests = [request for request in requests if request is not None]
+    if requests:
+        namespace(requests[0]).Request.Waitall(requests)
+
+
+def send_result(com, U, gamma, dest):
+    """ Sends the final field U and interface vector gamma of a room. """
+    MPI = namespace(com)
+    com.Send([np.ascontiguousarray(U, dtype=np.float64), MPI.DOUBLE], dest=dest, tag=TAG_RESULT_U)
+    com.Send([np.ascontiguousarray(gamma, dtype=np.float64), MPI.DOUBLE], dest=dest, tag=TAG_RESULT_GAMMA)
+
+
+def recv_result(com, source, size, N):
+    """ Receives the final field (size values) and interface vector (N values)
+        sent with send_result(). The tags keep the two messages apart.
+    """
+    MPI = namespace(com)
+    U = np.empty(size)
+    gamma = np.empty(N)
+    com.Recv([U, MPI.DOUBLE], source=source, tag=TAG_RESULT_U)
+    com.Recv([gamma, MPI.DOUBLE], source=source, tag=TAG_RESULT_GAMMA)
+    return U, gamma
+
+
+def send_field(com, U, dest):
+    """ Sends the final field U of one room (see recv_field()). """
+    MPI = namespace(com)
+    com.Send([np.ascontiguousarray(U, dtype=np.float64), MPI.DOUBLE], dest=dest, tag=TAG_RESULT_U)
+
+
+def recv_field(com, size, source):
+    """ Receives a field sent with send_field(). Fields of several rooms
+        from the same rank arrive in the order they were sent.
+    """
+    MPI = namespace(com)
+    U = np.empty(size)
+    com.Recv([U, MPI.DOUBLE], source=source, tag=TAG_RESULT_U)
+    return U
+
+
+def allreduce_sum(com, value):
+    """ Returns the sum of value over all ranks. """
+    MPI = namespace(com)
+    local = np.array([value], dtype=np.float64)
+    total = np.empty(1)
+    com.Allreduce([local, MPI.DOUBLE], [total, MPI.DOUBLE], op=MPI.SUM)
+    return total[0]
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+    The fourth-order compact nine-point discretization of the rooms.
+
+    The nine-point stencil (scaled by 6 dx^2, like the five-point one by dx^2)
+
+        1   4   1
+        4 -20   4
+        1   4   1
+
+    is fourth order for the Laplace equation, against second order for the
+    five-point stencil, so the same accuracy is reached on a much coarser
+    mesh.
+
+    The stencil also reaches the diagonal neighbours, so the boundary of a
+    room is its ring of nodes, corners included. A corner where two
+    temperatures meet gets their mean. The interface between two rooms is
+    treated so that the fixed point of the Dirichlet-Neumann iteration is
+    the nine-point solution on the whole apartment:
+
+        - the nodes on the interface are unknowns of the Neumann room (room 1
+          and 3 have one extra column of unknowns), whose equations there
+          have the part of the stencil on its own side and half of the part
+          on the line of the interface;
+        - the Dirichlet room (room 2) gets the values on the interface nodes
+          from the Neumann room (gamma), and sends back the rest: the
+          stencil of every interface node applied to the nodes on its own
+          side, and half of it to gamma and the ends of the line (flux()).
+
+    Splitting the line in halves makes the two rooms alike, as the stiffness
+    matrix of finite elements is split along an interface. With the whole
+    line in the Neumann room, its equations on the interface hold a term
+    that does not shrink with dx, and the iteration needs about twice as
+    many iterations every time dx is halved.
+
+    CompactBoundary keeps the part of the stencil on the ring of a room as
+    sparse matrices, with the interface of Boundary (boundary.py).
+"""
+import numpy as np
+import scipy.sparse as sp
+
+from assembly import laplacian_1d
+
+STENCILS = ('five', 'nine')
+
+
+def nine_point_operator(M, N, format='csc'):
+    """ The nine-point operator for a grid with M rows and N columns of
+        unknown nodes, numbered row by row, with Dirichlet boundaries (the
+        part of the stencil on the boundary goes to b).
+    """
+    Dx = laplacian_1d(N)
+    Dy = laplacian_1d(M)
+    A = 6*(sp.kron(sp.identity(M), Dx) + sp.kron(Dy, sp.identity(N))) + sp.kron(Dy, Dx)
+    return A.asformat(format)
+
+
+class CompactBoundary(object):
+    """ The ring of boundary nodes around a grid of M x N unknowns (rows -1
+        and M, columns -1 and N) for the nine-point stencil. Nodes of the
+        ring are given by their extended index node(i, j).
+    """
+
+    def __init__(self, M, N):
+        self.M = M
+        self.N = N
+        index = np.arange((M + 2)*(N + 2)).reshape((M + 2, N + 2))
+        self.interior = index[1:-1, 1:-1].ravel()
+        # The stencil of every node of the extended grid, over the extended grid.
+        self.K = nine_point_operator(M + 2, N + 2, format='csr')
+        self.B = self.K[self.interior]      # interior rows, all columns
+        self.fixed = []         # (extended indices, temperature name, weight)
+        self.interfaces = {}    # name -> ('neumann', rows) or ('dirichlet', rows, columns, flux operators)
+        self.b_fixed = None
+        self.flux_fixed = {}
+
+    def node(self, i, j):
+        """ The extended index of node (i, j), -1 <= i <= M, -1 <= j <= N. """
+        return (i + 1)*(self.N + 2) + j + 1
+
+    def side(self, side, start=0, stop=None):
+        """ The ring nodes on side, from node start to node stop (exclusive)
+            along it, as for Boundary.side(). The corners are not included.
+        """
+        M, N = self.M, self.N
+        if side in ('top', 'bottom'):
+            stop = N if stop is None else stop
+            row = -1 if side == 'top' else M
+            return np.array([self.node(row, j) for j in range(start, stop)])
+        stop = M if stop is None else stop
+        column = -1 if side == 'left' else N
+        return np.array([self.node(i, column) for i in range(start, stop)])
+
+    def add_fixed(self, index, temperature, weight=1.0):
+        """ Ring nodes with the fixed temperature of the given name (times
+            weight; a corner gets two halves).
+        """
+        self.fixed.append((np.atleast_1d(index), temperature, weight))
+
+    def add_interface(self, name, side, start=0, stop=None):
+        """ Dirichlet data on the ring nodes of side from start to stop (as
+            for side()), with the operators that put it into b and that
+            compute the Neumann data for the room on the other side.
+        """
+        index = self.side(side, start, stop)
+        columns = self.B[:, index].tocsr()
+        rows = np.unique(columns.nonzero()[0])
+
+        # The stencil of the interface nodes on the nodes of this room, and
+        # half of it on the line of the interface.
+        M, N = self.M, self.N
+        own = np.ones((M + 2, N + 2))
+        if side == 'left':
+            own[:, 0] = 0.5
+        elif side == 'right':
+            own[:, -1] = 0.5
+        elif side == 'top':
+            own[0, :] = 0.5
+        else:
+            own[-1, :] = 0.5
+        F = sp.csr_matrix(self.K[index] @ sp.diags(own.ravel()))
+        self.interfaces[name] = ('dirichlet', rows, columns[rows], F[:, self.interior], F, F[:, index])
+
+    def add_neumann(self, name, side):
+        """ Neumann data for the unknowns on side (the interface nodes of a
+            Neumann room, the first or last row or column), added to their
+            equations, which only keep half of the stencil on the line of
+            the interface (the rest is in the Neumann data).
+        """
+        M, N = self.M, self.N
+        index = np.arange(M*N).reshape((M, N))
+        line = np.zeros((M + 2, N + 2), dtype=bool)
+        if side in ('left', 'right'):
+            column = 0 if side == 'left' else N - 1
+            rows = index[:, column]
+            line[:, column + 1] = True
+        else:
+            row = 0 if side == 'top' else M - 1
+            rows = index[row]
+            line[row + 1, :] = True
+        half = np.ones(self.B.shape[1])
+        half[line.ravel()] = 0.5
+        scale = np.ones(self.B.shape[0])
+        scale[rows] = 0
+        # B keeps the other rows, and the rows of the interface times half.
+        self.B = sp.csr_matrix(sp.diags(scale) @ self.B + sp.diags(1 - scale) @ self.B @ sp.diags(half))
+        self.interfaces[name] = ('neumann', rows)
+
+    def operator(self):
+        """ A: the part of the stencil on the unknowns (with the halved
+            interface equations of a Neumann room).
+        """
+        return self.B[:, self.interior].tocsc()
+
+    def assemble(self, temperatures, batch_shape=()):
+        """ Returns b with the part of the stencil on the fixed ring nodes,
+            and keeps it as b_fixed (and the same part of the Neumann data of
+            the interfaces).
+        """
+        values = np.zeros(((self.M + 2)*(self.N + 2),) + batch_shape)
+        for index, temperature, weight in self.fixed:
+            values[index] += weight*np.asarray(temperatures[temperature])
+        self.b_fixed = -(self.B @ values)
+        self.flux_fixed = {name: interface[4] @ values for name, interface in self.interfaces.items()
+                           if interface[0] == 'dirichlet'}
+        return self.b_fixed.copy()
+
+    def scatter(self, b, name, values):
+        """ Writes the interface data values into b. """
+        interface = self.interfaces[name]
+        rows = interface[1]
+        if interface[0] == 'neumann':
+            b[rows] = self.b_fixed[rows] - values
+        else:
+            b[rows] = self.b_fixed[rows] - interface[2] @ values
+
+    def gather(self, u, name):
+        """ The values of u on the interface nodes of a Neumann room. """
+        return u[self.interfaces[name][1]]
+
+    def flux(self, u, name, gamma, out):
+        """ The Neumann data of a Dirichlet interface into out: the stencil of
+            the interface nodes applied to the nodes of this room, and half of
+            it to the interface values gamma.
+        """
+        interface = self.interfaces[name]
+        np.add(interface[3] @ u, self.flux_fixed[name], out=out)
+        out += interface[5] @ gamma
+        return out
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+    Coarse-to-fine continuation (grid sequencing) of the interface iteration.
+
+    Started from a constant guess, the Dirichlet-Neumann iteration on a fine
+    mesh spends most of its iterations on undoing that guess. Here the rooms
+    first converge on a coarse mesh, then the interface values (gamma1,
+    gamma2) and the fields are interpolated to the next finer mesh, where the
+    iteration starts from them, and so on up to the requested dx. The coarse
+    levels are cheap, and on the finest level only the discretization error
+    of the coarser level is left to correct. That error is O(dx) next to the
+    corners where the wall and heater temperatures meet, so the coarse levels
+    only converge to coarse_tol: the iterations on the finest level are the
+    same for coarse_tol 1e-2 and 1e-4 (62 instead of 90 for dx = 1/80).
+
+    What it saves is only those iterations on the finest level, paid for
+    with the setup (factorization) and iterations of the coarse levels. With
+    splu and relaxation fixed that is about a quarter of the time (median
+    0.40 s to 0.30 s for dx = 1/80 from 1/10 or 1/20, 2.55 s to 1.9 s for
+    dx = 1/160). With relaxation aitken or anderson, which need few
+    iterations anyway (10 for dx = 1/80), it costs more than it saves (37 ms
+    to 60-90 ms). The time printed is, as for main.run_rooms(), without the
+    setup of the finest level, but with that of the coarse ones.
+
+    The levels are the coarse mesh width, halved until dx is reached:
+
+        python main.py -d 1/160 --continuation 1/20 --backend threads
+"""
+import sys
+import time
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+import communication
+import room
+
+
+def levels(dx, coarse_dx):
+    """ Returns the mesh widths from coarse_dx to dx, halving every level. """
+    widths = [dx]
+    while widths[0]*2 <= coarse_dx*(1 + 1e-12):
+        widths.insert(0, widths[0]*2)
+    if widths[0] < coarse_dx*(1 - 1e-12):
+        widths.insert(0, coarse_dx)
+    return widths
+
+
+def nodes(n, dx):
+    """ The positions of n inner nodes with mesh width dx. """
+    return dx*(np.arange(n) + 1)
+
+
+def interpolate_interface(gamma, dx, fine_dx):
+    """ Interpolates the interface values gamma (on a side of length 1) to the
+        mesh width fine_dx. Beyond the outermost nodes the values are kept
+        constant.
+    """
+    N = int(round(1/fine_dx)) - 1
+    return np.interp(nodes(N, fine_dx), nodes(len(gamma), dx), gamma)
+
+
+def interpolate_field(u, shape, dx, fine_shape, fine_dx):
+    """ Interpolates the field u of a room (shape nodes, row by row) bilinearly
+        to fine_shape nodes with mesh width fine_dx.
+    """
+    f = RegularGridInterpolator((nodes(shape[0], dx), nodes(shape[1], dx)), u.reshape(shape),
+                                bounds_error=False, fill_value=None)
+    Y, X = np.meshgrid(nodes(fine_shape[0], fine_dx), nodes(fine_shape[1], fine_dx), indexing='ij')
+    return f((Y, X)).ravel()
+
+
+def run_continuation(com, kwargs, coarse_dx, coarse_tol=1e-2):
+    """ One rank of a solve with coarse-to-fine continuation. Like
+        main.run_rooms(), room 2 returns its room object (of the finest level)
+        and the fields and interface values of all rooms, the other ranks
+        None.
+    """
+    room_nr = com.Get_rank() + 1
+    kwargs = dict(kwargs)   # the thread backends share kwargs between the ranks
+    dx = kwargs.pop('dx')
+    widths = levels(dx, coarse_dx)
+    tol = kwargs.pop('tol', 1e-6)
+    if kwargs.get('grading') is not None:
+        raise ValueError('The continuation only works with uniform meshes.')
+
+    previous = None
+    time1 = time.time()*1000
+    for level, width in enumerate(widths):
+        level_tol = tol if level == len(widths) - 1 else max(tol, coarse_tol)
+        setup_time = time.time()*1000
+        room_object = room.Room(com=com, room=room_nr, dx=width, tol=level_tol, verbose=False, **kwargs)
+        setup_time = time.time()*1000 - setup_time
+        if previous is not None:
+            # The field of room 1 and 3 is returned without the interface
+            # nodes of the nine-point stencil.
+            shape = previous.shape if room_nr == 2 else (previous.N, previous.N)
+            room_object.u_km1 = interpolate_field(previous.u, shape, previous.dx, room_object.shape, width)
+            if room_nr != 2:
+                room_object.gamma0 = interpolate_interface(previous.gamma, previous.dx, width)
+        level_time = time.time()*1000
+        U, gamma = room_object.solve()
+        room_object.u, room_object.gamma = U, gamma
+        if room_nr == 2:
+            print('dx = 1/' + str(int(round(1/width))) + ': ' + str(room_object.max_iters) + ' iterations, '
+                  + str(int(time.time()*1000 - level_time)) + ' [ms]')
+            sys.stdout.flush()
+        previous = room_object
+    time2 = time.time()*1000
+
+    if room_nr != 2:
+        communication.send_result(com, U, gamma, dest=1)
+        return None
+    print('Time taken = ' + str(int(time2-time1-setup_time))+' [ms]')
+    sys.stdout.flush()
+    N = room_object.N
+    U1, gamma1 = communication.recv_result(com, source=0, size=N*N, N=N)
+    U3, gamma2 = communication.recv_result(com, source=2, size=N*N, N=N)
+    return room_object, dict(U1=U1, U2=U, U3=U3, gamma1=gamma1, gamma2=gamma2)
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+    Convergence study of the five-point and the nine-point stencil.
+
+    Every stencil is solved for every mesh width, and the map of the
+    apartment (see output.py) is compared with that of a fine nine-point
+    solve, on the nodes of the coarse mesh. The table has the number of
+    unknowns, iterations and wall time of every solve, the rms and maximum
+    error over the rooms, the error of the mean temperature, and the
+    observed order of the rms error between two mesh widths. With a
+    grading, the five-point stencil on graded meshes (see graded.py) is
+    studied as well ('graded'), interpolated to the uniform nodes of the map.
+    With a target, it also shows the coarsest mesh of every stencil with an
+    rms error below it, and what that costs.
+
+        python convergence.py --dx 1/10 1/20 1/40 1/80 --reference 1/320 --target 1e-2
+        python convergence.py --dx 1/10 1/20 1/40 --reference 1/160 --grading 0.8 --target 1e-2
+
+    The solution is not smooth where two temperatures meet at a corner, so
+    the maximum error stays there (about the jump of the temperature times a
+    constant) for both stencils, and the rms error converges more slowly
+    than the order of the stencil.
+"""
+import argparse
+import time
+
+import numpy as np
+
+import compact
+import local_comm
+import main
+import output
+
+
+def solve(dx, stencil, backend='threads', tol=1e-9, **kwargs):
+    """ Solves the three rooms with the stencil, without MPI. Returns the
+        map of the apartment, the number of iterations and the wall time.
+        Other keyword arguments (as grading) go to Room.
+    """
+    kwargs = dict(kwargs, dx=dx, stencil=stencil, tol=tol, verbose=False)
+    start = time.time()
+    results = local_comm.run(main.run_rooms, 3, backend, (kwargs,))
+    seconds = time.time() - start
+    room_object, fields = results[1]
+    Map = output.apartment_map(room_object.N, {1: (fields['U1'], fields['gamma1']), 2: (fields['U2'], None),
+                                               3: (fields['U3'], fields['gamma2'])},
+                               room_object.wall_temp, room_object.heater_temp, room_object.window_temp,
+                               room_object.grids)
+    return Map, room_object.max_iters, seconds
+
+
+def unknowns(n, stencil):
+    """ The number of unknowns of all rooms for mesh width 1/n ('graded' has
+        as many as 'five'): room 1 and 3 have one more column (the interface)
+        for the nine-point stencil.
+    """
+    N = n - 1
+    return 2*N*(N + (stencil == 'nine')) + (2*N + 1)*N
+
+
+def errors(Map, reference):
+    """ The rms and maximum error of Map over the rooms, and the error of the
+        mean temperature, against the finer reference map (sampled at the
+        nodes of Map).
+    """
+    step = (reference.shape[0] - 1)//(Map.shape[0] - 1)
+    if (Map.shape[0] - 1)*step != reference.shape[0] - 1:
+        raise ValueError('The mesh width of the reference must divide the mesh widths.')
+    sample = reference[::step, ::step]
+    difference = (Map - sample)[~np.isnan(sample)]
+    return (np.sqrt(np.mean(difference**2)), np.max(np.abs(difference)),
+            abs(np.nanmean(Map) - np.nanmean(sample)))
+
+
+def study(widths, reference_width, stencils=compact.STENCILS, grading=None, **kwargs):
+    """ Returns one row (stencil, n, unknowns, iterations, seconds, rms, max,
+        mean, order) per stencil and mesh width 1/n (widths are the n), and
+        with a grading also for the graded five-point stencil.
+    """
+    reference = solve(1/reference_width, 'nine', **kwargs)[0]
+    schemes = [(stencil, {}) for stencil in stencils]
+    if grading is not None:
+        schemes.append(('graded', {'grading': grading}))
+    rows = []
+    for stencil, options in schemes:
+        previous = None
+        for n in widths:
+            Map, iterations, seconds = solve(1/n, 'five' if stencil == 'graded' else stencil,
+                                             **dict(kwargs, **options))
+            rms, maximum, mean = errors(Map, reference)
+            order = np.log(previous[1]/rms)/np.log(n/previous[0]) if previous else np.nan
+            rows.append((stencil, n, unknowns(n, stencil), iterations, seconds, rms, maximum, mean, order))
+            previous = (n, rms)
+    return rows
+
+
+def print_table(rows, target=None):
+    print('%-8s %6s %9s %6s %9s %10s %10s %10s %6s' % ('stencil', 'dx', 'unknowns', 'iters', 'time [s]',
+                                                      'rms', 'max', 'mean', 'order'))
+    for stencil, n, size, iterations, seconds, rms, maximum, mean, order in rows:
+        print('%-8s %6s %9d %6d %9.3f %10.2e %10.2e %10.2e %6.2f' % (stencil, '1/' + str(n), size, iterations,
+                                                                  seconds, rms, maximum, mean, order))
+    if target is None:
+        return
+    print('')
+    print('Coarsest mesh with an rms error below %.1e:' % target)
+    for stencil in dict.fromkeys(row[0] for row in rows):
+        found = [row for row in rows if row[0] == stencil and row[5] <= target]
+        if found:
+            row = min(found, key=lambda row: row[2])
+            print('    %-8s dx = 1/%d, %d unknowns, %.3f s' % (stencil, row[1], row[2], row[4]))
+        else:
+            print('    %-8s none of the mesh widths' % stencil)
+
+
+def parse_width(text):
+    """ The n of a mesh width given as 1/n. """
+    frac = text.split('/')
+    assert(len(frac)==2), 'dx needs to be of the format "1/x"'
+    return int(round(int(frac[1])/int(frac[0])))
+
+
+if __name__=='__main__':
+    argparser = argparse.ArgumentParser(description='Convergence study of the five-point and nine-point stencil')
+    argparser.add_argument('--dx', nargs='+', default=['1/10', '1/20', '1/40', '1/80'], help='Mesh widths 1/x')
+    argparser.add_argument('--reference', default='1/320', help='Mesh width of the nine-point reference solve')
+    argparser.add_argument('--stencils', nargs='+', default=list(compact.STENCILS), choices=compact.STENCILS)
+    argparser.add_argument('--grading', nargs='+', type=float,
+                           help='Also study graded meshes, of one strength or one per room (see graded.py)')
+    argparser.add_argument('--target', type=float, help='Show the cheapest mesh with an rms error below this')
+    argparser.add_argument('--backend', default='threads', choices=local_comm.BACKENDS)
+    argparser.add_argument('--tol', type=float, default=1e-9, help='Tolerance of the iteration')
+    args = argparser.parse_args()
+    rows = study([parse_width(text) for text in args.dx], parse_width(args.reference), args.stencils,
+                 args.grading, backend=args.backend, tol=args.tol)
+    print_table(rows, args.target)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+    Fast Poisson solver for the five-point operator on a rectangle, by fast
+    diagonalization with sine and cosine transforms (scipy.fft).
+
+    The operator is A = I (x) Tx + Ty (x) I, where Tx and Ty are the 1D second
+    differences of assembly.laplacian_1d(). Each of them is diagonalized by a
+    fast transform that depends on the boundary conditions at its two ends:
+
+        Dirichlet - Dirichlet:  DST-I
+        Dirichlet - Neumann:    odd frequencies of a DST-I of twice the length
+        Neumann   - Dirichlet:  as above, on the flipped axis
+        Neumann   - Neumann:    DCT-II
+
+    so that a solve costs O(n log n) and no matrix is stored.
+"""
+import numpy as np
+import scipy.fft
+
+
+def _along(axis, ndim, index):
+    """ Returns an index tuple that applies index along axis only. """
+    full = [slice(None)]*ndim
+    full[axis] = index
+    return tuple(full)
+
+
+class Transform1D(object):
+    """ The fast transform diagonalizing laplacian_1d(n, neumann_start,
+        neumann_end), together with its eigenvalues.
+    """
+    def __init__(self, n, neumann_start=False, neumann_end=False):
+        self.n = n
+        self.flip = neumann_start and not neumann_end
+        if not neumann_start and not neumann_end:
+            self.kind = 'DD'
+            k = np.arange(1, n + 1)
+            self.eigenvalues = -4*np.sin(np.pi*k/(2*(n + 1)))**2
+        elif neumann_start and neumann_end:
+            self.kind = 'NN'
+            k = np.arange(n)
+            self.eigenvalues = -4*np.sin(np.pi*k/(2*n))**2
+        else:
+            self.kind = 'DN'
+            k = np.arange(n)
+            self.eigenvalues = -4*np.sin(np.pi*(2*k + 1)/(2*(2*n + 1)))**2
+
+    def forward(self, x, axis):
+        if self.flip:
+            x = np.flip(x, axis=axis)
+        if self.kind == 'DD':
+            return scipy.fft.dst(x, type=1, norm='ortho', axis=axis)
+        if self.kind == 'NN':
+            return scipy.fft.dct(x, type=2, norm='ortho', axis=axis)
+        # DN: X_k = sum_j x_j sin(pi (2k+1)(j+1) / (2n+1)), which are the even
+        # outputs of a DST-I of length 2n of x padded with zeros.
+        y = scipy.fft.dst(x, type=1, n=2*self.n, axis=axis)
+        return y[_along(axis, y.ndim, slice(0, 2*self.n, 2))]/2
+
+    def inverse(self, X, axis):
+        if self.kind == 'DD':
+            x = scipy.fft.dst(X, type=1, norm='ortho', axis=axis)
+        elif self.kind == 'NN':
+            x = scipy.fft.idct(X, type=2, norm='ortho', axis=axis)
+        else:
+            # The basis vectors of the DN transform have squared norm (2n+1)/4.
+            shape = list(X.shape)
+            shape[axis] = 2*self.n
+            z = np.zeros(shape)
+            z[_along(axis, X.ndim, slice(0, 2*self.n, 2))] = X
+            y = scipy.fft.dst(z, type=1, axis=axis)
+            x = y[_along(axis, y.ndim, slice(0, self.n))]*(2/(2*self.n + 1))
+        if self.flip:
+            x = np.flip(x, axis=axis)
+        return x
+
+
+class FastPoissonSolver(object):
+    """ Solves A u = b for the five-point operator on an M x N grid (numbered
+        row by row as in assembly.five_point_operator) in O(n log n).
+        b may also hold several right-hand sides as columns. With
+        coefficients = (cy, cx) the operator is cy Ty + cx Tx instead, which
+        is used for the anisotropic coarse grids of the multigrid solver.
+        With shift, the operator is A - shift*I.
+    """
+    matrix_free = True
+
+    def __init__(self, A, shape, neumann=(), coefficients=(1, 1), shift=0, **options):
+        M, N = shape
+        cy, cx = coefficients
+        self.shape = shape
+        self.tx = Transform1D(N, 'left' in neumann, 'right' in neumann)
+        self.ty = Transform1D(M, 'top' in neumann, 'bottom' in neumann)
+        self.eigenvalues = cy*self.ty.eigenvalues[:, None] + cx*self.tx.eigenvalues[None, :] - shift
+        if np.any(self.eigenvalues == 0):
+            raise ValueError('A room with only Neumann boundaries has a singular matrix.')
+
+    def solve(self, b, x0=None):
+        M, N = self.shape
+        B = b.reshape((M, N) + b.shape[1:])
+        eigenvalues = self.eigenvalues.reshape((M, N) + (1,)*(b.ndim - 1))
+        B_hat = self.ty.forward(self.tx.forward(B, axis=1), axis=0)
+        U = self.ty.inverse(self.tx.inverse(B_hat/eigenvalues, axis=1), axis=0)
+        return U.reshape(b.shape)
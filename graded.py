@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+    Graded tensor-product meshes of the rooms.
+
+    The rooms keep their numbers of nodes (N x N for room 1 and 3, M x N for
+    room 2), but the nodes are moved towards the heaters, windows, walls and
+    interfaces, where the temperature changes fastest, and away from the
+    middle of the rooms. Along every side of length L the n inner nodes are
+
+        x_k = L*(t - a*sin(2*pi*w*t)/(2*pi*w)),   t = k/(n + 1),
+
+    which is uniform for a = 0. The spacing is (1 - a) times the uniform one
+    next to the sides (and, for w = 2, in the middle: the ends of the
+    interfaces of room 2) and (1 + a) times it in between. Every room has its
+    own strength a for its rows, so the nodes of room 2 on an interface do
+    not have to match those of room 1 or 3. The columns of all rooms have
+    the strength of room 2: room 1 and 3 extrapolate their interface values
+    over the spacing next to the interface with the flux of room 2, which
+    only converges if room 2 has the same spacing there (with a larger
+    spacing in room 1 the errors grow by their ratio in every iteration).
+
+    The operator is the five-point stencil in finite-volume form: every node
+    has a cell from halfway to its neighbours, and the flux through a side
+    of the cell is the difference to the neighbour over their distance,
+    times the length of the side. For a uniform mesh that is the five-point
+    stencil of Room. On a Neumann side the flux through the interface is the
+    data (the integrated flux) that room 2 sends.
+
+    Room 2 interpolates the interface values of room 1 and 3 linearly to its
+    own nodes (P, interpolation()). Its integrated fluxes go back by the
+    overlap of its cells with those of room 1 or 3 (R, overlap()): every
+    flux is split between the cells it overlaps, in proportion to the
+    overlap, so the total flux through the interface is the same on both
+    sides (the transfer is conservative) and a constant flux density stays
+    constant. On matching nodes P and R are the identity.
+
+    The cells of the nodes at the ends of an interface only reach halfway to
+    the corner, and not as far on both sides if the nodes do not match. The
+    flux of the part of a cell of room 2 beyond the cells of room 1 or 3 is
+    left out: moving it into their last cell would make its flux larger than
+    a cell of that size can take, and the iteration diverges.
+
+        python main.py -d 1/20 --grading 0.8 --backend threads
+        python main.py -d 1/20 --grading 0.8 0.5 0.8 --backend threads
+"""
+import numpy as np
+import scipy.sparse as sp
+
+import boundary
+
+# The clusters of nodes along the x and y sides of every room (w above):
+# at both ends, and for the height of room 2 also at the ends of the
+# interfaces in the middle.
+WAVES = {1: (1, 1), 2: (1, 2), 3: (1, 1)}
+
+
+def nodes(length, n, strength, waves=1):
+    """ The coordinates of n inner nodes on a side of the given length. """
+    t = np.arange(1, n + 1)/(n + 1)
+    return length*(t - strength*np.sin(2*np.pi*waves*t)/(2*np.pi*waves))
+
+
+def strengths(grading):
+    """ The strengths (a1, a2, a3) of the rooms from grading: None (uniform
+        meshes), one strength for all rooms or one per room.
+    """
+    if grading is None:
+        return None
+    grading = tuple(float(a) for a in np.atleast_1d(grading))
+    if len(grading) == 1:
+        grading = grading*3
+    if len(grading) != 3:
+        raise ValueError('The grading should be one strength, or one per room.')
+    for a in grading:
+        if not 0 <= a < 1:
+            raise ValueError('The strength of the grading should be in [0, 1).')
+    return grading
+
+
+def scale(weight, values):
+    """ weight (one per node) times values (one row per node, with the
+        columns of the batch mode).
+    """
+    return weight.reshape(weight.shape + (1,)*(np.ndim(values) - 1))*values
+
+
+class Grid(object):
+    """ The inner nodes x (columns, from the left) and y (rows, from the
+        top) of a room of the given width and height.
+    """
+
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.hx = np.diff(np.concatenate(([0], x, [width])))
+        self.hy = np.diff(np.concatenate(([0], y, [height])))
+        # The sides of the cells of the nodes.
+        self.wx = (self.hx[:-1] + self.hx[1:])/2
+        self.wy = (self.hy[:-1] + self.hy[1:])/2
+
+    def operator(self, neumann=()):
+        """ The finite-volume five-point operator, with no flux through the
+            sides in neumann (their flux is in b).
+        """
+        Tx = second_difference(self.hx, 'left' in neumann, 'right' in neumann)
+        Ty = second_difference(self.hy, 'top' in neumann, 'bottom' in neumann)
+        A = sp.kron(sp.diags(self.wy), Tx) + sp.kron(Ty, sp.diags(self.wx))
+        return A.tocsc()
+
+    def weights(self, side):
+        """ The coefficients of the nodes on side in the equations of the
+            nodes next to it (in the order of Boundary.side()).
+        """
+        if side == 'left':
+            return self.wy/self.hx[0]
+        if side == 'right':
+            return self.wy/self.hx[-1]
+        if side == 'top':
+            return self.wx/self.hy[0]
+        return self.wx/self.hy[-1]
+
+
+def second_difference(h, neumann_start=False, neumann_end=False):
+    """ The 1D second difference with the spacings h (one more than nodes):
+        1/h to the neighbours, the negative sum on the diagonal, without the
+        end of a Neumann side.
+    """
+    inverse = 1/h
+    main = -(inverse[:-1] + inverse[1:])
+    if neumann_start:
+        main[0] += inverse[0]
+    if neumann_end:
+        main[-1] += inverse[-1]
+    off = inverse[1:-1]
+    return sp.diags([off, main, off], [-1, 0, 1], format='csr')
+
+
+def room_grids(N, grading):
+    """ The grids of all rooms (room 1 and 3 in their own coordinates, with
+        the interface on the right) for the strengths grading = (a1, a2, a3)
+        of their rows; the columns all have the strength a2.
+    """
+    M = 2*N + 1
+    grids = {}
+    for room_nr, a in zip((1, 2, 3), grading):
+        height = 2 if room_nr == 2 else 1
+        wx, wy = WAVES[room_nr]
+        grids[room_nr] = Grid(nodes(1, N, grading[1], wx), nodes(height, M if room_nr == 2 else N, a, wy), 1, height)
+    return grids
+
+
+def cells(nodes, start, stop):
+    """ The edges of the cells of nodes (increasing), between the nodes
+        start and stop outside them: halfway to the neighbours.
+    """
+    points = np.concatenate(([start], nodes, [stop]))
+    return (points[:-1] + points[1:])/2
+
+
+def interpolation(source, target):
+    """ Linear interpolation from the nodes source to the nodes target (both
+        increasing), constant beyond the first and last node: a sparse matrix
+        whose rows sum to one.
+    """
+    k = np.clip(np.searchsorted(source, target) - 1, 0, len(source) - 2)
+    t = np.clip((target - source[k])/(source[k + 1] - source[k]), 0, 1)
+    rows = np.arange(len(target))
+    P = sp.csr_matrix((np.concatenate((1 - t, t)), (np.concatenate((rows, rows)), np.concatenate((k, k + 1)))),
+                      shape=(len(target), len(source)))
+    P.eliminate_zeros()
+    return P
+
+
+def overlap(source, target):
+    """ The conservative transfer of integrated values from the cells with
+        edges source to those with edges target: R[i, j] is the part of cell
+        j that overlaps cell i.
+    """
+    lower = np.maximum.outer(target[:-1], source[:-1])
+    upper = np.minimum.outer(target[1:], source[1:])
+    return sp.csr_matrix(np.maximum(upper - lower, 0)/np.diff(source))
+
+
+class GradedBoundary(boundary.Boundary):
+    """ A Boundary whose segments have a weight per node (the coefficients of
+        Grid.weights()), and whose Dirichlet interfaces interpolate their
+        values from the nodes of the room on the other side.
+    """
+
+    def __init__(self, M, N):
+        boundary.Boundary.__init__(self, M, N)
+        self.weights = {}       # name -> weights of the interface
+        self.transfers = {}     # name -> (P, R) of the interface
+
+    def add_fixed(self, index, temperature, weight=1.0):
+        self.fixed.append((index, temperature, weight))
+
+    def add_interface(self, name, index, weight=1.0, transfer=None):
+        """ An interface with the weights of its nodes. A Dirichlet interface
+            has the transfers (P, R) from and to the nodes of the other room;
+            a Neumann interface has weight 1 (the data is the integrated
+            flux).
+        """
+        self.interfaces[name] = index
+        self.weights[name] = np.broadcast_to(np.asarray(weight, dtype=float), (len(self.indices(name)),))
+        self.transfers[name] = transfer
+
+    def assemble(self, temperatures, batch_shape=()):
+        b = np.zeros((self.M*self.N,) + batch_shape)
+        for index, temperature, weight in self.fixed:
+            weight = np.broadcast_to(np.asarray(weight, dtype=float), (len(b[index]),))
+            b[index] -= weight.reshape(weight.shape + (1,)*len(batch_shape))*temperatures[temperature]
+        self.b_fixed = b
+        return b.copy()
+
+    def scatter(self, b, name, values):
+        if self.transfers[name] is not None:
+            values = self.transfers[name][0] @ values
+        index = self.interfaces[name]
+        b[index] = self.b_fixed[index] - scale(self.weights[name], values)
+
+    def flux(self, u, name, gamma, out):
+        """ The Neumann data of a Dirichlet interface into out: the integrated
+            fluxes of its nodes (from the nodes next to it to the interface
+            values gamma, interpolated to them), transferred back with R.
+        """
+        P, R = self.transfers[name]
+        flux = scale(self.weights[name], self.gather(u, name) - P @ gamma)
+        out[...] = R @ flux
+        return out
@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+    Preconditioned conjugate gradients for the rooms.
+
+    A is symmetric negative definite for all rooms (the Neumann rows with -3
+    on the diagonal keep it symmetric), so CG is used on -A x = -b. Every
+    solve starts from the initial guess x0, and is inexact: the error of the
+    solution only has to be below eta times the change between the last two
+    solutions, i.e. the current update of the Dirichlet-Neumann iteration.
+    Early outer iterations therefore get cheap solves, and the inner
+    tolerance tightens as the outer update gets smaller, down to tol/10.
+"""
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.linalg import LinearOperator, cg, splu
+
+from fast_poisson import FastPoissonSolver
+from multigrid import MultigridSolver
+
+
+def incomplete_cholesky(A, shape):
+    """ Returns the diagonal d of the IC(0) factorization (D + L) D^-1 (D + L^T)
+        of the five-point matrix A (positive definite, numbered row by row
+        on a grid with the given shape). For the five-point stencil, the
+        off-diagonal part of the factor is the strictly lower part L of A.
+        d[r, c] depends on d[r, c-1] and d[r-1, c] only, so the recurrence is
+        vectorized over the anti-diagonals r + c = s of the grid.
+    """
+    M, N = shape
+    a = A.diagonal().reshape(shape)
+    west = np.zeros(shape)
+    north = np.zeros(shape)
+    west.ravel()[1:] = A.diagonal(-1)
+    north.ravel()[N:] = A.diagonal(-N)
+    d = np.zeros(shape)
+    for s in range(M + N - 1):
+        r = np.arange(max(0, s - N + 1), min(M, s + 1))
+        c = s - r
+        d[r, c] = a[r, c]
+        has_west = c > 0
+        d[r[has_west], c[has_west]] -= west[r[has_west], c[has_west]]**2/d[r[has_west], c[has_west] - 1]
+        has_north = r > 0
+        d[r[has_north], c[has_north]] -= north[r[has_north], c[has_north]]**2/d[r[has_north] - 1, c[has_north]]
+    return d.ravel()
+
+
+class IncompleteCholesky(object):
+    """ IC(0) preconditioner for the positive definite matrix -A. """
+    def __init__(self, A, shape, neumann):
+        B = sp.csc_matrix(-A)
+        self.d = incomplete_cholesky(B, shape)
+        K = sp.tril(B, k=-1) + sp.diags(self.d)
+        # splu of a triangular matrix in natural order does no work except
+        # storing it, and its triangular solves are much faster than
+        # spsolve_triangular.
+        self.K = splu(sp.csc_matrix(K), permc_spec='NATURAL', diag_pivot_thresh=0)
+
+    def apply(self, r):
+        return self.K.solve(self.d*self.K.solve(r), trans='T')
+
+
+class JacobiPreconditioner(object):
+    def __init__(self, A, shape, neumann):
+        self.d_inv = -1/A.diagonal()
+
+    def apply(self, r):
+        return self.d_inv*r
+
+
+class FastPoissonPreconditioner(object):
+    """ The fast Poisson solver; exact for the rooms, so CG needs one step. """
+    def __init__(self, A, shape, neumann):
+        self.solver = FastPoissonSolver(None, shape, neumann)
+
+    def apply(self, r):
+        return -self.solver.solve(r)
+
+
+class MultigridPreconditioner(object):
+    """ One multigrid V-cycle from zero. The post-smoother sweeps the colours
+        in reverse order, which makes the V-cycle symmetric.
+    """
+    def __init__(self, A, shape, neumann):
+        self.solver = MultigridSolver(None, shape, neumann)
+        self.shape = shape
+
+    def apply(self, r):
+        R = -r.reshape(self.shape)
+        return self.solver.cycle(0, np.zeros(self.shape), R, 'V').ravel()
+
+
+PRECONDITIONERS = {
+    'ichol': IncompleteCholesky,
+    'jacobi': JacobiPreconditioner,
+    'fft': FastPoissonPreconditioner,
+    'multigrid': MultigridPreconditioner,
+}
+
+
+class KrylovSolver(object):
+    """ Warm-started, inexact preconditioned CG on -A x = -b. """
+    matrix_free = False
+
+    def __init__(self, A, shape, neumann=(), tol=1e-6, preconditioner='multigrid', eta=0.1, max_inner_iters=1000, **options):
+        if preconditioner is not None and preconditioner not in PRECONDITIONERS:
+            raise ValueError('Unknown preconditioner: ' + str(preconditioner) + '. Choose from ' + ', '.join(sorted(PRECONDITIONERS)))
+        self.A = sp.csr_matrix(A)
+        self.minus_A = -self.A
+        self.eta = eta
+        self.max_inner_iters = max_inner_iters
+        self.iterations = 0 # total number of CG iterations, for benchmarks
+        self.unconverged = 0 # number of solves that stopped at max_inner_iters
+        self.tol = tol
+        self.update = None  # change between the last two solutions
+        self.x_last = None
+
+        # Lower bound of the smallest eigenvalue of -A, for the five-point
+        # operator on a grid with at most n nodes per direction. Since
+        # ||x - x*|| <= ||r||/lambda_min, a residual below e*lambda_min
+        # guarantees an error below e.
+        self.lambda_min = (np.pi/(max(shape) + 1))**2
+
+        self.M = None
+        if preconditioner is not None:
+            P = PRECONDITIONERS[preconditioner](A, shape, neumann)
+            self.M = LinearOperator(self.A.shape, matvec=P.apply, dtype=float)
+
+    def count(self, x):
+        self.iterations += 1
+
+    def solve(self, b, x0=None):
+        if x0 is None:
+            x0 = np.zeros_like(b)
+        if self.update is None:
+            # First solve: nothing to compare with, reduce the residual by eta.
+            atol = self.eta*np.linalg.norm(b - self.A @ x0)
+        else:
+            atol = max(self.eta*self.update, self.tol/10)*self.lambda_min
+        x, info = cg(self.minus_A, -b, x0=x0, rtol=0, atol=atol, maxiter=self.max_inner_iters,
+                     M=self.M, callback=self.count)
+        if info < 0:
+            raise RuntimeError('CG broke down (info = ' + str(info) + ').')
+        if info > 0:
+            # The Dirichlet-Neumann iteration goes on with the inexact
+            # solution, but should not look converged because of it.
+            self.unconverged += 1
+            warnings.warn('CG did not reach the tolerance ' + str(atol) + ' in ' + str(self.max_inner_iters)
+                          + ' iterations.', RuntimeWarning)
+        if self.x_last is not None:
+            self.update = np.linalg.norm(x - self.x_last)
+        self.x_last = x
+        return x
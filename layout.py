@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+    Apartment layouts.
+
+    A layout is a JSON file with rectangular rooms, the heaters and windows on
+    their walls, and the interfaces between them, e.g.
+
+        {
+          "temperatures": {"wall": 15, "heater": 40, "window": 5},
+          "rooms": [
+            {"name": "room1", "x": 0, "y": 0, "width": 1, "height": 1,
+             "boundaries": [{"side": "left", "type": "heater"}]},
+            ...
+          ],
+          "interfaces": [
+            {"dirichlet": "room2", "neumann": "room1"},
+            ...
+          ]
+        }
+
+    Coordinates are in metres with y pointing up, (x, y) is the lower left
+    corner of a room. A boundary covers the whole side unless it has "start"
+    and "end" (coordinates along the side); everything that is not a heater,
+    window or interface is wall. An interface is the segment shared by two
+    rooms. One of them gets the Dirichlet data, the other the Neumann data,
+    as room 2 and rooms 1/3 in the original apartment, so every room has to
+    be either a Dirichlet room or a Neumann room.
+
+    schedule() maps the rooms onto MPI ranks.
+"""
+import json
+
+import numpy as np
+
+from assembly import SIDES
+
+
+DEFAULT_TEMPERATURES = {'wall': 15, 'heater': 40, 'window': 5}
+
+
+class RoomSpec(object):
+    """ One rectangular room of a layout. """
+    def __init__(self, index, name, x, y, width, height, boundaries=()):
+        self.index = index
+        self.name = name
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.boundaries = list(boundaries)
+        self.role = None # 'dirichlet' or 'neumann', set by Layout
+
+    def side_segment(self, side):
+        """ Returns (fixed coordinate, start, end) of a side: the x of the
+            left/right side or the y of the top/bottom side, and the extent
+            along it.
+        """
+        if side == 'left':
+            return self.x, self.y, self.y + self.height
+        if side == 'right':
+            return self.x + self.width, self.y, self.y + self.height
+        if side == 'top':
+            return self.y + self.height, self.x, self.x + self.width
+        return self.y, self.x, self.x + self.width
+
+    def unknowns(self, dx):
+        return (int(round(self.height/dx)) - 1)*(int(round(self.width/dx)) - 1)
+
+
+class InterfaceSpec(object):
+    """ The segment [start, end] shared by the dirichlet and the neumann room,
+        on the side dirichlet_side of the first and neumann_side of the second.
+    """
+    def __init__(self, index, dirichlet, neumann, dirichlet_side, neumann_side, start, end):
+        self.index = index
+        self.dirichlet = dirichlet
+        self.neumann = neumann
+        self.dirichlet_side = dirichlet_side
+        self.neumann_side = neumann_side
+        self.start = start
+        self.end = end
+
+    def nodes(self, dx):
+        """ Number of grid nodes strictly inside the shared segment. """
+        return int(round((self.end - self.start)/dx)) - 1
+
+
+OPPOSITE = {'left': 'right', 'right': 'left', 'top': 'bottom', 'bottom': 'top'}
+
+
+def shared_segment(a, b):
+    """ Returns (side of a, side of b, start, end) of the segment shared by
+        the rooms a and b, or None if they do not share a segment of positive
+        length.
+    """
+    for side in SIDES:
+        fixed_a, start_a, end_a = a.side_segment(side)
+        fixed_b, start_b, end_b = b.side_segment(OPPOSITE[side])
+        start, end = max(start_a, start_b), min(end_a, end_b)
+        if np.isclose(fixed_a, fixed_b) and end - start > 1e-12:
+            return side, OPPOSITE[side], start, end
+    return None
+
+
+class Layout(object):
+    """ A parsed and checked layout. """
+    def __init__(self, description):
+        self.temperatures = dict(DEFAULT_TEMPERATURES)
+        self.temperatures.update(description.get('temperatures', {}))
+        self.rooms = []
+        for i, room in enumerate(description['rooms']):
+            for boundary in room.get('boundaries', ()):
+                if boundary.get('side') not in SIDES:
+                    raise ValueError('Unknown side in room ' + str(room['name']) + ': ' + str(boundary.get('side')))
+                if boundary.get('type') not in self.temperatures:
+                    raise ValueError('Unknown boundary type in room ' + str(room['name']) + ': ' + str(boundary.get('type')))
+            self.rooms.append(RoomSpec(i, room['name'], room['x'], room['y'], room['width'], room['height'],
+                                       room.get('boundaries', ())))
+        self.by_name = {room.name: room for room in self.rooms}
+        if len(self.by_name) != len(self.rooms):
+            raise ValueError('The room names of a layout have to be unique.')
+
+        self.interfaces = []
+        for k, interface in enumerate(description.get('interfaces', ())):
+            dirichlet = self.room(interface['dirichlet'])
+            neumann = self.room(interface['neumann'])
+            segment = shared_segment(dirichlet, neumann)
+            if segment is None:
+                raise ValueError('Room ' + dirichlet.name + ' and ' + neumann.name + ' do not share a wall.')
+            for room, role in ((dirichlet, 'dirichlet'), (neumann, 'neumann')):
+                if room.role not in (None, role):
+                    raise ValueError('Room ' + room.name + ' is both a Dirichlet and a Neumann room.')
+                room.role = role
+            self.interfaces.append(InterfaceSpec(k, dirichlet, neumann, *segment))
+        # Rooms without interfaces are solved once per iteration like the
+        # Dirichlet rooms.
+        for room in self.rooms:
+            if room.role is None:
+                room.role = 'dirichlet'
+
+    def room(self, name):
+        if name not in self.by_name:
+            raise ValueError('Unknown room: ' + str(name))
+        return self.by_name[name]
+
+    def check_mesh(self, dx):
+        """ All corners have to lie on the grid with mesh width dx, so that
+            the nodes on both sides of an interface match.
+        """
+        for room in self.rooms:
+            for value in (room.x, room.y, room.width, room.height):
+                if not np.isclose(value/dx, round(value/dx)):
+                    raise ValueError('Room ' + room.name + ' does not lie on the grid with mesh width ' + str(dx))
+            if min(room.width, room.height) < 2*dx:
+                raise ValueError('Room ' + room.name + ' is too small for the mesh width ' + str(dx))
+
+
+def load(filename):
+    with open(filename) as f:
+        return Layout(json.load(f))
+
+
+def schedule(layout, dx, ranks):
+    """ Returns a list with the rank of every room. The Dirichlet rooms are
+        solved at the same time, and then the Neumann rooms, so each of the
+        two groups is balanced separately: rooms are taken by decreasing
+        number of unknowns and given to the rank with the least work in that
+        group so far (ties go to the rank with the least work in total).
+        A large room thus gets a rank of its own, and small rooms share.
+    """
+    owner = [None]*len(layout.rooms)
+    total = np.zeros(ranks)
+    for role in ('dirichlet', 'neumann'):
+        group_load = np.zeros(ranks)
+        rooms = [room for room in layout.rooms if room.role == role]
+        rooms.sort(key=lambda room: -room.unknowns(dx))
+        for room in rooms:
+            rank = min(range(ranks), key=lambda r: (group_load[r], total[r], r))
+            owner[room.index] = rank
+            group_load[rank] += room.unknowns(dx)
+            total[rank] += room.unknowns(dx)
+    return owner
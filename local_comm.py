@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+    In-process communicators, so that the rooms can be run without mpirun.
+
+    LocalComm implements the part of the mpi4py communicator API that the
+    rooms use (Get_rank, Get_size, Send, Recv, Isend, Irecv, Iprobe, Barrier,
+    Allreduce), and this module the part of the MPI namespace that goes with
+    it (DOUBLE, FLOAT, ANY_TAG, SUM, Status, Request.Waitall); communication.py
+    picks the right one for a communicator. Sends are buffered (the data is
+    copied right away), and messages between two ranks are received in the
+    order they were sent, with the same tag matching as MPI, so the rooms
+    compute exactly the same as under MPI.
+
+    run(target, size, backend) calls target(com, *args) on every rank and
+    returns the list of the return values. The backends are
+
+        'threads':     one thread per rank. The NumPy/SciPy solves release
+                       the GIL, so the rooms solve in parallel.
+        'sequential':  one thread per rank, but only one of them runs at a
+                       time; a rank runs until it waits for a message.
+        'pipes':       one process per rank (multiprocessing), connected by
+                       pipes. target and its return value are pickled.
+"""
+import multiprocessing
+import multiprocessing.connection
+import queue
+import threading
+
+import numpy as np
+
+
+ANY_TAG = -1
+DOUBLE = None   # the buffers carry their own dtype
+FLOAT = None
+SUM = 'sum'
+
+TAG_ALLREDUCE = -10 # used internally by the collectives
+
+BACKENDS = ('threads', 'sequential', 'pipes')
+
+
+def as_array(buf):
+    """ Returns the array of an mpi4py-style buffer [array, datatype]. """
+    if isinstance(buf, (list, tuple)):
+        return buf[0]
+    return buf
+
+
+def matches(message_tag, tag):
+    return tag == ANY_TAG and message_tag >= 0 or message_tag == tag
+
+
+class Status(object):
+    def __init__(self):
+        self.source = None
+        self.tag = None
+
+    def Get_source(self):
+        return self.source
+
+    def Get_tag(self):
+        return self.tag
+
+
+class Request(object):
+    """ A send (already done, since sends are buffered) or a posted receive,
+        which is done when Wait() is called.
+    """
+    def __init__(self, receive=None):
+        self.receive = receive
+
+    def Wait(self, status=None):
+        if self.receive is not None:
+            self.receive(status)
+            self.receive = None
+
+    def Test(self, status=None):
+        """ True for sends; a posted receive is only done after Wait(). """
+        return self.receive is None
+
+    @staticmethod
+    def Waitall(requests):
+        for request in requests:
+            request.Wait()
+
+
+class LocalComm(object):
+    """ Collectives and the non-blocking calls, on top of the blocking
+        point-to-point calls of the transport (deliver() and take()).
+    """
+    def __init__(self, rank, size):
+        self.rank = rank
+        self.size = size
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.size
+
+    def Send(self, buf, dest, tag=0):
+        self.deliver(dest, tag, np.array(as_array(buf), copy=True))
+
+    def Isend(self, buf, dest, tag=0):
+        self.Send(buf, dest, tag)
+        return Request()
+
+    def Recv(self, buf, source, tag=ANY_TAG, status=None):
+        message_tag, data = self.take(source, tag)
+        out = as_array(buf)
+        # As in MPI, a message may be shorter than the buffer (TAG_DONE
+        # messages are empty), but not longer.
+        if data.size > out.size:
+            raise ValueError('Message of size ' + str(data.size) + ' received into a buffer of size ' + str(out.size))
+        out.reshape(-1)[:data.size] = data.reshape(-1)
+        if status is not None:
+            status.source = source
+            status.tag = message_tag
+
+    def Irecv(self, buf, source, tag=ANY_TAG):
+        return Request(lambda status: self.Recv(buf, source, tag, status))
+
+    def Iprobe(self, source, tag=ANY_TAG, status=None):
+        """ Returns True if a message from source can be received now. """
+        for message_tag, data in self.arrived(source):
+            if matches(message_tag, tag):
+                if status is not None:
+                    status.source = source
+                    status.tag = message_tag
+                return True
+        return False
+
+    def Barrier(self):
+        self.Allreduce(np.zeros(1), np.zeros(1))
+
+    def Allreduce(self, sendbuf, recvbuf, op=SUM):
+        """ Sum over all ranks, added up in rank order on rank 0. """
+        value = np.array(as_array(sendbuf), dtype=float, copy=True)
+        if self.rank == 0:
+            total = value
+            for source in range(1, self.size):
+                total = total + self.take(source, TAG_ALLREDUCE)[1]
+            for dest in range(1, self.size):
+                self.deliver(dest, TAG_ALLREDUCE, total)
+        else:
+            self.deliver(0, TAG_ALLREDUCE, value)
+            total = self.take(0, TAG_ALLREDUCE)[1]
+        as_array(recvbuf)[...] = total
+
+
+class World(object):
+    """ The mailboxes of all ranks of the thread backends. mailbox[dest][source]
+        is the list of messages (tag, data) not received yet.
+    """
+    def __init__(self, size, sequential=False):
+        self.size = size
+        self.sequential = sequential
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.mailbox = [[[] for source in range(size)] for dest in range(size)]
+        self.failed = False
+
+
+class ThreadComm(LocalComm):
+    def __init__(self, world, rank):
+        LocalComm.__init__(self, rank, world.size)
+        self.world = world
+
+    def deliver(self, dest, tag, data):
+        with self.world.changed:
+            self.world.mailbox[dest][self.rank].append((tag, data))
+            self.world.changed.notify_all()
+
+    def take(self, source, tag):
+        messages = self.world.mailbox[self.rank][source]
+        with self.world.changed:
+            while True:
+                if self.world.failed:
+                    raise RuntimeError('Another rank has failed.')
+                for i, (message_tag, data) in enumerate(messages):
+                    if matches(message_tag, tag):
+                        del messages[i]
+                        return message_tag, data
+                # In the sequential backend this lets the next rank run.
+                self.world.changed.wait()
+
+    def arrived(self, source):
+        with self.world.changed:
+            if self.world.failed:
+                raise RuntimeError('Another rank has failed.')
+            return list(self.world.mailbox[self.rank][source])
+
+
+class PipeComm(LocalComm):
+    """ One process per rank. Every rank has a pipe to every other rank, and
+        a thread that does the sends, so that Send never blocks on a full
+        pipe.
+    """
+    def __init__(self, rank, size, connections):
+        LocalComm.__init__(self, rank, size)
+        self.connections = connections
+        self.pending = [[] for source in range(size)]
+        self.outbox = queue.Queue()
+        self.sender = threading.Thread(target=self.send_loop, daemon=True)
+        self.sender.start()
+
+    def send_loop(self):
+        while True:
+            item = self.outbox.get()
+            if item is None:
+                return
+            dest, tag, data = item
+            self.connections[dest].send((tag, data))
+
+    def deliver(self, dest, tag, data):
+        if dest == self.rank:
+            self.pending[dest].append((tag, data))
+        else:
+            self.outbox.put((dest, tag, data))
+
+    def take(self, source, tag):
+        messages = self.pending[source]
+        while True:
+            for i, (message_tag, data) in enumerate(messages):
+                if matches(message_tag, tag):
+                    del messages[i]
+                    return message_tag, data
+            messages.append(self.connections[source].recv())
+
+    def arrived(self, source):
+        connection = self.connections[source]
+        while source != self.rank and connection.poll():
+            self.pending[source].append(connection.recv())
+        return self.pending[source]
+
+    def close(self):
+        """ Waits until all messages have been sent. """
+        self.outbox.put(None)
+        self.sender.join()
+
+
+def run_thread(world, rank, target, args, results):
+    com = ThreadComm(world, rank)
+    try:
+        if world.sequential:
+            with world.lock:
+                results[rank] = target(com, *args)
+        else:
+            results[rank] = target(com, *args)
+    except BaseException as error:
+        results[rank] = error
+        with world.changed:
+            world.failed = True
+            world.changed.notify_all()
+
+
+def run_process(rank, size, connections, target, args, result_connection):
+    com = PipeComm(rank, size, connections)
+    try:
+        result = target(com, *args)
+    except BaseException as error:
+        result = error
+    com.close()
+    result_connection.send(result)
+
+
+def run(target, size=3, backend='threads', args=()):
+    """ Runs target(com, *args) on size ranks and returns their results. """
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend: ' + str(backend) + '. Choose from ' + ', '.join(BACKENDS))
+    if backend == 'pipes':
+        ends = [[None]*size for rank in range(size)]
+        for a in range(size):
+            for b in range(a + 1, size):
+                ends[a][b], ends[b][a] = multiprocessing.Pipe()
+        result_pipes = [multiprocessing.Pipe(duplex=False) for rank in range(size)]
+        processes = [multiprocessing.Process(target=run_process,
+                                             args=(rank, size, ends[rank], target, args, result_pipes[rank][1]))
+                     for rank in range(size)]
+        for process in processes:
+            process.start()
+        # If a rank fails, the others may wait for it forever, so stop them.
+        results = [None]*size
+        receivers = {result_pipes[rank][0]: rank for rank in range(size)}
+        while receivers:
+            for receiver in multiprocessing.connection.wait(list(receivers)):
+                rank = receivers.pop(receiver)
+                results[rank] = receiver.recv()
+                if isinstance(results[rank], BaseException):
+                    for process in processes:
+                        process.terminate()
+                    receivers = {}
+                    break
+        for process in processes:
+            process.join()
+    else:
+        world = World(size, sequential=(backend == 'sequential'))
+        results = [None]*size
+        threads = [threading.Thread(target=run_thread, args=(world, rank, target, args, results))
+                   for rank in range(size)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
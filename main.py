@@ -2,16 +2,28 @@
 """
     NOTE: to run a python program with 3 processes:
         mpirun -np 3 python filename.py
+    or without MPI, with all rooms in this process (see local_comm.py):
+        python main.py -d 1/20 --backend threads
 """
 import sys
 import time
 
 import numpy as np
 import scipy.linalg as sl
-from mpi4py import MPI
 import argparse
 
+import apartment
+import cache
+import checkpoint
+import communication
+import continuation
+import layout
+import local_comm
+import output
 import room
+import sweep
+import tracing
+import transient
 
 def parse_input_arguments():
 
@@ -20,12 +32,16 @@ def parse_input_arguments():
     mandatory_group = argparser.add_argument_group('Mandatory') # dx ska nog vara här!
     mandatory_group.add_argument('--dx', '-d',
                         dest='dx',
-                        type=str,
+                        type = str,
                         help='Distance between grid points. Needs to be specified in the form of a fraction 1/x.')
     optional_group.add_argument('--omega', '-o',
                         dest='omega',
                         type = float,
                         help='Relaxation parameters')
+    optional_group.add_argument('--relaxation', '-r',
+                        dest='relaxation',
+                        type = str,
+                        help='Relaxation of the interface iteration: fixed (default, uses omega), aitken or anderson')
     optional_group.add_argument('--max_iters', '-i',
                         dest='max_iters',
                         type = int,
@@ -50,8 +66,139 @@ def parse_input_arguments():
                         dest='tol',
                         type = float,
                         help='Stopping condition based on ||u-u_km1||_2 < tol')
+    optional_group.add_argument('--solver',
+                        dest='solver',
+                        type = str,
+                        help='Linear solver backend: splu (default), cholesky, dense, fft, multigrid, cg or spsolve')
+    optional_group.add_argument('--preconditioner',
+                        dest='preconditioner',
+                        type = str,
+                        help='Preconditioner for the cg solver: multigrid (default), ichol, fft or jacobi')
+    optional_group.add_argument('--precision',
+                        dest='precision',
+                        type = str,
+                        help='double (default) or single: factorize in float32, refine the solves to tol and send the interface values as float32')
+    optional_group.add_argument('--stencil',
+                        dest='stencil',
+                        type = str,
+                        help='five (default) or nine: the fourth-order compact stencil, accurate on much coarser meshes (see compact.py)')
+    optional_group.add_argument('--grading',
+                        dest='grading',
+                        type = float,
+                        nargs = '+',
+                        help='Graded meshes: one strength in [0, 1) for all rooms, or one per room (see graded.py)')
+    optional_group.add_argument('--ordering',
+                        dest='ordering',
+                        type = str,
+                        help='Order of the interface iteration: lockstep (default), pipelined (room 1 and 3 solve with the data of the iteration before while room 2 solves) or async')
+    optional_group.add_argument('--staleness',
+                        dest='staleness',
+                        type = int,
+                        help='With ordering async: the most iterations room 2 uses old interface values for (default 2)')
+    optional_group.add_argument('--interface',
+                        dest='interface',
+                        type = str,
+                        help='Interface solver: iterate (default), schur (assembled) or gmres')
+    optional_group.add_argument('--interface_cache',
+                        dest='interface_cache',
+                        type = str,
+                        help='Directory where the assembled interface operator is cached (with --interface schur)')
+    optional_group.add_argument('--layout',
+                        dest='layout',
+                        type = str,
+                        help='JSON file with an apartment layout (see layout.py), solved on any number of ranks')
+    optional_group.add_argument('--backend',
+                        dest='backend',
+                        type = str,
+                        help='mpi (default, run with mpirun), or without mpirun: threads, sequential or pipes')
+    optional_group.add_argument('--ranks',
+                        dest='ranks',
+                        type = int,
+                        help='Number of ranks for --layout with the backends threads, sequential and pipes (default 3)')
+    optional_group.add_argument('--sweep',
+                        dest='sweep',
+                        type = str,
+                        help='CSV file with scenarios (wall_temp, heater_temp, win_temp), all solved in one run (see sweep.py)')
+    optional_group.add_argument('--sweep_mode',
+                        dest='sweep_mode',
+                        type = str,
+                        help='basis (default: combine the solutions for unit temperatures) or block (all scenarios as columns)')
+    optional_group.add_argument('--sweep_output',
+                        dest='sweep_output',
+                        type = str,
+                        help='File where the fields of all scenarios are saved (default sweep.npz)')
+    optional_group.add_argument('--transient',
+                        dest='transient',
+                        type = float,
+                        help='Simulate the time-dependent problem for this many seconds (see transient.py)')
+    optional_group.add_argument('--dt',
+                        dest='dt',
+                        type = float,
+                        help='Time step in seconds for --transient (default 60)')
+    optional_group.add_argument('--method',
+                        dest='method',
+                        type = str,
+                        help='Time stepping method for --transient: BE (backward Euler, default) or CN (Crank-Nicolson)')
+    optional_group.add_argument('--snapshots',
+                        dest='snapshots',
+                        type = str,
+                        help='Directory where the transient snapshots are written (room1.npy, room2.npy, room3.npy, times.npy)')
+    optional_group.add_argument('--snapshot_every',
+                        dest='snapshot_every',
+                        type = int,
+                        help='Write a snapshot every this many time steps (default 10)')
+    optional_group.add_argument('--continuation',
+                        dest='continuation',
+                        type = str,
+                        help='Coarsest mesh width 1/x: converge there first and refine up to dx (see continuation.py). Saves about a third of the iterations on dx and a quarter of the time with relaxation fixed, but is slower with relaxation aitken or anderson')
+    optional_group.add_argument('--trace',
+                        dest='trace',
+                        type = str,
+                        help='File for a trace of every iteration of every room: .jsonl (JSON lines) or .json (Chrome trace), see tracing.py')
+    optional_group.add_argument('--output',
+                        dest='output',
+                        type = str,
+                        help='Directory where every rank writes its room into a memory-mapped map of the apartment, instead of plotting (see output.py)')
+    optional_group.add_argument('--png',
+                        dest='png',
+                        type = str,
+                        help='With --output: render the map headlessly to this PNG file')
+    optional_group.add_argument('--cache',
+                        dest='cache',
+                        type = str,
+                        help='Directory of a persistent cache of factorizations (only of the solvers dense, and cholesky without scikit-sparse: splu, cg, multigrid and fft are set up in every run), interface operators and solutions, used to warm start (see cache.py)')
+    optional_group.add_argument('--cache_size',
+                        dest='cache_size',
+                        type = float,
+                        help='Maximum size of the cache in MB (default 1024)')
+    optional_group.add_argument('--checkpoint',
+                        dest='checkpoint',
+                        type = str,
+                        help='Directory where every rank writes checkpoints of the iteration in the background (see checkpoint.py)')
+    optional_group.add_argument('--checkpoint_every',
+                        dest='checkpoint_every',
+                        type = int,
+                        help='Write a checkpoint every this many iterations (default 10)')
+    optional_group.add_argument('--resume',
+                        dest='resume',
+                        action = 'store_true',
+                        help='Restart from the latest checkpoint that all rooms have written')
     args = argparser.parse_args()
 
+    # Only the plain solve of the three rooms writes output and traces, uses
+    # the cache and checkpoints; the other modes would ignore them.
+    modes = [name for name in ('layout', 'sweep', 'transient', 'continuation') if getattr(args, name)]
+    options = [name for name in ('output', 'png', 'trace', 'cache', 'checkpoint', 'resume') if getattr(args, name)]
+    if modes and options:
+        argparser.error('--' + ', --'.join(options) + ' can not be used with --' + modes[0])
+    if args.png and not args.output:
+        argparser.error('--png needs --output')
+    # The strips of room 2 (more than 3 ranks, see strips.py) need the MPI
+    # collectives, which local_comm.py does not have.
+    if args.ranks and args.ranks != 3 and not args.layout:
+        argparser.error('--ranks only works with --layout; to split room 2 into strips, run more than 3 ranks '
+                        'with mpirun')
+
     kwargs = dict()
     debug = False
     
@@ -64,6 +211,8 @@ def parse_input_arguments():
         sys.stdout.flush()
     if args.omega:
         kwargs['omega'] = args.omega
+    if args.relaxation:
+        kwargs['relaxation'] = args.relaxation
     if args.max_iters:
         kwargs['max_iters'] = args.max_iters
     if args.wall_temp:
@@ -77,43 +226,266 @@ def parse_input_arguments():
         debug = args.debug
     if args.tol:
         kwargs['tol'] = args.tol
+    if args.solver:
+        kwargs['solver'] = args.solver
+    if args.preconditioner:
+        kwargs['preconditioner'] = args.preconditioner
+    if args.precision:
+        kwargs['precision'] = args.precision
+    if args.stencil:
+        kwargs['stencil'] = args.stencil
+    if args.grading:
+        kwargs['grading'] = args.grading
+    if args.ordering:
+        kwargs['ordering'] = args.ordering
+    if args.staleness:
+        kwargs['staleness'] = args.staleness
+    if args.interface:
+        kwargs['interface'] = args.interface
+    if args.interface_cache:
+        kwargs['interface_cache'] = args.interface_cache
+    if args.layout:
+        kwargs['layout'] = args.layout
+    if args.backend:
+        kwargs['backend'] = args.backend
+    if args.ranks:
+        kwargs['ranks'] = args.ranks
+    if args.sweep:
+        kwargs['sweep'] = args.sweep
+    if args.sweep_mode:
+        kwargs['sweep_mode'] = args.sweep_mode
+    if args.sweep_output:
+        kwargs['sweep_output'] = args.sweep_output
+    if args.transient:
+        kwargs['transient'] = args.transient
+    if args.dt:
+        kwargs['dt'] = args.dt
+    if args.method:
+        kwargs['method'] = args.method
+    if args.snapshots:
+        kwargs['snapshots'] = args.snapshots
+    if args.snapshot_every:
+        kwargs['snapshot_every'] = args.snapshot_every
+    if args.continuation:
+        frac = args.continuation.split('/')
+        assert(len(frac)==2), 'The coarsest mesh width needs to be of the format "1/x"'
+        kwargs['continuation'] = float(int(frac[0])/int(frac[1]))
+    if args.trace:
+        kwargs['trace'] = args.trace
+    if args.output:
+        kwargs['output'] = args.output
+    if args.png:
+        kwargs['png'] = args.png
+    if args.cache:
+        kwargs['cache'] = args.cache
+    if args.cache_size:
+        kwargs['cache_size'] = args.cache_size
+    if args.checkpoint:
+        kwargs['checkpoint'] = args.checkpoint
+    if args.checkpoint_every:
+        kwargs['checkpoint_every'] = args.checkpoint_every
+    if args.resume:
+        kwargs['resume'] = args.resume
 
     return kwargs
 
-if __name__=='__main__':
-    
-    kwargs = parse_input_arguments() # parses_input_arguments
+def run_layout(com, kwargs, layout_file):
+    """ One rank of the solve of a layout. Rank 0 returns the apartment
+        object and the fields of all rooms, the other ranks None.
+    """
+    apartment_object = apartment.Apartment(com=com, layout=layout.load(layout_file), **kwargs)
+    time1 = time.time()*1000
+    apartment_object.solve()
+    time2 = time.time()*1000
+    fields = apartment_object.gather(root=0)
+    if com.Get_rank() != 0:
+        return None
+    print('Time taken = ' + str(int(time2-time1))+' [ms]')
+    sys.stdout.flush()
+    return apartment_object, fields
 
-    # Initiate the communication object that the different rooms use.
-    com = MPI.COMM_WORLD
 
-    # Define the room number by obtaining the rank of this process.
-    room_nr = com.Get_rank() + 1
-    room_object = room.Room(**kwargs,room=room_nr,com=com)
+def run_rooms(com, kwargs, trace_file=None, output_dir=None, cache_dir=None, cache_size=1024,
+              checkpoint_dir=None, checkpoint_every=10, resume=False):
+    """ One rank of the solve of the three rooms. Room 2 returns its room
+        object and the fields and interface values of all rooms, the other
+        ranks None. With a trace_file, the iterations of all rooms are
+        written to it (see tracing.py). With an output_dir, every rank writes
+        its room to the map in output_dir instead (see output.py), and room 2
+        only returns its room object. With a cache_dir, the factorizations
+        are kept in a cache of at most cache_size MB there, and the rooms
+        start from the cached solutions (see cache.py). With a
+        checkpoint_dir, the rooms write checkpoints there every
+        checkpoint_every iterations, and start from the latest one if resume
+        is set (see checkpoint.py).
+    """
+    # Define the room number by obtaining the rank of this process. With
+    # more than 3 processes, the extra ranks 3, 4, ... help rank 1: room 2 is
+    # split into strips over the ranks of strip_com (see strips.py).
+    rank = com.Get_rank()
+    room_nr = rank + 1 if rank < 3 else 2
+    strip_com = None
+    if com.Get_size() > 3:
+        strip_com = com.Split(0 if room_nr == 2 else communication.namespace(com).UNDEFINED, key=rank)
+        if room_nr != 2:
+            strip_com = None
+    recorder = tracing.Recorder(rank) if trace_file else None
+    store = cache.Cache(cache_dir, int(cache_size*2**20)) if cache_dir else None
+    checkpointer = None
+    iteration = 0
+    if checkpoint_dir:
+        # All ranks find the checkpoint to resume from before any of them
+        # removes the newer ones that not all rooms had written.
+        iteration = checkpoint.latest(checkpoint_dir) if resume else 0
+        com.Barrier()
+        if rank < 3:
+            checkpointer = checkpoint.Checkpointer(checkpoint_dir, rank, checkpoint_every)
+            checkpointer.clear(after=iteration)
+    room_object = room.Room(**kwargs,room=room_nr,com=com,strip_com=strip_com,callback=recorder,cache=store,
+                            checkpoint=checkpointer)
+    temperatures = (room_object.wall_temp, room_object.heater_temp, room_object.window_temp)
+    if store is not None and rank < 3:
+        names = {1: ['gamma1', 'U1'], 2: ['U2'], 3: ['gamma2', 'U3']}[room_nr]
+        start = cache.warm_start(store, room_object.dx, temperatures, names, stencil=room_object.stencil,
+                                 grading=room_object.grading, solver=room_object.solver,
+                                 precision=room_object.precision, room=room_nr)
+        if start is not None:
+            if room_nr != 2:
+                room_object.gamma0 = start[names[0]]
+            # The fields of room 1 and 3 are stored without the interface
+            # nodes of the nine-point stencil.
+            if start[names[-1]].shape[0] == room_object.shape[0]*room_object.shape[1]:
+                room_object.u_km1 = start[names[-1]]
+    if iteration and rank < 3:
+        state = checkpoint.load(checkpoint_dir, rank, iteration)
+        if state['u'].shape[0] != room_object.shape[0]*room_object.shape[1]:
+            raise ValueError('The checkpoint in ' + checkpoint_dir + ' is of another mesh width.')
+        room_object.start_iter = iteration
+        room_object.u_km1 = state['u']
+        room_object.gamma0 = state.get('gamma')
+        if room_nr == 2:
+            print('Resuming from the checkpoint after ' + str(iteration) + ' iterations')
+    if rank >= 3:
+        room_object.linear_solver.serve()
+        if trace_file:
+            com.Barrier()
+        if output_dir:
+            output.write_room(com, None, None, None, output_dir)
+        return None
     
     time1 = time.time()*1000
     U, gamma = room_object.solve()
     time2 = time.time()*1000
+    if checkpointer is not None:
+        checkpointer.close()
+    if strip_com is not None:
+        room_object.linear_solver.close()
+
+    # Every room stores its own solution, also when the fields are written to
+    # output_dir instead of gathered.
+    if store is not None:
+        fields = dict(zip(names, [U] if room_nr == 2 else [gamma, U]))
+        cache.store_solution(store, room_object.dx, room_object.omega, temperatures, fields, room_object.stencil,
+                             room_object.grading, room_object.solver, room_object.precision, room=room_nr)
+
+    # Every rank writes its part of the trace, room 2 merges them.
+    if trace_file:
+        tracing.write_part(recorder.records, trace_file, rank)
+        com.Barrier()
+        if room_nr == 2:
+            tracing.merge_parts(trace_file)
     
-    # Room 2 gathers all the data from the rooms and plots the
-    # temperature distribution throughout the apartment.
+    if output_dir:
+        output.write_room(com, room_object, U, gamma, output_dir)
+        if room_nr == 2:
+            if room_object.verbose:
+                print('Time taken = ' + str(int(time2-time1))+' [ms]')
+                sys.stdout.flush()
+            return room_object, None
+        return None
+
+    # Room 2 gathers all the data from the rooms.
     if room_nr==2:
-        print('Time taken = ' + str(int(time2-time1))+' [ms]')
-        sys.stdout.flush()
-        U1 = com.recv(source=0,tag=1)
-        com.send('ping',dest=0)
-        gamma1 = com.recv(source=0,tag=2)
-        
-        U3 = com.recv(source=2,tag=3)
-        com.send('ping',dest=2)
-        gamma2 = com.recv(source=2,tag=4)
-        room_object.plot_apartment(U1=U1,U2=U,U3=U3,gamma1=gamma1,gamma2=gamma2)       
+        if room_object.verbose:
+            print('Time taken = ' + str(int(time2-time1))+' [ms]')
+            sys.stdout.flush()
+        N = room_object.N
+        U1, gamma1 = communication.recv_result(com, source=0, size=N*N, N=N)
+        U3, gamma2 = communication.recv_result(com, source=2, size=N*N, N=N)
+        fields = dict(U1=U1,U2=U,U3=U3,gamma1=gamma1,gamma2=gamma2)
+        return room_object, fields
     else:
-        com.send(U,dest=1,tag=room_nr)
-        # If there wasn't a ping recv here, both gamma and u would be sent to 
-        # room 2 at such a close interval such that room 2 could mix them up.
-        ping = com.recv(source=1)
-        com.send(gamma,dest=1,tag=room_nr+1)
+        # U and gamma are sent with different tags, so room 2 can not mix them up.
+        communication.send_result(com, U, gamma, dest=1)
+        return None
+
+
+if __name__=='__main__':
+    
+    kwargs = parse_input_arguments() # parses_input_arguments
+    backend = kwargs.pop('backend', 'mpi')
+    ranks = kwargs.pop('ranks', 3)
+    layout_file = kwargs.pop('layout', None)
+    sweep_file = kwargs.pop('sweep', None)
+    sweep_mode = kwargs.pop('sweep_mode', 'basis')
+    sweep_output = kwargs.pop('sweep_output', 'sweep.npz')
+    t_end = kwargs.pop('transient', None)
+    coarse_dx = kwargs.pop('continuation', None)
+    trace_file = kwargs.pop('trace', None)
+    output_dir = kwargs.pop('output', None)
+    png = kwargs.pop('png', None)
+    cache_dir = kwargs.pop('cache', None)
+    cache_size = kwargs.pop('cache_size', 1024)
+    checkpoint_args = (kwargs.pop('checkpoint', None), kwargs.pop('checkpoint_every', 10), kwargs.pop('resume', False))
+    transient_args = (kwargs.pop('dt', 60.0), kwargs.pop('method', 'BE'), kwargs.pop('snapshots', None),
+                      kwargs.pop('snapshot_every', 10))
+    if layout_file:
+        # Any layout, on any number of ranks. Rank 0 gathers and plots.
+        target, args = run_layout, (kwargs, layout_file)
+    elif sweep_file:
+        scenarios = sweep.load_scenarios(sweep_file, defaults=kwargs)
+        target, args = sweep.run_sweep, (kwargs, scenarios, sweep_mode)
+        ranks = 3
+    elif t_end:
+        target, args = transient.run_transient, (kwargs, t_end) + transient_args
+        ranks = 3
+    elif coarse_dx:
+        target, args = continuation.run_continuation, (kwargs, coarse_dx)
+        ranks = 3
+    else:
+        target, args = run_rooms, (kwargs, trace_file, output_dir, cache_dir, cache_size) + checkpoint_args
+        ranks = 3
+
+    if backend == 'mpi':
+        # Initiate the communication object that the different rooms use.
+        from mpi4py import MPI
+        results = [target(MPI.COMM_WORLD, *args)]
+    else:
+        # All ranks in this process (or in processes started by it), see
+        # local_comm.py.
+        results = local_comm.run(target, ranks, backend, args)
+
+    # The rank with the results plots the temperature distribution
+    # throughout the apartment.
+    for result in results:
+        if result is None:
+            continue
+        if sweep_file:
+            np.savez(sweep_output, scenarios=scenarios, **result)
+            print(str(len(scenarios)) + ' scenarios solved in ' + str(result['iterations']) + ' iterations, saved in ' + sweep_output)
+        elif t_end:
+            # The transient fields are in the snapshot files, not plotted.
+            continue
+        elif output_dir:
+            print('Results written to ' + output_dir)
+            if png:
+                print('Written ' + output.render(output_dir, png))
+        elif layout_file:
+            apartment_object, fields = result
+            apartment_object.plot(fields)
+        else:
+            room_object, fields = result
+            room_object.plot_apartment(**fields)
 
 
 '''
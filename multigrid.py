@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+    Matrix-free geometric multigrid for the five-point operator of a room.
+
+    The operator is applied directly on the 2D grid with the same boundary
+    handling as assembly.five_point_operator() (Dirichlet sides contribute
+    through b, Neumann sides have -3 on the diagonal), so no matrix is stored
+    on any level. Red-black Gauss-Seidel is used as smoother and the coarsest
+    grid is solved exactly with the fast Poisson solver.
+
+    Every coarse grid has about half as many nodes per direction and covers
+    exactly the same interval as the fine grid: a Dirichlet end is the
+    boundary itself, a Neumann end is the mirror line half a mesh width
+    outside the last node (the ghost node that gives the -3). The coarse mesh
+    widths are therefore not exactly 2h, and the coarse operators are
+    cy Ty + cx Tx with cx = Hy/Hx, cy = Hx/Hy. A shift (A - shift*I, for
+    time stepping) becomes shift*Hx*Hy on the coarse grids.
+"""
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+
+from fast_poisson import FastPoissonSolver
+
+
+# Stop coarsening when a grid has at most this many nodes in some direction.
+COARSEST = 8
+
+
+class Axis(object):
+    """ The nodes of a grid along one direction, in units of the finest mesh
+        width, for n nodes with the given boundary types at the two ends.
+    """
+    def __init__(self, n, neumann_start, neumann_end, length=None):
+        self.n = n
+        self.neumann_start = neumann_start
+        self.neumann_end = neumann_end
+        # Number of mesh widths between the two ends of the interval.
+        intervals = n + 1 - 0.5*neumann_start - 0.5*neumann_end
+        self.length = intervals if length is None else length
+        self.h = self.length/intervals
+        self.x = self.h*(np.arange(n) + 1 - 0.5*neumann_start)
+
+    def coarsen(self):
+        return Axis(self.n//2, self.neumann_start, self.neumann_end, self.length)
+
+    def interpolation(self, coarse):
+        """ Returns the sparse n x m linear interpolation from the coarse axis
+            to this one. Towards a Dirichlet end the values go to 0 at the
+            boundary, beyond the last coarse node at a Neumann end the last
+            value is kept.
+        """
+        # Coarse node positions, with the two ends added as nodes -1 and m.
+        X = np.concatenate(([0.0], coarse.x, [self.length]))
+        right = np.clip(np.searchsorted(X, self.x), 1, len(X) - 1)
+        left = right - 1
+        weight = (self.x - X[left])/(X[right] - X[left])
+
+        rows, cols, values = [], [], []
+        for k, w in ((left, 1 - weight), (right, weight)):
+            k = k - 1 # index among the coarse nodes
+            if self.neumann_start:
+                k = np.where(k < 0, 0, k)
+            if self.neumann_end:
+                k = np.where(k >= coarse.n, coarse.n - 1, k)
+            keep = (k >= 0) & (k < coarse.n) & (w != 0)
+            rows.append(np.arange(self.n)[keep])
+            cols.append(k[keep])
+            values.append(w[keep])
+        return sp.csr_matrix((np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))),
+                             shape=(self.n, coarse.n))
+
+
+class Level(object):
+    """ One grid of the multigrid hierarchy, with the operator
+        cy Ty + cx Tx - shift*Hx*Hy applied matrix-free.
+    """
+    def __init__(self, y, x, neumann, shift=0):
+        self.y = y
+        self.x = x
+        self.shape = (y.n, x.n)
+        self.cy = x.h/y.h
+        self.cx = y.h/x.h
+        self.shift = shift*x.h*y.h
+        D = -(2*(self.cx + self.cy) + self.shift)*np.ones(self.shape)
+        if 'left' in neumann:
+            D[:, 0] += self.cx
+        if 'right' in neumann:
+            D[:, -1] += self.cx
+        if 'top' in neumann:
+            D[0, :] += self.cy
+        if 'bottom' in neumann:
+            D[-1, :] += self.cy
+        self.D = D
+        self.D_inv = 1/D
+        i, j = np.indices(self.shape)
+        self.red = (i + j) % 2 == 0
+        self.black = ~self.red
+
+    def neighbour_sum(self, u):
+        """ Returns the weighted sum of the neighbours of every node of u.
+            Nodes outside the grid count as 0.
+        """
+        S = np.zeros_like(u)
+        S[1:] += self.cy*u[:-1]
+        S[:-1] += self.cy*u[1:]
+        S[:, 1:] += self.cx*u[:, :-1]
+        S[:, :-1] += self.cx*u[:, 1:]
+        return S
+
+    def apply(self, u):
+        return self.D*u + self.neighbour_sum(u)
+
+    def smooth(self, u, b, reverse=False):
+        """ One red-black Gauss-Seidel sweep (black-red if reverse). """
+        colours = (self.black, self.red) if reverse else (self.red, self.black)
+        for colour in colours:
+            S = self.neighbour_sum(u)
+            np.copyto(u, (b - S)*self.D_inv, where=colour)
+        return u
+
+
+class MultigridSolver(object):
+    """ Solves A u = b with V- or F-cycles until the update of a cycle is
+        smaller than tol (in the 2-norm). solve() takes an initial guess x0,
+        so warm starts from the previous iterate need only a cycle or two.
+    """
+    matrix_free = True
+
+    def __init__(self, A, shape, neumann=(), tol=1e-6, cycle='V', smoothing=2, max_cycles=100, shift=0, **options):
+        assert (cycle in ('V', 'F')), 'The cycle should be V or F.'
+        self.shape = shape
+        self.tol = tol
+        self.cycle_type = cycle
+        self.smoothing = smoothing
+        self.max_cycles = max_cycles
+        self.cycles = 0 # total number of cycles done, for benchmarks
+
+        # Build the hierarchy of grids and the interpolations between them.
+        y = Axis(shape[0], 'top' in neumann, 'bottom' in neumann)
+        x = Axis(shape[1], 'left' in neumann, 'right' in neumann)
+        self.levels = [Level(y, x, neumann, shift)]
+        self.P = [] # self.P[l] = (Py, Px) interpolates from level l+1 to l
+        while min(y.n, x.n) > COARSEST:
+            y_coarse, x_coarse = y.coarsen(), x.coarsen()
+            self.P.append((y.interpolation(y_coarse), x.interpolation(x_coarse)))
+            self.levels.append(Level(y_coarse, x_coarse, neumann, shift))
+            y, x = y_coarse, x_coarse
+        coarsest = self.levels[-1]
+        self.coarsest = FastPoissonSolver(None, coarsest.shape, neumann, coefficients=(coarsest.cy, coarsest.cx),
+                                          shift=coarsest.shift)
+
+    def prolong(self, level, e):
+        Py, Px = self.P[level]
+        return Py @ (Px @ e.T).T
+
+    def restrict(self, level, r):
+        Py, Px = self.P[level]
+        return Py.T @ (Px.T @ r.T).T
+
+    def cycle(self, level, u, b, kind):
+        """ One V- or F-cycle on level for A u = b, updating u in place. """
+        if level == len(self.levels) - 1:
+            return self.coarsest.solve(b.ravel()).reshape(b.shape)
+        grid = self.levels[level]
+        for k in range(self.smoothing):
+            grid.smooth(u, b)
+
+        # Coarse grid correction. With the operators scaled as above, the
+        # coarse equation for the error is A_H e = P^T r (P^T is the full
+        # weighting restriction times Hx Hy / (hx hy)).
+        r = b - grid.apply(u)
+        rc = self.restrict(level, r)
+        ec = self.cycle(level + 1, np.zeros_like(rc), rc, kind)
+        if kind == 'F':
+            ec = self.cycle(level + 1, ec, rc, 'V')
+        u += self.prolong(level, ec)
+
+        for k in range(self.smoothing):
+            grid.smooth(u, b, reverse=True)
+        return u
+
+    def solve(self, b, x0=None):
+        B = b.reshape(self.shape)
+        u = np.zeros(self.shape) if x0 is None else np.array(x0, dtype=float).reshape(self.shape)
+        for k in range(self.max_cycles):
+            u_old = u.copy()
+            u = self.cycle(0, u, B, self.cycle_type)
+            self.cycles += 1
+            if np.linalg.norm(u - u_old) < self.tol:
+                break
+        else:
+            warnings.warn('Multigrid did not reach the tolerance ' + str(self.tol) + ' in ' + str(self.max_cycles)
+                          + ' cycles.', RuntimeWarning)
+        return u.ravel()
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+    Headless output of the three rooms.
+
+    The result is one map of the whole apartment (the grid nodes of all rooms
+    with their walls, heaters, windows and interface values, NaN outside the
+    rooms), in the .npy file apartment.npy, plus meta.json. Room 2 creates
+    the file, then every rank opens it as a memmap and writes its own room
+    into it, including the interface values of room 1 and 3, so no rank sends
+    its field to another one or holds more than its own room.
+
+    On graded meshes (see graded.py) every room is interpolated linearly
+    from its nodes to the uniform nodes of the map, so the map, the renderer
+    and Room.plot_apartment() stay the same.
+
+    The renderer reads the map in chunks of rows, averages blocks of nodes
+    down to at most max_size pixels per side and writes a PNG, without a
+    display:
+
+        python main.py -d 1/400 --output out --png out/apartment.png --backend pipes
+        python output.py out --png apartment.png --max_size 600
+"""
+import argparse
+import json
+import math
+import os
+import warnings
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+
+MAP_FILE = 'apartment.npy'
+META_FILE = 'meta.json'
+
+
+def map_shape(N):
+    """ The shape of the map for N nodes per unit length: 2N+3 rows (room 2
+        with its walls) and 3N+4 columns.
+    """
+    return (2*N + 3, 3*N + 4)
+
+
+def resample(block, grid, flip=False):
+    """ Interpolates the block of a room (its nodes and the sides around
+        them) from the nodes of its graded grid to uniform nodes. The block
+        of room 3 is mirrored (flip).
+    """
+    y = np.concatenate(([0], grid.y, [grid.height]))
+    x = np.concatenate(([0], grid.x, [grid.width]))
+    if flip:
+        x = grid.width - x[::-1]
+    f = RegularGridInterpolator((y, x), block)
+    Y, X = np.meshgrid(np.linspace(0, grid.height, len(y)), np.linspace(0, grid.width, len(x)), indexing='ij')
+    return f((Y, X))
+
+
+def room_block(room_nr, N, U, gamma, wall, heater, window, grid=None):
+    """ Returns (rows, cols, values, mask): the block of the map around room
+        room_nr and which entries of it the room writes. Room 1 and 3 write
+        their interface values into the wall columns of room 2. With the
+        graded grid of the room, the block is interpolated to the uniform
+        nodes of the map.
+    """
+    rows, cols, block, mask = uniform_block(room_nr, N, U, gamma, wall, heater, window)
+    if grid is not None:
+        # The entries of the other rooms are not set.
+        block = resample(np.where(mask, block, 0), grid, flip=(room_nr == 3))
+    return rows, cols, block, mask
+
+
+def uniform_block(room_nr, N, U, gamma, wall, heater, window):
+    M = 2*N + 1
+    if room_nr == 1:
+        block = np.empty((N+2, N+2))
+        block[1:-1, 1:-1] = U.reshape((N, N))
+        block[:, 0] = heater
+        block[0, :] = wall
+        block[-1, :] = wall
+        block[0, 0] = (wall+heater)/2
+        block[-1, 0] = (wall+heater)/2
+        block[1:-1, -1] = gamma
+        mask = np.ones(block.shape, dtype=bool)
+        mask[[0, -1], -1] = False
+        return slice(N+1, M+2), slice(0, N+2), block, mask
+
+    if room_nr == 2:
+        block = np.empty((M+2, N+2))
+        block[1:-1, 1:-1] = U.reshape((M, N))
+        block[0, :] = heater                # upper boundary
+        block[N+1:, -1] = wall
+        block[-1, :] = window
+        block[:N+2, 0] = wall
+        block[0, 0] = (wall+heater)/2
+        block[0, -1] = (wall+heater)/2
+        block[-1, 0] = (wall+window)/2
+        mask = np.ones(block.shape, dtype=bool)
+        mask[N+2:-1, 0] = False             # gamma 1, written by room 1
+        mask[1:N+1, -1] = False             # gamma 2, written by room 3
+        return slice(0, M+2), slice(N+1, 2*N+3), block, mask
+
+    block = np.empty((N+2, N+2))
+    block[1:-1, 1:-1] = np.flip(U.reshape((N, N)), axis=1)
+    block[:, -1] = heater
+    block[0, :] = wall
+    block[-1, :] = wall
+    block[0, -1] = (wall+heater)/2
+    block[-1, -1] = (wall+heater)/2
+    block[1:-1, 0] = gamma
+    mask = np.ones(block.shape, dtype=bool)
+    mask[[0, -1], 0] = False
+    return slice(0, N+2), slice(2*N+2, 3*N+4), block, mask
+
+
+def apartment_map(N, fields, wall, heater, window, grids=None):
+    """ The whole map in memory, from fields[k] = (U, gamma) of room k (for
+        Room.plot_apartment()), and the graded grids of the rooms if any.
+    """
+    Map = np.full(map_shape(N), np.nan)
+    for room_nr, (U, gamma) in fields.items():
+        grid = grids[room_nr] if grids is not None else None
+        rows, cols, block, mask = room_block(room_nr, N, U, gamma, wall, heater, window, grid)
+        np.copyto(Map[rows, cols], block, where=mask)
+    return Map
+
+
+def write_room(com, room_object, U, gamma, directory):
+    """ Writes the room of this rank into the map in directory (all ranks
+        call this; room_object is None on the extra ranks of room 2).
+    """
+    path = os.path.join(directory, MAP_FILE)
+    room_nr = room_object.room if room_object is not None else None
+    if room_nr == 2 and com.Get_rank() == 1:
+        os.makedirs(directory, exist_ok=True)
+        field = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=map_shape(room_object.N))
+        field[:] = np.nan
+        field.flush()
+        del field
+    com.Barrier()
+
+    if room_nr is not None:
+        field = np.lib.format.open_memmap(path, mode='r+')
+        rows, cols, block, mask = room_block(room_nr, room_object.N, U, gamma, room_object.wall_temp,
+                                             room_object.heater_temp, room_object.window_temp, room_object.grid)
+        np.copyto(field[rows, cols], block, where=mask)
+        field.flush()
+        del field
+    com.Barrier()
+
+    if room_nr == 2 and com.Get_rank() == 1:
+        meta = {'dx': room_object.dx, 'N': room_object.N, 'shape': list(map_shape(room_object.N)),
+                'iterations': room_object.max_iters, 'wall_temp': float(room_object.wall_temp),
+                'heater_temp': float(room_object.heater_temp), 'window_temp': float(room_object.window_temp)}
+        with open(os.path.join(directory, META_FILE), 'w') as f:
+            json.dump(meta, f, indent=1)
+
+
+def downsample(field, factor):
+    """ Averages blocks of factor x factor nodes of field (NaN is ignored),
+        reading factor rows at a time.
+    """
+    if factor == 1:
+        return np.array(field)
+    rows, cols = field.shape
+    width = int(math.ceil(cols/factor))
+    small = np.empty((int(math.ceil(rows/factor)), width))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)     # blocks outside the rooms are all NaN
+        for i in range(small.shape[0]):
+            chunk = np.full((factor, width*factor), np.nan)
+            part = field[i*factor:(i + 1)*factor]
+            chunk[:part.shape[0], :cols] = part
+            small[i] = np.nanmean(chunk.reshape(factor, width, factor), axis=(0, 2))
+    return small
+
+
+def render(directory, png=None, max_size=1000):
+    """ Writes the map in directory as a PNG (by default apartment.png in
+        directory) with at most max_size pixels per side of the map.
+    """
+    from matplotlib.figure import Figure
+
+    with open(os.path.join(directory, META_FILE)) as f:
+        meta = json.load(f)
+    field = np.load(os.path.join(directory, MAP_FILE), mmap_mode='r')
+    factor = max(1, int(math.ceil(max(field.shape)/max_size)))
+    small = downsample(field, factor)
+
+    dx = meta['dx']
+    fig = Figure()
+    ax = fig.subplots()
+    image = ax.imshow(np.ma.masked_invalid(small), cmap='RdBu_r', interpolation='nearest',
+                      extent=(-dx/2, 3 + dx/2, -dx/2, 2 + dx/2))
+    fig.colorbar(image, ax=ax)
+    ax.set_title('Iterations = ' + str(meta['iterations']) + '. Mesh width = ' + str(dx) + 'm')
+    png = png if png is not None else os.path.join(directory, 'apartment.png')
+    fig.savefig(png, dpi=150)
+    return png
+
+
+if __name__=='__main__':
+    argparser = argparse.ArgumentParser(description='Render the apartment map written with main.py --output')
+    argparser.add_argument('directory', help='Directory with apartment.npy and meta.json')
+    argparser.add_argument('--png', help='PNG file (default apartment.png in the directory)')
+    argparser.add_argument('--max_size', type=int, default=1000, help='Maximum number of pixels per side of the map')
+    args = argparser.parse_args()
+    print('Written ' + render(args.directory, args.png, args.max_size))
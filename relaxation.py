@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+    Relaxation of the Dirichlet-Neumann interface iteration.
+
+    The interface values x (gamma1 and gamma2 stacked) satisfy a fixed point
+    equation x = F(x), where F is one sweep room 2 -> rooms 1 and 3. Given
+    the new values x_tilde = F(x) of the current iterate x, update() returns
+    the next iterate. Room 2 applies this to the stacked interface vector
+    when the relaxation is not 'fixed' (for 'fixed', rooms 1 and 3 relax
+    their own interface with the constant omega, as before).
+"""
+import numpy as np
+
+
+class AitkenRelaxation(object):
+    """ Aitken's dynamic relaxation: x_new = x + omega_k (x_tilde - x) with
+
+            omega_k = -omega_{k-1} r_{k-1}.(r_k - r_{k-1}) / |r_k - r_{k-1}|^2,
+
+        where r_k = x_tilde_k - x_k, starting from the given omega.
+    """
+    def __init__(self, omega):
+        self.omega = omega
+        self.x = None
+        self.r = None
+
+    def start(self, x0):
+        self.x = x0.copy()
+        self.r = None
+
+    def update(self, x_tilde):
+        r = x_tilde - self.x
+        if self.r is not None:
+            dr = r - self.r
+            dr_norm = np.dot(dr, dr)
+            if dr_norm > 0:
+                self.omega = -self.omega*np.dot(self.r, dr)/dr_norm
+        self.r = r
+        self.x = self.x + self.omega*r
+        return self.x
+
+
+class AndersonAcceleration(object):
+    """ Anderson acceleration with the last depth differences of iterates and
+        residuals r_k = x_tilde_k - x_k, and mixing parameter omega:
+
+            x_new = x + omega r - (dX + omega dR) c,   c = argmin |r - dR c|.
+    """
+    def __init__(self, omega, depth=5):
+        self.omega = omega
+        self.depth = depth
+        self.x = None
+
+    def start(self, x0):
+        self.x = x0.copy()
+        self.r = None
+        self.dX = []
+        self.dR = []
+
+    def update(self, x_tilde):
+        r = x_tilde - self.x
+        if self.r is not None:
+            self.dX.append(self.x - self.x_old)
+            self.dR.append(r - self.r)
+            if len(self.dX) > self.depth:
+                del self.dX[0], self.dR[0]
+        x_new = self.x + self.omega*r
+        if self.dR:
+            dX = np.column_stack(self.dX)
+            dR = np.column_stack(self.dR)
+            c = np.linalg.lstsq(dR, r, rcond=None)[0]
+            x_new -= (dX + self.omega*dR) @ c
+        self.x_old = self.x
+        self.r = r
+        self.x = x_new
+        return self.x
+
+
+RELAXATIONS = {
+    'aitken': AitkenRelaxation,
+    'anderson': AndersonAcceleration,
+}
+
+
+def make_relaxation(name, omega):
+    """ Returns the relaxation called name, or None for 'fixed'. """
+    if name == 'fixed':
+        return None
+    if name not in RELAXATIONS:
+        raise ValueError('Unknown relaxation: ' + str(name) + '. Choose from ' + ', '.join(['fixed'] + sorted(RELAXATIONS)))
+    return RELAXATIONS[name](omega)
@@ -1,17 +1,37 @@
 # -*- coding: utf-8 -*-
 import numpy as np
 import scipy.linalg as sl
-import scipy.sparse as sp
-from scipy.sparse.linalg import spsolve
 import time
-import sys
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 
+import assembly
+import boundary
+import communication
+import compact
+import graded
+import output
+import relaxation as relaxation_module
+import schur
+import solvers
+import tracing
+
+
+# Smallest tol for which a room in single precision sends its interface
+# vectors as float32.
+SINGLE_TOL = 1e-4
+
+# The orders in which the rooms can iterate (see solve_pipelined() and
+# solve_async()).
+ORDERINGS = ('lockstep', 'pipelined', 'async')
+
 
 class Room(object):
     
-    def __init__(self, com,room, dx, omega=0.9, max_iters=1000, wall_temp=15, heater_temp=40, win_temp=5, tol=1e-6, debug=False):
+    def __init__(self, com,room, dx, omega=0.9, max_iters=1000, wall_temp=15, heater_temp=40, win_temp=5, tol=1e-6, debug=False, solver='splu', preconditioner='multigrid', relaxation='fixed',
+                 interface='iterate', interface_cache=None, strip_com=None, shift=0, verbose=True, callback=None,
+                 cache=None, checkpoint=None, precision='double', stencil='five', grading=None, ordering='lockstep',
+                 staleness=2):
         ''' Initalizes the room object for the corresponding room number.
         '''
         self.com = com
@@ -25,20 +45,130 @@ class Room(object):
         self.max_iters = max_iters
         self.debug = debug
         self.tol = tol
+        self.solver = solver
+        self.preconditioner = preconditioner
+        self.relaxation = relaxation
+        self.interface = interface
+        self.interface_cache = interface_cache
+        self.strip_com = strip_com
+        self.verbose = verbose
+
+        # Persistent cache of factorizations and interface operators
+        # (a cache.Cache), see cache.py.
+        self.cache = cache
+
+        # Checkpoints of the iteration (a checkpoint.Checkpointer), and the
+        # iteration to start from when resuming one, with u_km1 and gamma0
+        # set from it (see checkpoint.py).
+        self.checkpoint = checkpoint
+        self.start_iter = 0
+
+        # With precision 'single', the linear solver is factorized in
+        # float32 and refined to tol (see solvers.RefinedSolver). The
+        # interface vectors are sent as float32 too, unless tol is below
+        # SINGLE_TOL: their rounding keeps the update from getting much
+        # below 1e-5, so the iteration would not converge.
+        self.precision = precision
+        self.dtype = np.float32 if precision == 'single' and tol >= SINGLE_TOL else np.float64
+
+        # The five-point stencil, or the fourth-order nine-point stencil,
+        # for which room 1 and 3 also have the interface nodes as unknowns
+        # (see compact.py).
+        self.stencil = stencil
+
+        # Graded meshes: the strengths (a1, a2, a3) of the grading of the
+        # rooms, and the grids of all rooms (room 2 interpolates between its
+        # nodes on the interfaces and those of room 1 and 3), see graded.py.
+        self.grading = graded.strengths(grading)
+        self.grids = graded.room_grids(self.N, self.grading) if self.grading is not None else None
+        self.grid = self.grids[room] if self.grids is not None else None
+
+        # The order of the iteration: 'lockstep' (room 2 waits for room 1
+        # and 3 and the other way round), 'pipelined' (room 1 and 3 solve
+        # with the Neumann data of the iteration before while room 2
+        # solves) or 'async' (every room uses the newest data it has; room 2
+        # uses data at most staleness of its iterations old). See
+        # solve_pipelined() and solve_async().
+        self.ordering = ordering
+        self.staleness = staleness
+
+        # callback(record) is called after every iteration of solve(), with
+        # the norms, times and bytes of the iteration (see tracing.py). The
+        # debug output is such a callback.
+        self.callback = callback
+        if debug and callback is None:
+            self.callback = tracing.print_record
+
+        # For time stepping (see transient.py): the operator is A - shift*I,
+        # source is added to b, and gamma0 is the initial guess of the
+        # interface values of room 1 and 3.
+        self.shift = shift
+        self.source = None
+        self.gamma0 = None
 
         assert (room < 4),'The rank is too high, you might be trying to initiate too many instances'
         assert (dx < 1/2), 'The mesh width, dx, should be smaller than 1/2.'
         assert (type(self.max_iters)==int), 'The number of iterations, max_iters, should be an integer.'
+        assert (interface in ('iterate', 'schur', 'gmres')), 'The interface solver should be iterate, schur or gmres.'
+        if checkpoint is not None and interface != 'iterate':
+            raise ValueError('Checkpoints only work with interface iterate.')
+        if stencil not in compact.STENCILS:
+            raise ValueError('The stencil should be ' + ' or '.join(compact.STENCILS) + '.')
+        if stencil == 'nine' and (shift or solvers.is_matrix_free(solver)):
+            raise ValueError('The nine-point stencil needs an assembled solver, and no time stepping.')
+        if self.grading is not None and (stencil != 'five' or shift or solvers.is_matrix_free(solver)
+                                         or (strip_com is not None and strip_com.Get_size() > 1)):
+            raise ValueError('Graded meshes need the five-point stencil, an assembled solver on one rank per room, '
+                             'and no time stepping.')
+        if ordering not in ORDERINGS:
+            raise ValueError('The ordering should be ' + ', '.join(ORDERINGS) + '.')
+        if ordering != 'lockstep' and (interface != 'iterate' or relaxation != 'fixed' or checkpoint is not None):
+            raise ValueError('The orderings pipelined and async need interface iterate, relaxation fixed '
+                             'and no checkpoints.')
+        if ordering == 'async' and staleness < 1:
+            raise ValueError('The staleness should be at least 1.')
+
+        # Batch mode: with arrays of K temperatures, K scenarios are solved at
+        # once, with b, u and the interface vectors as arrays with K columns
+        # (see sweep.py).
+        self.batch_shape = ()
+        if max(np.ndim(wall_temp), np.ndim(heater_temp), np.ndim(win_temp)) > 0:
+            self.wall_temp, self.heater_temp, self.window_temp = [np.array(temp, dtype=float) for temp in
+                                                                  np.broadcast_arrays(wall_temp, heater_temp, win_temp)]
+            self.batch_shape = self.wall_temp.shape
+            if solver not in solvers.MULTI_RHS:
+                raise ValueError('The batch mode needs a solver for several right-hand sides: ' + ', '.join(solvers.MULTI_RHS))
+            if relaxation != 'fixed' or interface != 'iterate':
+                raise ValueError('The batch mode only works with relaxation fixed and interface iterate.')
+            if ordering == 'async':
+                raise ValueError('The batch mode does not work with the ordering async.')
         
         self.u = None
         self.u_km1 = None
 
+        # With relaxation 'fixed', rooms 1 and 3 relax their interface values
+        # with omega. Otherwise room 2 relaxes the stacked interface vector,
+        # or solves for it directly (interface 'schur' or 'gmres').
+        self.relax = relaxation_module.make_relaxation(relaxation, omega)
+        self.relax_locally = self.relax is None and interface == 'iterate'
+
+        # A room with a strip communicator of several ranks is split into
+        # strips, one per rank (see strips.py).
+        if strip_com is not None and strip_com.Get_size() > 1:
+            self.solver = 'strips'
         
         # Create A (which is constant!) for room 1, 2 or 3.
         if room == 2:
             self.create_A_and_b_room2()
         else:
             self.create_A_and_b_room1_room3()
+
+        # Factorize A once. Every iteration in solve() then only needs a
+        # (cheap) solve with the factorization. Iterative solvers solve to a
+        # tenth of the tolerance of the Dirichlet-Neumann iteration.
+        self.linear_solver = solvers.make_solver(self.solver, self.A, self.shape, self.neumann, tol=self.tol/10,
+                                                preconditioner=self.preconditioner, strip_com=self.strip_com, shift=self.shift,
+                                                cache=self.cache, precision=self.precision)
        
 
 
@@ -48,74 +178,50 @@ class Room(object):
         """
         N = self.N    # Number of columns and rows of nodes
         size = N*N    # Number of unknown nodes.
+        if self.stencil == 'nine':
+            self.create_nine_point_room1_room3()
+            return
+        if self.grid is not None:
+            self.create_graded_room1_room3()
+            return
                 
         """ Create A """
-        # Fill the diagonal and Nth super/subdiagonals of A
-        diagonals = np.zeros(size)
-        diagonals[0] = -4
-        diagonals[N] = 1
-        A = sl.toeplitz(diagonals, diagonals)
-        
-        # Change the diagonal elements of all right boundary elements to -3 and fill the 
-        # subdiagonal entry with 1 (corresponding to the node on the left hand side 
-        # of the right boundary element element).
-        for i in range(1, N+1):
-            A[i*N - 1, i*N - 1] = -3
-            A[i*N - 1, i*N - 2] = 1
-    
-        # Change the subdiagonal entries for all left boundary values to 1
-        # (corresponding to the node on the right hand side of the left boundary element)
-        for i in range(0, N):
-            A[i*N, i*N + 1] = 1
-    
-        # Check if our grid contains elements inbetween the corner elements and
-        # in that case fill the super and subdiagonal elements on the same row with 
-        # 1, corresponding to the left and right nodes with respect to these elements
-        if N > 2:
-            for i in range(0, N):
-                for j in range(i*N + 1, i*N + N - 1):
-                    A[j, j - 1] = 1
-                    A[j, j + 1] = 1
+        # A is assembled directly in sparse form from its diagonals: -4 on the
+        # diagonal, 1 for the left/right/upper/lower neighbours, and -3 on the
+        # diagonal for all right boundary elements (the Neumann side).
+        # Matrix-free solvers only need the shape and the Neumann side.
+        self.shape = (N, N)
+        self.neumann = ('right',)
+        A = None
+        if not solvers.is_matrix_free(self.solver):
+            A = assembly.five_point_operator(N, N, neumann=self.neumann, shift=self.shift)
+        self.A = A
+
+        # The boundary: walls at the top and bottom, the heater on the left
+        # and the interface to room 2 (Neumann data) on the right.
+        self.boundary = boundary.Boundary(N, N)
+        self.boundary.add_fixed(self.boundary.side('top'), 'wall')
+        self.boundary.add_fixed(self.boundary.side('bottom'), 'wall')
+        self.boundary.add_fixed(self.boundary.side('left'), 'heater')
+        self.boundary.add_interface('gamma', self.boundary.side('right'))
+        self.create_b_room1_room3()
 
 
+    def create_b_room1_room3(self):
         """ Create b (without the values from the Neumann conditions given by
             room 2)
         """
-        b = np.zeros(size)
-
-        # Subtract the top boundary nodes with self.wall_temp
-        for i in range(0, N):
-            b[i] = b[i] - self.wall_temp
-        
-        # Subtract the bottom boundary nodes with self.wall_temp
-        for i in range(size-N,size):
-            b[i] = b[i] - self.wall_temp
-        
-            
-        # Subtract the most-left (near the left boundary elements) with self.heater_temp
-        for i in range(0, N):
-            b[i*N] = b[i*N] - self.heater_temp
-        
-        self.A = sp.csc_matrix(A,dtype=float).todense()
-        self.b = b
+        self.b = self.boundary.assemble(self.temperatures(), self.batch_shape)
     
     
     def update_b_room1_room3(self, gamma):
         """ 
         [Updating b]
         Updates the matrix b by subtracting the right border elements with the
-        new Neumann-condition values in every iteration.
+        new Neumann-condition values in every iteration. The corner nodes keep
+        their wall temperature as well.
         """
-        N = self.N
-        
-        # Subtract the most-right (near the right boundary) nodes with the 
-        # corresponding value given for the node by Neumann-conditions
-        for i in range(1, N+1):
-            self.b[i*N - 1] =  -gamma[i-1]
-            
-        # For the corner elements, subtract the self.wall_temp as well
-        self.b[N-1] -= self.wall_temp 
-        self.b[-1] -= self.wall_temp       
+        self.boundary.scatter(self.b, 'gamma', gamma)
             
         
     
@@ -126,91 +232,179 @@ class Room(object):
         M = int(round(height/self.dx)) - 1  # number of rows of nodes
         N = self.N                          # number of cols of nodes
         size = M*N                          # number of unknown nodes
+        if self.stencil == 'nine':
+            self.create_nine_point_room2(M)
+            return
+        if self.grid is not None:
+            self.create_graded_room2(M)
+            return
                 
         """ Create A """
-        # The bulk of A is very close to a toeplitz matrix with 5 diagonals.
-        first_row = np.zeros(size)
-        first_row[0] = -4
-        first_row[1] = 1
-        first_row[N] = 1
-        A = sl.toeplitz(first_row, first_row)
-        
-        # The two inner super- and subdiagonals of this toeplitz matrix need to
-        # be modified. Specifically, every N:th element should be set to zero,
-        # for a total of (M-1) times, since our grid has M rows, and only the
-        # first element to be set to zero goes "outside" of the matrix A.
-        #
-        # SUB: first zero goes in row N.
-        row = N
-        for i in range(M-1):
-            A[row, row-1] = 0
-            row += N
-        
-        # SUPER: first zero goes in row N-1.
-        row = N-1
-        for i in range(M-1):
-            A[row, row+1] = 0
-            row += N
-        
-        
-        # [Building b].
-        # Room 2 has 6 different (Dirichlet) boundaries. Of these, 2 change in every
-        # iteration, while 4 are constant. Here we initialize b,considering only the 
-        # 4 constant boundary conditions, while the other 2 are considered in 
-        # update_b_room2(), called in every iteration in solve().
-        b = np.zeros(size)
-        
-        # Upper bounndary:
-        b[:N] = -self.heater_temp
-        
-        # Lower boundary:
-        b[-N:] = -self.window_temp
-        
-        # Upper left boundary:
-        # Every N nodes are effected by the upper left boundary, and in total 
-        # N+1 nodes are effected. The first effected node is the 0:th node.
-        index = 0
-        for i in range(N+1):
-            b[index] -= self.wall_temp
-            index += N
-        
-        # Lower right boundary:
-        # Every N nodes are effected by the upper left boundary, and in total 
-        # N+1 nodes are effected. The first effected node is the (N^2+(N-1)):th node.
-        index = N**2 + (N-1)
-        for i in range(N+1):
-            b[index] -= self.wall_temp
-            index += N
-        self.A = sp.csc_matrix(A,dtype=float).todense()
-        self.b = b        
+        # A has 5 diagonals: -4 on the diagonal, 1 on the inner super- and
+        # subdiagonals (except every N:th element, where a row of nodes ends)
+        # and 1 on the N:th super- and subdiagonals. All sides are Dirichlet.
+        self.shape = (M, N)
+        self.neumann = ()
+        A = None
+        if not solvers.is_matrix_free(self.solver):
+            A = assembly.five_point_operator(M, N, shift=self.shift)
+        self.A = A
+
+        # Room 2 has 6 different (Dirichlet) boundaries: the heater at the
+        # top, the window at the bottom, a wall on the upper left (rows 0..N)
+        # and the lower right (rows N..2N), and the interfaces to room 3
+        # (upper right) and room 1 (lower left), which change in every
+        # iteration.
+        self.boundary = boundary.Boundary(M, N)
+        self.boundary.add_fixed(self.boundary.side('top'), 'heater')
+        self.boundary.add_fixed(self.boundary.side('bottom'), 'window')
+        self.boundary.add_fixed(self.boundary.side('left', 0, N+1), 'wall')
+        self.boundary.add_fixed(self.boundary.side('right', N, M), 'wall')
+        self.boundary.add_interface('gamma1', self.boundary.side('left', N+1, M))
+        self.boundary.add_interface('gamma2', self.boundary.side('right', 0, N))
+        self.create_b_room2()
+
+
+    def create_b_room2(self):
+        """ Creates b for room 2, without the interface values. """
+        self.b = self.boundary.assemble(self.temperatures(), self.batch_shape)
 
 
+    def create_nine_point_room1_room3(self):
+        """ A and b of room 1 (and 3, which is room 1 mirrored) for the
+            nine-point stencil. The last column of unknowns are the nodes on
+            the interface, whose equations get the Neumann data from room 2.
+        """
+        N = self.N
+        self.shape = (N, N + 1)
+        self.neumann = ()
+        self.boundary = compact.CompactBoundary(N, N + 1)
+        self.boundary.add_fixed(self.boundary.side('top', 0, N), 'wall')
+        self.boundary.add_fixed(self.boundary.side('bottom', 0, N), 'wall')
+        self.boundary.add_fixed(self.boundary.side('left'), 'heater')
+        for i in (-1, N):
+            self.boundary.add_fixed(self.boundary.node(i, -1), 'wall', 0.5)
+            self.boundary.add_fixed(self.boundary.node(i, -1), 'heater', 0.5)
+        # The ends of the interface: room 1 touches the wall of room 2 at the
+        # top and its window at the bottom, room 3 its heater at the top and
+        # its wall at the bottom.
+        top, bottom = self.boundary.node(-1, N), self.boundary.node(N, N)
+        if self.room == 1:
+            self.boundary.add_fixed(top, 'wall')
+            self.boundary.add_fixed(bottom, 'wall', 0.5)
+            self.boundary.add_fixed(bottom, 'window', 0.5)
+        else:
+            self.boundary.add_fixed(top, 'wall', 0.5)
+            self.boundary.add_fixed(top, 'heater', 0.5)
+            self.boundary.add_fixed(bottom, 'wall')
+        self.boundary.add_neumann('gamma', 'right')
+        self.A = self.boundary.operator()
+        self.create_b_room1_room3()
+
+    def create_nine_point_room2(self, M):
+        """ A and b of room 2 for the nine-point stencil. """
+        N = self.N
+        self.shape = (M, N)
+        self.neumann = ()
+        self.A = compact.nine_point_operator(M, N)
+        self.boundary = compact.CompactBoundary(M, N)
+        self.boundary.add_fixed(self.boundary.side('top'), 'heater')
+        self.boundary.add_fixed(self.boundary.side('bottom'), 'window')
+        self.boundary.add_fixed(self.boundary.side('left', 0, N+1), 'wall')
+        self.boundary.add_fixed(self.boundary.side('right', N, M), 'wall')
+        for j in (-1, N):
+            self.boundary.add_fixed(self.boundary.node(-1, j), 'wall', 0.5)
+            self.boundary.add_fixed(self.boundary.node(-1, j), 'heater', 0.5)
+            self.boundary.add_fixed(self.boundary.node(M, j), 'wall', 0.5)
+            self.boundary.add_fixed(self.boundary.node(M, j), 'window', 0.5)
+        self.boundary.add_interface('gamma1', 'left', N+1, M)
+        self.boundary.add_interface('gamma2', 'right', 0, N)
+        self.create_b_room2()
+
+    def create_graded_room1_room3(self):
+        """ A and b of room 1 (and 3) on a graded mesh. The data from room 2
+            is the integrated flux through the interface.
+        """
+        N = self.N
+        self.shape = (N, N)
+        self.neumann = ('right',)
+        self.A = self.grid.operator(self.neumann)
+        self.boundary = graded.GradedBoundary(N, N)
+        self.boundary.add_fixed(self.boundary.side('top'), 'wall', self.grid.weights('top'))
+        self.boundary.add_fixed(self.boundary.side('bottom'), 'wall', self.grid.weights('bottom'))
+        self.boundary.add_fixed(self.boundary.side('left'), 'heater', self.grid.weights('left'))
+        self.boundary.add_interface('gamma', self.boundary.side('right'))
+        self.create_b_room1_room3()
+
+    def create_graded_room2(self, M):
+        """ A and b of room 2 on a graded mesh. The interface values of room
+            1 and 3 are interpolated to its nodes on the interfaces (the node
+            in row N is at the height of the ends of both interfaces).
+        """
+        N = self.N
+        self.shape = (M, N)
+        self.neumann = ()
+        self.A = self.grid.operator()
+        left, right = self.grid.weights('left'), self.grid.weights('right')
+        self.boundary = graded.GradedBoundary(M, N)
+        self.boundary.add_fixed(self.boundary.side('top'), 'heater', self.grid.weights('top'))
+        self.boundary.add_fixed(self.boundary.side('bottom'), 'window', self.grid.weights('bottom'))
+        self.boundary.add_fixed(self.boundary.side('left', 0, N+1), 'wall', left[:N+1])
+        self.boundary.add_fixed(self.boundary.side('right', N, M), 'wall', right[N:])
+        y = self.grid.y
+        for name, nr, rows, side, weight, offset in (('gamma1', 1, slice(N+1, M), 'left', left, 1),
+                                                     ('gamma2', 3, slice(0, N), 'right', right, 0)):
+            # The nodes and cells of both rooms along the interface, in the
+            # coordinates of room 1 or 3 (from the top of the interface).
+            other = self.grids[nr].y
+            own = y[rows] - offset
+            start, stop = (y[N] - 1, 1) if nr == 1 else (0, y[N])
+            transfer = (graded.interpolation(other, own),
+                        graded.overlap(graded.cells(own, start, stop), graded.cells(other, 0, 1)))
+            self.boundary.add_interface(name, self.boundary.side(side, rows.start, rows.stop), weight[rows], transfer)
+        self.create_b_room2()
+
+    def interface_values(self, u, neumann):
+        """ The new interface values of room 1 or 3 from its solution u and
+            the Neumann data it was solved with: the nodes next to the
+            interface plus the difference room 2 has sent (on a graded mesh
+            its integrated flux, over the side of the cell and times the
+            distance to the interface), or for the nine-point stencil the
+            nodes on the interface.
+        """
+        if self.stencil == 'nine':
+            return self.boundary.gather(u, 'gamma')
+        if self.grid is not None:
+            return self.boundary.gather(u, 'gamma') + graded.scale(1/self.grid.weights('right'), neumann)
+        return self.boundary.gather(u, 'gamma') + neumann
+
+    def neumann_data(self, U, name, gamma, out):
+        """ The Neumann data room 2 sends on the interface name (gamma1 or
+            gamma2) into out: the difference between the nodes next to the
+            interface and its values gamma, on a graded mesh the integrated
+            fluxes on the nodes of room 1 or 3, or for the nine-point
+            stencil the part of the stencil of the interface nodes in room 2.
+        """
+        if self.stencil == 'nine' or self.grid is not None:
+            return self.boundary.flux(U, name, gamma, out)
+        return np.subtract(self.boundary.gather(U, name), gamma, out=out)
+
+    def field(self, u):
+        """ The temperatures of the nodes of the room, without the nodes on
+            the interface that room 1 and 3 have for the nine-point stencil.
+        """
+        if self.stencil == 'nine' and self.room != 2:
+            return u.reshape(self.shape + u.shape[1:])[:, :-1].reshape((self.N*self.N,) + u.shape[1:])
+        return u
+
     def update_b_room2(self, gamma1, gamma2):
         """ Updates the b-matrix for room 2, according to values in gamma1 and
-            gamma2. Note that for room 2, the A-matrix is constant.
+            gamma2. Note that for room 2, the A-matrix is constant. The two
+            corners next to the top and bottom keep their heater and window
+            temperature as well.
         """        
-        # Upper right boundary:
-        # Every N nodes are effected by the upper right boundary, and in total 
-        # N nodes are effected. The first effected node is the (N-1):th node.
-        N = self.N
-        index = N-1
-        for i in range(N):
-            self.b[index] = -gamma2[i]
-            index += N
-
-        # Lower left boundary:
-        # Every N nodes are effected by the lower left boundary, and in total 
-        # N nodes are effected. The first effected node is the (N^2+N):th node.
-        index = N**2 + N
-        for i in range(N):
-            self.b[index] = -gamma1[i]
-            index += N
-            
-        # Two corners:
-        # The above code has overwritten the b-values at two corners. There, the b-vector 
-        # should only have contributions from the outer wall:
-        self.b[N-1] -= self.heater_temp
-        self.b[-N] -= self.window_temp
+        self.boundary.scatter(self.b, 'gamma1', gamma1)
+        self.boundary.scatter(self.b, 'gamma2', gamma2)
 
 
 
@@ -226,175 +420,469 @@ class Room(object):
         room = self.room
         N = self.N
 
+        if self.ordering == 'async':
+            return self.solve_async()
+        if self.ordering == 'pipelined' and room != 2:
+            return self.solve_pipelined()
+
         if room == 1:
             # gamma1 is here (and in room 3) initialized arbitrarily as a first guess.
             # We chose the average of all the wall temperatures of the room.
-            gamma1 = np.ones(N)*(self.heater_temp + 2*self.wall_temp)/3
+            gamma1 = np.ones((N,) + self.batch_shape)*(self.heater_temp + 2*self.wall_temp)/3
+            if self.gamma0 is not None:
+                gamma1 = self.gamma0
             gamma1_km1 = gamma1
-            self.com.send(gamma1,dest=1)
-            if self.debug:
-                time_1 = time.time()*1000
-            for i in range(self.max_iters):
-                if self.debug:
-                    print('Time since last iteration = ' + str(time.time()*1000-time_1)+'ms')
-                    print('Omega 1 iteration : ' + str(i)+'\n')
-                    time_1 = time.time()*1000
-                    sys.stdout.flush()
-                gamma1 = self.com.recv(source=1)
-                
-                if gamma1 is False: # We are done with our iteration.
+            neumann = np.empty((N,) + self.batch_shape, dtype=self.dtype) # Buffer for the Neumann data received from room 2.
+            communication.send_interface(self.com, gamma1, dest=1, dtype=self.dtype)
+            for i in range(self.start_iter, self.max_iters):
+                start = time.time()
+                if not communication.recv_interface(self.com, neumann, source=1):
+                    # We are done with our iteration.
                     gamma1 = gamma1_km1
                     break
-                
+                received = time.time()
+                gamma1 = neumann
 
                 self.update_b_room1_room3(gamma=gamma1)
 
-                u  = sl.solve(self.A,self.b)                
+                u = self.linear_solver.solve(self.rhs(), x0=self.u_km1)                
+                solved = time.time()
 
                 # We want to update gamma1 to only contain the temperature values of the boundary nodes
                 # that lie between room 1 and 2, since this will be used for the Dirichlet conditions
                 # in room 2 in the next iteration. This is done by utilizing the Neumann condition and 
                 # gamma1 that was supplied by room 2. 
-                gamma1_temp = u[N-1::N]
-                if i != 0:
-                    gamma1 = self.omega*(gamma1_temp + gamma1) + (1-self.omega)*gamma1_km1                                
-                    self.com.send(gamma1,dest=1)
+                gamma1_temp = self.interface_values(u, gamma1)
+                if i != 0 and self.relax_locally:
+                    gamma1 = self.omega*gamma1_temp + (1-self.omega)*gamma1_km1                                
+                    communication.send_interface(self.com, gamma1, dest=1, dtype=self.dtype)
                     u = self.omega*u + (1-self.omega)*self.u_km1
                 else:
-                    gamma1 = gamma1_temp + gamma1
-                    self.com.send(gamma1,dest=1)
+                    gamma1 = gamma1_temp
+                    communication.send_interface(self.com, gamma1, dest=1, dtype=self.dtype)
+
+                if self.callback is not None:
+                    self.trace(i, start, received - start, solved - received, u - self.u_km1 if i != 0 else None,
+                               gamma1 - gamma1_km1, gamma1.nbytes, neumann.nbytes)
                     
                 gamma1_km1 = gamma1
                 self.u_km1=u
+                if self.checkpoint is not None:
+                    self.checkpoint.save(i+1, u=u, gamma=gamma1)
                 
-            return u, gamma1
+            return self.field(u), gamma1
         
+        if room == 2 and self.interface != 'iterate':
+            return self.solve_interface()
+
         if room == 2:
-            for j in range(self.max_iters):
-                gamma1 = self.com.recv(source=0)
-                gamma2 = self.com.recv(source=2)
+            # Preallocated buffers for the interface values received from room 1
+            # and 3, and for the Neumann data sent back to them.
+            gamma1 = np.empty((N,) + self.batch_shape, dtype=self.dtype)
+            gamma2 = np.empty((N,) + self.batch_shape, dtype=self.dtype)
+            flux1 = np.empty((N,) + self.batch_shape, dtype=self.dtype)
+            flux2 = np.empty((N,) + self.batch_shape, dtype=self.dtype)
+            recv_requests = [communication.irecv_interface(self.com, gamma1, source=0),
+                             communication.irecv_interface(self.com, gamma2, source=2)]
+            send_requests = []
+            for j in range(self.start_iter, self.max_iters):
+                start = time.time()
+                communication.wait_all(recv_requests + send_requests)
+                received = time.time()
+
+                # Dynamic relaxation: room 1 and 3 have sent unrelaxed values,
+                # relax the stacked interface vector [gamma1, gamma2] here.
+                if self.relax is not None:
+                    if j == self.start_iter:
+                        self.relax.start(np.concatenate((gamma1, gamma2)))
+                    else:
+                        x = self.relax.update(np.concatenate((gamma1, gamma2)))
+                        gamma1[:] = x[:N]
+                        gamma2[:] = x[N:]
                 
                 self.update_b_room2(gamma1=gamma1, gamma2=gamma2)
                 
-                U  = sl.solve(self.A,self.b)
-
-                gamma1_temp = U[N**2+N::N]
-                gamma2_temp = U[N-1::N]
-                gamma2_temp = gamma2_temp[:N]
+                U = self.linear_solver.solve(self.rhs(), x0=self.u_km1)
+                solved = time.time()
 
                 # the Neumann conditions, since we do the same for 
                 # our A matrices.
-                gamma1 = gamma1_temp - gamma1 
-                gamma2 = gamma2_temp - gamma2
-
-                # Send these gammas to room 1 and 3 -- unless we are done,
-                # in which case we send "False" to communicate this.
-                if j == 0:
-                    self.com.send(gamma1,dest=0)
-                    self.com.send(gamma2,dest=2)
-                else:                    
-                    if sl.norm(U - self.u_km1, 2) < self.tol:
-                        self.max_iters = j+1
+                self.neumann_data(U, 'gamma1', gamma1, out=flux1)
+                self.neumann_data(U, 'gamma2', gamma2, out=flux2)
+
+                # Send these fluxes to room 1 and 3 -- unless we are done,
+                # in which case we send a TAG_DONE message to communicate this.
+                update = self.update_norm(U - self.u_km1) if j != 0 else None
+                done = update is not None and update < self.tol
+                if self.callback is not None:
+                    self.trace(j, start, received - start, solved - received, update, np.concatenate((flux1, flux2)),
+                               0 if done else flux1.nbytes + flux2.nbytes, gamma1.nbytes + gamma2.nbytes)
+                if done:
+                    self.max_iters = j+1
+                    if self.verbose:
                         print('Algorithm finished after ' + str(j+1) + ' iterations.')
-                        self.com.send(False, dest=0)
-                        self.com.send(False, dest=2)
-                        break
-                    else:
-                        self.com.send(gamma1,dest=0)
-                        self.com.send(gamma2,dest=2)
+                    communication.send_done(self.com, dest=0)
+                    communication.send_done(self.com, dest=2)
+                    if self.ordering == 'pipelined':
+                        # Room 1 and 3 have sent the interface values of one
+                        # more iteration, solved while we solved this one.
+                        communication.recv_interface(self.com, gamma1, source=0)
+                        communication.recv_interface(self.com, gamma2, source=2)
+                    break
+                send_requests = [communication.isend_interface(self.com, flux1, dest=0),
+                                 communication.isend_interface(self.com, flux2, dest=2)]
+                
+                # Post the receives for the next iteration right away, so that
+                # they are ready while room 1 and 3 solve.
+                recv_requests = [communication.irecv_interface(self.com, gamma1, source=0),
+                                 communication.irecv_interface(self.com, gamma2, source=2)]
                         
                 # Relaxation:                        
-                if j != 0:
+                if j != 0 and self.relax is None:
                     U = self.omega*U + (1-self.omega)*self.u_km1
                 
                 self.u_km1 = U
-                
-                if self.debug:
-                    print('Omega 2 iteration : ' + str(j)+'\n')
-                    sys.stdout.flush()
+                if self.checkpoint is not None:
+                    self.checkpoint.save(j+1, u=U)
+            communication.wait_all(recv_requests + send_requests)
             return U, None
 
         if room == 3:
-            gamma2 = np.ones(N)*(self.heater_temp + 2*self.wall_temp)/3
+            gamma2 = np.ones((N,) + self.batch_shape)*(self.heater_temp + 2*self.wall_temp)/3
+            if self.gamma0 is not None:
+                gamma2 = self.gamma0
             gamma2_km1 = gamma2
-            self.com.send(gamma2,dest=1)
+            neumann = np.empty((N,) + self.batch_shape, dtype=self.dtype) # Buffer for the Neumann data received from room 2.
+            communication.send_interface(self.com, gamma2, dest=1, dtype=self.dtype)
             
-            for k in range(self.max_iters):
-                gamma2 = self.com.recv(source=1)
-                if gamma2 is False: # We are done with our iteration.
+            for k in range(self.start_iter, self.max_iters):
+                start = time.time()
+                if not communication.recv_interface(self.com, neumann, source=1):
+                    # We are done with our iteration.
                     gamma2 = gamma2_km1
                     break
+                received = time.time()
+                gamma2 = neumann
                 
                 self.update_b_room1_room3(gamma=gamma2)
-                u = sl.solve(self.A,self.b)
+                u = self.linear_solver.solve(self.rhs(), x0=self.u_km1)
+                solved = time.time()
                   
 
-                gamma2_temp = u[N-1::N]
+                gamma2_temp = self.interface_values(u, gamma2)
                 
-                if k != 0:
+                if k != 0 and self.relax_locally:
                     u = self.omega*u + (1-self.omega)*self.u_km1
-                    gamma2 = self.omega*(gamma2_temp + gamma2) + (1-self.omega)*gamma2_km1
-                    self.com.send(gamma2,dest=1)
+                    gamma2 = self.omega*gamma2_temp + (1-self.omega)*gamma2_km1
+                    communication.send_interface(self.com, gamma2, dest=1, dtype=self.dtype)
                 else:
-                    gamma2 = gamma2_temp +gamma2
-                    self.com.send(gamma2,dest=1)
-                    
-                if self.debug:
-                    print('Omega 3 iteration : ' + str(k)+'\n')
-                    sys.stdout.flush()
+                    gamma2 = gamma2_temp
+                    communication.send_interface(self.com, gamma2, dest=1, dtype=self.dtype)
+
+                if self.callback is not None:
+                    self.trace(k, start, received - start, solved - received, u - self.u_km1 if k != 0 else None,
+                               gamma2 - gamma2_km1, gamma2.nbytes, neumann.nbytes)
                 
                 self.u_km1=u
                 gamma2_km1 = gamma2
-            return u, gamma2
+                if self.checkpoint is not None:
+                    self.checkpoint.save(k+1, u=u, gamma=gamma2)
+            return self.field(u), gamma2
         
+    def initial_gamma(self):
+        """ The first guess of the interface values of room 1 or 3: the
+            average of the wall temperatures of the room, or gamma0.
+        """
+        if self.gamma0 is not None:
+            return self.gamma0
+        return np.ones((self.N,) + self.batch_shape)*(self.heater_temp + 2*self.wall_temp)/3
+
+    def solve_pipelined(self):
+        """ Room 1 and 3 part of solve() with the ordering 'pipelined'. In
+            lockstep room 1 and 3 wait while room 2 solves and the other way
+            round. Here, after the first iteration, the room solves with the
+            Neumann data room 2 sent in the iteration before and sends its
+            interface values before it receives the data room 2 has computed
+            in the meantime, so that both solve at the same time. Room 2 runs
+            its usual loop.
+
+            This is the Jacobi version of the (Gauss-Seidel) lockstep
+            iteration: it has the same fixed point, but the even and odd
+            iterations are two separate iterations, so it needs about twice
+            as many iterations or more, and a smaller omega (about 0.3 instead
+            of 0.5). Extrapolating the data linearly from the last two
+            iterations instead diverges for omega from 0.5 on: the errors of
+            the lagged iteration alternate in sign.
+        """
+        gamma = self.initial_gamma()
+        gamma_km1 = gamma
+        neumann = np.empty((self.N,) + self.batch_shape, dtype=self.dtype) # Buffer for the Neumann data received from room 2.
+        communication.send_interface(self.com, gamma, dest=1, dtype=self.dtype)
+        for i in range(self.max_iters):
+            start = time.time()
+            if i == 0:
+                communication.recv_interface(self.com, neumann, source=1)
+            received = time.time()
+
+            self.update_b_room1_room3(gamma=neumann)
+            u = self.linear_solver.solve(self.rhs(), x0=self.u_km1)
+            solved = time.time()
+
+            gamma = self.interface_values(u, neumann)
+            if i != 0:
+                gamma = self.omega*gamma + (1-self.omega)*gamma_km1
+                u = self.omega*u + (1-self.omega)*self.u_km1
+            communication.send_interface(self.com, gamma, dest=1, dtype=self.dtype)
+
+            # The data room 2 has computed from the values we sent last time,
+            # for the next iteration.
+            waited = 0
+            done = False
+            if i != 0:
+                waited = time.time()
+                done = not communication.recv_interface(self.com, neumann, source=1)
+                waited = time.time() - waited
+
+            if self.callback is not None:
+                self.trace(i, start, received - start + waited, solved - received, u - self.u_km1 if i != 0 else None,
+                           gamma - gamma_km1, gamma.nbytes, 0 if done else neumann.nbytes)
+            gamma_km1 = gamma
+            self.u_km1 = u
+            if done:
+                break
+        return self.field(u), gamma
+
+    def solve_async(self):
+        """ solve() with the ordering 'async': no room waits for data it
+            already has a recent enough version of. Room 1 and 3 solve
+            whenever new Neumann data has arrived, with the newest, and send
+            their interface values with the norm of their last update
+            appended. Room 2 solves with the newest interface values it has
+            from each of them, and only waits for one whose values are
+            staleness of its iterations old (or for the older one if neither
+            has sent anything new, since solving with the same data again
+            gives the same result). With staleness 1 this is lockstep.
+
+            Room 2 stops when its own update and the last updates room 1 and
+            3 have sent are below tol. It then sends TAG_DONE to both and
+            receives what they have sent until each has answered with
+            TAG_DONE, so that no message is left over. All rooms send without
+            waiting for the receive (communication.post_interface()), since
+            room 2 and room 1 or 3 may send to each other at the same time.
+        """
+        N = self.N
+        if self.room != 2:
+            gamma = self.initial_gamma()
+            gamma_km1 = gamma
+            neumann = np.empty(N, dtype=self.dtype)
+            sends = []
+            communication.post_interface(self.com, np.append(gamma, np.inf), 1, sends, dtype=self.dtype)
+            i = 0
+            while True:
+                start = time.time()
+                count, done = communication.recv_latest(self.com, neumann, source=1, block=True)
+                if done:
+                    communication.send_done(self.com, dest=1)
+                    communication.wait_all([request for request, buf in sends])
+                    break
+                received = time.time()
+
+                self.update_b_room1_room3(gamma=neumann)
+                u = self.linear_solver.solve(self.rhs(), x0=self.u_km1)
+                solved = time.time()
+
+                gamma = self.interface_values(u, neumann)
+                update = np.inf
+                if i != 0:
+                    gamma = self.omega*gamma + (1-self.omega)*gamma_km1
+                    u = self.omega*u + (1-self.omega)*self.u_km1
+                    update = self.update_norm(u - self.u_km1)
+                communication.post_interface(self.com, np.append(gamma, update), 1, sends, dtype=self.dtype)
+                if self.callback is not None:
+                    self.trace(i, start, received - start, solved - received, update if i != 0 else None,
+                               gamma - gamma_km1, gamma.nbytes, count*neumann.nbytes)
+                gamma_km1 = gamma
+                self.u_km1 = u
+                i += 1
+            return self.field(u), gamma
+
+        # The interface values of room 1 and 3, each followed by the norm of
+        # the last update of the room, and the iteration in which they were
+        # last new.
+        values = {0: np.empty(N + 1, dtype=self.dtype), 2: np.empty(N + 1, dtype=self.dtype)}
+        fresh = {0: -self.staleness, 2: -self.staleness}
+        flux1 = np.empty(N, dtype=self.dtype)
+        flux2 = np.empty(N, dtype=self.dtype)
+        sends = []
+        for j in range(self.max_iters):
+            start = time.time()
+            count = 0
+            for source in (0, 2):
+                new = communication.recv_latest(self.com, values[source], source,
+                                                block=j - fresh[source] >= self.staleness)[0]
+                if new:
+                    fresh[source] = j
+                    count += new
+            if count == 0:
+                source = min(fresh, key=fresh.get)
+                count = communication.recv_latest(self.com, values[source], source, block=True)[0]
+                fresh[source] = j
+            received = time.time()
+
+            gamma1 = values[0][:N]
+            gamma2 = values[2][:N]
+            self.update_b_room2(gamma1=gamma1, gamma2=gamma2)
+            U = self.linear_solver.solve(self.rhs(), x0=self.u_km1)
+            solved = time.time()
+            self.neumann_data(U, 'gamma1', gamma1, out=flux1)
+            self.neumann_data(U, 'gamma2', gamma2, out=flux2)
+
+            update = self.update_norm(U - self.u_km1) if j != 0 else None
+            done = update is not None and max(update, values[0][N], values[2][N]) < self.tol
+            if self.callback is not None:
+                self.trace(j, start, received - start, solved - received, update, np.concatenate((flux1, flux2)),
+                           0 if done else flux1.nbytes + flux2.nbytes, count*values[0].nbytes)
+            if done:
+                break
+            communication.post_interface(self.com, flux1, 0, sends, dtype=self.dtype)
+            communication.post_interface(self.com, flux2, 2, sends, dtype=self.dtype)
+            if j != 0:
+                U = self.omega*U + (1-self.omega)*self.u_km1
+            self.u_km1 = U
+
+        self.max_iters = j+1
+        if self.verbose:
+            print('Algorithm finished after ' + str(j+1) + ' iterations.')
+        for source in (0, 2):
+            communication.send_done(self.com, dest=source)
+        for source in (0, 2):
+            while not communication.recv_latest(self.com, values[source], source, block=True)[1]:
+                pass
+        communication.wait_all([request for request, buf in sends])
+        return U, None
+
+    def temperatures(self):
+        """ The fixed temperatures by name, for Boundary.assemble(). """
+        return {'wall': self.wall_temp, 'heater': self.heater_temp, 'window': self.window_temp}
+
+    def create_b(self):
+        """ Creates b again, after the temperatures have changed. """
+        if self.room == 2:
+            self.create_b_room2()
+        else:
+            self.create_b_room1_room3()
+
+    def rhs(self):
+        """ The right-hand side of the linear system: b, plus the source of
+            a time step.
+        """
+        if self.source is None:
+            return self.b
+        return self.b + self.source
+
+    def trace(self, iteration, start, recv_time, solve_time, update, interface, bytes_sent, bytes_received):
+        """ Passes the record of one iteration to the callback. update is the
+            change of the field (or its norm), interface the change of the
+            interface values (room 1 and 3) or the Neumann data (room 2).
+        """
+        if update is not None and np.ndim(update) > 0:
+            update = self.update_norm(update)
+        self.callback({'room': self.room, 'iteration': iteration, 'start': start, 'end': time.time(),
+                       'recv_time': recv_time, 'solve_time': solve_time,
+                       'update_norm': None if update is None else float(update),
+                       'interface_norm': float(self.update_norm(interface)),
+                       'bytes_sent': int(bytes_sent), 'bytes_received': int(bytes_received)})
+
+    def update_norm(self, du):
+        """ The 2-norm of the update du, in batch mode the largest 2-norm of
+            the columns, so that every scenario has converged.
+        """
+        if du.ndim == 1:
+            return sl.norm(du, 2)
+        return np.linalg.norm(du, axis=0).max()
+
+    def solve_interface(self):
+        """ Room 2 part of solve() when the interface values are solved for
+            directly (see schur.py) instead of iterated. Room 1 and 3 run
+            their usual loop without relaxation; every evaluation of F below
+            is one iteration (sweep) of that loop.
+        """
+        N = self.N
+        gamma1 = np.empty(N, dtype=self.dtype)
+        gamma2 = np.empty(N, dtype=self.dtype)
+        flux1 = np.empty(N, dtype=self.dtype)
+        flux2 = np.empty(N, dtype=self.dtype)
+        
+        # The first messages from room 1 and 3 are their initial guesses.
+        communication.recv_interface(self.com, gamma1, source=0)
+        communication.recv_interface(self.com, gamma2, source=2)
+        x0 = np.concatenate((gamma1, gamma2))
+        self.sweeps = 0
+        
+        def F(x):
+            # Solve room 2 with the Dirichlet data x, send the Neumann data
+            # to room 1 and 3 and return the interface values they compute.
+            start = time.time()
+            self.update_b_room2(gamma1=x[:N], gamma2=x[N:])
+            U = self.linear_solver.solve(self.rhs(), x0=self.u_km1)
+            solved = time.time()
+            self.neumann_data(U, 'gamma1', x[:N], out=flux1)
+            self.neumann_data(U, 'gamma2', x[N:], out=flux2)
+            communication.send_interface(self.com, flux1, dest=0)
+            communication.send_interface(self.com, flux2, dest=2)
+            communication.recv_interface(self.com, gamma1, source=0)
+            communication.recv_interface(self.com, gamma2, source=2)
+            if self.callback is not None:
+                self.trace(self.sweeps, start, time.time() - solved, solved - start,
+                           U - self.u_km1 if self.u_km1 is not None else None, np.concatenate((flux1, flux2)),
+                           flux1.nbytes + flux2.nbytes, gamma1.nbytes + gamma2.nbytes)
+            self.u_km1 = U
+            self.sweeps += 1
+            return np.concatenate((gamma1, gamma2))
+        
+        if self.interface == 'schur':
+            cache = None
+            store = None
+            if self.interface_cache is not None:
+                cache = schur.cache_file(self.interface_cache, N, self.solver, self.stencil, self.grading)
+            elif self.cache is not None:
+                store = (self.cache, {'N': N, 'shift': self.shift, 'stencil': self.stencil, 'grading': self.grading,
+                                      'solver': self.solver, 'precision': self.precision, 'tol': self.tol})
+            x = schur.solve_assembled(F, 2*N, cache, store)
+        else:
+            x = schur.solve_gmres(F, x0, self.tol/10)
+        
+        # A last sweep with the converged interface values gives the final
+        # fields of all rooms.
+        F(x)
+        communication.send_done(self.com, dest=0)
+        communication.send_done(self.com, dest=2)
+        self.max_iters = self.sweeps
+        if self.verbose:
+            print('Interface problem solved after ' + str(self.sweeps) + ' sweeps.')
+        return self.u_km1, None
+
+    def __getstate__(self):
+        """ A room is pickled (by the pipes backend of local_comm.py) without
+            its communicators and solver, which can not be pickled.
+        """
+        state = dict(self.__dict__)
+        state['com'] = None
+        state['strip_com'] = None
+        state['linear_solver'] = None
+        return state
+
     def plot_apartment(self,U1,U2,U3,gamma1,gamma2):
         fig, ax = plt.subplots()
         dx = self.dx
         N = self.N  #int(1/dx-1)
         M = int(2/dx -1)  #int(2/dx-1)  
-        #assemble_room_1
-        # 3 boundaries, size (N+2)*(N+1)
-        
-        room1 = np.zeros((N+2,N+1)) # np.linspace(1,2,(N+2)*(N+1)).reshape(((N+2),(N+1)))
-        room1[1:-1,1:] = U1.reshape((N,N))
-        room1[:,0] = self.heater_temp
-        room1[0,:] = self.wall_temp
-        room1[-1,:] = self.wall_temp
-        room1[0,0] = (self.wall_temp+self.heater_temp)/2
-        room1[-1,0] = (self.wall_temp+self.heater_temp)/2
-        # assemble room_2
-        # six bounadies
-        
-        room2= np.zeros((M+2,N+2))
-        room2[1:-1,1:-1] = U2.reshape((M,N))
-        room2[0,:]= self.heater_temp # upper boundary
-        room2[1:N+1,-1] = gamma2 # gamma 2 boundary
-        room2[N+1:,-1] = self.wall_temp 
-        room2[-1,:] = self.window_temp
-        room2[N+2:-1,0] = gamma1 # gamma 1 bound
-        room2[:N+2,0] = self.wall_temp
-        room2[0,0] = (self.wall_temp+self.heater_temp)/2
-        room2[0,-1] = (self.wall_temp+self.heater_temp)/2
-        room2[-1,0] = (self.wall_temp+self.window_temp)/2
-        #assemble_room_3
-        # 3 boundaries, size (N+2)*(N+1)
-
-        room3= np.zeros((N+2,N+1)) #np.ones((N+2,N+1))
-        room3[1:-1,:-1] = np.flip(U3.reshape((N,N)),axis=1)
-        room3[:,-1] = self.heater_temp
-        room3[0,:] = self.wall_temp
-        room3[-1,:] = self.wall_temp
-        room3[0,-1] = (self.wall_temp+self.heater_temp)/2
-        room3[-1,-1] = (self.wall_temp+self.heater_temp)/2
-        #Assemble heat map
-        
-        Map = np.zeros((M+2,N*3+4))
-        Map[-(N+2):,:N+1] = room1 #room 1
-        Map[:,N+1:N*2+3] = room2 # room 2
-        Map[0:N+2,N*2+3:] = room3 # room 3
+        # The map of the whole apartment, NaN outside the rooms (see output.py).
+        Map = output.apartment_map(N, {1: (U1, gamma1), 2: (U2, None), 3: (U3, gamma2)},
+                                   self.wall_temp, self.heater_temp, self.window_temp, self.grids)
         
         X, Y = np.meshgrid(np.linspace(-dx/2, 3+dx/2, (N*3+4)),np.linspace(2+dx/2, -dx/2, (M+2)))
-        levels = MaxNLocator(nbins=50).tick_values(Map.min(), Map.max())
+        levels = MaxNLocator(nbins=50).tick_values(np.nanmin(Map), np.nanmax(Map))
         # make the plot
         #c = ax.pcolormesh(X, Y, Map, cmap='RdBu', vmin=0, vmax=Map.max(),)
         #y, x = np.mgrid[slice(0, 2 + dx, dx),slice(0, 3 + dx, dx)]
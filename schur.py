@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+    Direct solution of the interface problem.
+
+    One Dirichlet-Neumann sweep maps the interface values x = [gamma1, gamma2]
+    (Dirichlet data of room 2) to the new values x_tilde = F(x) computed by
+    rooms 1 and 3. The problem is linear, so F(x) = K x + c, and the
+    converged interface values solve the 2N x 2N Schur complement (Steklov-
+    Poincare) system
+
+        (I - K) x = c.
+
+    It is solved either by assembling K from the responses to unit interface
+    data (2N+1 sweeps, but K only depends on the mesh and can be cached, so
+    that later runs need 2 sweeps), or matrix-free with GMRES where every
+    matrix-vector product is one sweep.
+"""
+import os
+import warnings
+
+import numpy as np
+import scipy.linalg as sl
+from scipy.sparse.linalg import LinearOperator, gmres
+
+
+def assemble(F, n):
+    """ Returns K and c of the affine map F(x) = K x + c on vectors of size n,
+        using n+1 evaluations of F.
+    """
+    c = F(np.zeros(n))
+    K = np.empty((n, n))
+    e = np.zeros(n)
+    for i in range(n):
+        e[i] = 1
+        K[:, i] = F(e) - c
+        e[i] = 0
+    return K, c
+
+
+def cache_file(cache_dir, N, solver, stencil='five', grading=None):
+    suffix = '' if stencil == 'five' else '_' + stencil
+    if grading is not None:
+        suffix += '_graded' + '-'.join('%g' % a for a in grading)
+    return os.path.join(cache_dir, 'interface_N%d_%s%s.npy' % (N, solver, suffix))
+
+
+def solve_assembled(F, n, cache=None, store=None):
+    """ Solves x = F(x) with the assembled operator. If cache is the name of
+        a file with K from an earlier run, only c = F(0) is evaluated;
+        otherwise K is assembled and saved there. store = (Cache, key) keeps
+        K in a cache of cache.py instead.
+    """
+    K = None
+    if cache is not None and os.path.exists(cache):
+        K = np.load(cache)
+    elif store is not None:
+        stored = store[0].load('interface', store[1])
+        K = stored['K'] if stored else None
+    if K is not None:
+        c = F(np.zeros(n))
+    else:
+        K, c = assemble(F, n)
+        if cache is not None:
+            os.makedirs(os.path.dirname(cache) or '.', exist_ok=True)
+            np.save(cache, K)
+        elif store is not None:
+            store[0].store('interface', store[1], {'K': K})
+    return sl.solve(np.eye(n) - K, c)
+
+
+def solve_gmres(F, x0, tol):
+    """ Solves (I - K) x = c matrix-free with GMRES, starting from x0. The
+        residual is reduced to tol (in the 2-norm); if GMRES stops before,
+        it warns and returns its last iterate (room 1 and 3 still wait for
+        the last sweep, so room 2 can not just raise).
+    """
+    n = len(x0)
+    c = F(np.zeros(n))
+    operator = LinearOperator((n, n), matvec=lambda v: v - (F(v) - c), dtype=float)
+    x, info = gmres(operator, c, x0=x0, rtol=0, atol=tol, restart=n, maxiter=n)
+    if info != 0:
+        warnings.warn('GMRES did not reach the tolerance ' + str(tol) + ' of the interface problem (info = '
+                      + str(info) + ').', RuntimeWarning)
+    return x
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+    Linear solver backends for the rooms.
+
+    The matrix A of a room never changes, so every backend does its expensive
+    work (factorization) once when it is created, and solve(b) is then cheap.
+    Backends are looked up by name in SOLVERS; use make_solver() to create one.
+    Matrix-free backends (matrix_free = True) only need the grid shape and the
+    Neumann sides of the room, so the room does not have to assemble A for them.
+    solve(b, x0) takes an initial guess x0, which only iterative backends use.
+    Backends with factors() and from_factors() can be loaded from a cache
+    (see cache.py) instead of being factorized again: the dense ones. The
+    factors of splu (SuperLU) and CHOLMOD can not be built again from
+    arrays, and the matrix-free backends have nothing expensive to cache, so
+    make_solver() warns when it is given a cache for any other backend. With precision
+    'single', an assembled backend is factorized in float32 and its solves
+    are refined against the float64 residual (see RefinedSolver).
+"""
+import warnings
+
+import numpy as np
+import scipy.linalg as sl
+import scipy.sparse as sp
+from scipy.sparse.linalg import splu, spsolve
+
+import cache as cache_module
+from fast_poisson import FastPoissonSolver
+from krylov import KrylovSolver
+from multigrid import MultigridSolver
+from strips import StripSolver
+
+try:
+    from sksparse.cholmod import cholesky as cholmod_cholesky
+except ImportError:
+    cholmod_cholesky = None
+
+
+# Largest number of unknowns for which the 'cholesky' backend falls back to a
+# dense factorization when CHOLMOD is not installed.
+DENSE_LIMIT = 2000
+
+# Largest number of unknowns accepted by the dense solver at all; above this
+# the dense matrix alone needs more than ~1 GB.
+DENSE_MAX = 10000
+
+
+class SpsolveSolver(object):
+    """ No factorization: calls spsolve (and thus factorizes A) on every solve.
+        This is the old behaviour, kept as a reference for benchmarks.
+    """
+    matrix_free = False
+
+    def __init__(self, A, shape=None, neumann=(), **options):
+        self.A = sp.csc_matrix(A)
+
+    def solve(self, b, x0=None):
+        return spsolve(self.A, b)
+
+
+class DenseLUSolver(object):
+    """ Dense LU factorization (scipy.linalg.lu_factor), for small grids. """
+    matrix_free = False
+
+    def __init__(self, A, shape=None, neumann=(), **options):
+        if A.shape[0] > DENSE_MAX:
+            raise ValueError('Too many unknowns for the dense solver, use splu instead.')
+        A = A.toarray() if sp.issparse(A) else np.asarray(A)
+        self.lu_piv = sl.lu_factor(A)
+
+    def solve(self, b, x0=None):
+        return sl.lu_solve(self.lu_piv, b)
+
+    def factors(self):
+        return {'lu': self.lu_piv[0], 'piv': self.lu_piv[1]}
+
+    @classmethod
+    def from_factors(cls, factors):
+        solver = cls.__new__(cls)
+        # LAPACK writes to the pivots, so they can not stay a read-only memmap.
+        solver.lu_piv = (factors['lu'], np.array(factors['piv']))
+        return solver
+
+
+class SparseLUSolver(object):
+    """ Sparse LU factorization (SuperLU through scipy.sparse.linalg.splu). """
+    matrix_free = False
+
+    def __init__(self, A, shape=None, neumann=(), **options):
+        self.lu = splu(sp.csc_matrix(A))
+
+    def solve(self, b, x0=None):
+        return self.lu.solve(b)
+
+
+class CholeskySolver(object):
+    """ Cholesky factorization of -A, which is symmetric positive definite for
+        all rooms. Uses CHOLMOD (scikit-sparse) if it is installed, otherwise
+        a dense Cholesky factorization for small grids, and sparse LU (with a
+        warning) for larger ones.
+    """
+    matrix_free = False
+
+    def __init__(self, A, shape=None, neumann=(), **options):
+        if abs(A - A.T).max() > 0:
+            raise ValueError('The Cholesky solver needs a symmetric matrix A.')
+        self.factor = None
+        self.dense = None
+        self.lu = None
+        if cholmod_cholesky is not None:
+            self.factor = cholmod_cholesky(sp.csc_matrix(-A))
+        elif A.shape[0] <= DENSE_LIMIT:
+            self.dense = sl.cho_factor(-A.toarray())
+        else:
+            warnings.warn('Sparse Cholesky needs scikit-sparse (sksparse.cholmod), using splu instead.', RuntimeWarning)
+            self.lu = splu(sp.csc_matrix(A))
+
+    def solve(self, b, x0=None):
+        if self.factor is not None:
+            return -self.factor(b)
+        if self.lu is not None:
+            return self.lu.solve(b)
+        return -sl.cho_solve(self.dense, b)
+
+    def factors(self):
+        """ Only the dense factorization can be cached. """
+        if self.dense is None:
+            return None
+        return {'c': self.dense[0], 'lower': np.array(self.dense[1])}
+
+    @classmethod
+    def from_factors(cls, factors):
+        solver = cls.__new__(cls)
+        solver.factor = None
+        solver.lu = None
+        solver.dense = (factors['c'], bool(factors['lower']))
+        return solver
+
+
+SOLVERS = {
+    'spsolve': SpsolveSolver,
+    'dense': DenseLUSolver,
+    'splu': SparseLUSolver,
+    'cholesky': CholeskySolver,
+    'fft': FastPoissonSolver,
+    'multigrid': MultigridSolver,
+    'cg': KrylovSolver,
+    'strips': StripSolver,
+}
+
+
+PRECISIONS = ('double', 'single')
+
+# Largest number of refinement steps of RefinedSolver.
+MAX_REFINE = 10
+
+
+class RefinedSolver(object):
+    """ A backend factorized in single precision, for half the memory and
+        bandwidth of the factors. Every solve is followed by steps of
+        iterative refinement
+
+            r = b - A x (in float64),  x = x + solve(r) (in float32)
+
+        until the correction is below tol (the 2-norm, as the update of the
+        rooms) or stops decreasing, so the result has the accuracy of a
+        float64 solve when tol asks for it. A loose tol stops after the first correction, which is
+        the estimate of the error of the float32 solve.
+    """
+    matrix_free = False
+
+    def __init__(self, solver, A, tol=1e-7):
+        self.solver = solver
+        self.A = sp.csr_matrix(A)
+        self.tol = tol
+        self.refinements = 0    # total number of refinement steps, for benchmarks
+
+    def solve(self, b, x0=None):
+        # An initial guess (the field of the last iteration of the room) is
+        # refined directly, which saves the first solve.
+        if x0 is not None:
+            x = np.array(x0, dtype=np.float64)
+        else:
+            x = self.solver.solve(b.astype(np.float32)).astype(np.float64)
+        previous = np.inf
+        for step in range(MAX_REFINE):
+            dx = self.solver.solve((b - self.A @ x).astype(np.float32))
+            x += dx
+            self.refinements += 1
+            # Also stop when the corrections no longer decrease: x is then
+            # as accurate as the float64 residual allows.
+            norm = sl.norm(dx)
+            if norm <= self.tol or norm > previous/2:
+                break
+            previous = norm
+        return x
+
+
+# Backends that can be factorized in single precision.
+FACTORIZING = ('spsolve', 'dense', 'splu', 'cholesky')
+
+# Backends whose solve() takes several right-hand sides at once, as an array
+# b with one column per right-hand side.
+MULTI_RHS = ('spsolve', 'dense', 'splu', 'cholesky', 'fft')
+
+
+def is_matrix_free(name):
+    """ Returns True if the backend called name does not need the matrix A. """
+    return name in SOLVERS and SOLVERS[name].matrix_free
+
+
+def make_solver(name, A, shape, neumann=(), cache=None, precision='double', **options):
+    """ Creates (and thereby factorizes) the solver backend called name for
+        the matrix A of a room with shape = (rows, cols) of unknown nodes and
+        the given Neumann sides. A may be None for matrix-free backends.
+        Options such as the tolerance of iterative backends are passed on,
+        and ignored by the direct ones. With a cache (cache.Cache), the
+        factorization is loaded from it if it is there, and stored otherwise.
+    """
+    if name not in SOLVERS:
+        raise ValueError('Unknown solver: ' + str(name) + '. Choose from ' + ', '.join(sorted(SOLVERS)))
+    if precision not in PRECISIONS:
+        raise ValueError('Unknown precision: ' + str(precision) + '. Choose from ' + ', '.join(PRECISIONS))
+    solver_class = SOLVERS[name]
+    if precision == 'single':
+        if name not in FACTORIZING:
+            raise ValueError('The single precision needs a factorizing solver, not ' + name + '.')
+        single = make_solver(name, A.astype(np.float32), shape, neumann, cache, **options)
+        return RefinedSolver(single, A, options.get('tol', 1e-7))
+    if cache is None:
+        return solver_class(A, shape, neumann, **options)
+    if A is None or not hasattr(solver_class, 'from_factors'):
+        warnings.warn('The solver ' + name + ' is set up again in every run, only the dense solvers are loaded '
+                      'from the cache.', RuntimeWarning)
+        return solver_class(A, shape, neumann, **options)
+
+    key = {'solver': name, 'shape': list(shape), 'A': cache_module.digest(A)}
+    factors = cache.load('operator', key)
+    if factors:
+        return solver_class.from_factors(factors)
+    solver = solver_class(A, shape, neumann, **options)
+    factors = solver.factors()
+    if factors is not None:
+        cache.store('operator', key, factors)
+    else:
+        warnings.warn('The factors of the solver ' + name + ' can not be cached, only dense ones can.',
+                      RuntimeWarning)
+    return solver
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+    A room split into horizontal strips on several ranks.
+
+    The rows of the room are divided into strips, separated by single rows
+    of nodes (separators). Each rank of the strip communicator owns one
+    strip and factorizes its operator with splu. With the unknowns of the
+    strips eliminated, the separators satisfy the small Schur complement
+    system
+
+        S x_S = b_S - sum_k A_Sk A_k^-1 b_k,
+
+    S = A_SS - sum_k A_Sk A_k^-1 A_kS, which rank 0 of the strip communicator
+    (the rank of the room in the Dirichlet-Neumann iteration) assembles and
+    factorizes once. A solve is then two local solves per strip and one
+    dense solve with S, so the result is the same as with one sparse LU of
+    the whole room, up to rounding.
+
+    Rank 0 uses the solver like any other backend; the other ranks wait in
+    serve() until rank 0 calls close().
+"""
+import numpy as np
+import scipy.linalg as sl
+from scipy.sparse.linalg import splu
+
+import assembly
+import communication
+
+
+# Commands sent from rank 0 to the other ranks of the strip communicator.
+SOLVE = 1
+STOP = 0
+
+# Number of columns of the coupling solved at once in the setup.
+BLOCK = 64
+
+
+class StripSolver(object):
+    matrix_free = True
+
+    def __init__(self, A, shape, neumann=(), strip_com=None, shift=0, **options):
+        if strip_com is None:
+            raise ValueError('The strips solver needs the communicator of the ranks of the room (strip_com).')
+        if not hasattr(strip_com, 'Scatterv'):
+            raise ValueError('The strips solver needs an MPI communicator (run with mpirun), the backends of '
+                             'local_comm.py do not have its collectives.')
+        self.com = strip_com
+        MPI = self.MPI = communication.namespace(strip_com)
+        self.rank = strip_com.Get_rank()
+        p = strip_com.Get_size()
+        M, N = shape
+        if M < 2*p - 1:
+            raise ValueError('A room with ' + str(M) + ' rows can not be split into ' + str(p) + ' strips.')
+        self.shape = shape
+        self.N = N
+        self.command = np.zeros(1, dtype=np.int64)
+
+        # Strip k has counts[k] rows starting at row starts[k], and separator
+        # k is the row right after strip k.
+        interior = M - (p - 1)
+        counts = [interior//p + (k < interior % p) for k in range(p)]
+        starts = np.concatenate(([0], np.cumsum(np.array(counts) + 1)[:-1]))
+        self.separators = starts[:-1] + np.array(counts[:-1])
+        self.counts = np.array(counts)*N
+        self.displs = starts*N
+        n = counts[self.rank]
+
+        # The separators next to this strip: above (k-1) and below (k).
+        self.neighbours = []
+        if self.rank > 0:
+            self.neighbours.append(self.rank - 1)
+        if self.rank < p - 1:
+            self.neighbours.append(self.rank)
+        local_neumann = [side for side in neumann if side in ('left', 'right')]
+        if self.rank == 0 and 'top' in neumann:
+            local_neumann.append('top')
+        if self.rank == p - 1 and 'bottom' in neumann:
+            local_neumann.append('bottom')
+        self.lu = splu(assembly.five_point_operator(n, N, neumann=local_neumann, shift=shift))
+
+        # R couples the first/last row of the strip to its separators (A_kS).
+        # C = -R^T A_k^-1 R only needs the rows of A_k^-1 R in the first and
+        # last row, so the columns of R are solved for BLOCK at a time and
+        # only those rows are kept.
+        self.coupling = []
+        for s in self.neighbours:
+            self.coupling.append(slice(0, N) if s == self.rank - 1 else slice((n - 1)*N, n*N))
+        columns = np.concatenate([np.arange(n*N)[rows] for rows in self.coupling])
+        C = np.empty((len(columns), len(columns)))
+        for start in range(0, len(columns), BLOCK):
+            block = columns[start:start + BLOCK]
+            R = np.zeros((n*N, len(block)))
+            R[block, np.arange(len(block))] = 1
+            C[:, start:start + len(block)] = -self.lu.solve(R)[columns]
+
+        # Rank 0 assembles S from A_SS (Tx on each separator row, -2 from Ty)
+        # and the contributions -A_Sk A_k^-1 A_kS of all strips.
+        sizes = np.array([(min(k, 1) + (k < p - 1))*N for k in range(p)])
+        self.g_counts = sizes
+        self.g_displs = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        C_all = np.empty(np.sum(sizes**2)) if self.rank == 0 else None
+        c_displs = np.concatenate(([0], np.cumsum(sizes**2)[:-1]))
+        self.com.Gatherv([C.ravel(), MPI.DOUBLE], [C_all, sizes**2, c_displs, MPI.DOUBLE] if self.rank == 0 else None, root=0)
+        self.x_S = np.empty((p - 1)*N)
+        if self.rank == 0:
+            Tx = assembly.laplacian_1d(N, 'left' in neumann, 'right' in neumann).toarray()
+            S = np.kron(np.eye(p - 1), Tx - (2 + shift)*np.eye(N))
+            for k in range(p):
+                block = C_all[c_displs[k]:c_displs[k] + sizes[k]**2].reshape(sizes[k], sizes[k])
+                index = np.concatenate([np.arange(s*N, (s + 1)*N) for s in ([k - 1] if k > 0 else []) + ([k] if k < p - 1 else [])])
+                S[np.ix_(index, index)] += block
+            self.S = sl.lu_factor(S)
+            self.g = np.empty(np.sum(sizes))
+
+    def parallel_solve(self, b):
+        """ The solve, on all ranks of the strip communicator. b is only
+            used on rank 0.
+        """
+        N = self.N
+        MPI = self.MPI
+        b_local = np.empty(self.counts[self.rank])
+        self.com.Scatterv([b, self.counts, self.displs, MPI.DOUBLE] if self.rank == 0 else None, [b_local, MPI.DOUBLE], root=0)
+        y = self.lu.solve(b_local)
+        g = np.concatenate([y[rows] for rows in self.coupling])
+        self.com.Gatherv([g, MPI.DOUBLE], [self.g, self.g_counts, self.g_displs, MPI.DOUBLE] if self.rank == 0 else None, root=0)
+        if self.rank == 0:
+            rhs = np.concatenate([b[s*N:(s + 1)*N] for s in self.separators])
+            p = len(self.counts)
+            for k in range(p):
+                offset = self.g_displs[k]
+                if k > 0: # first row of strip k, next to separator k-1
+                    rhs[(k - 1)*N:k*N] -= self.g[offset:offset + N]
+                    offset += N
+                if k < p - 1: # last row of strip k, next to separator k
+                    rhs[k*N:(k + 1)*N] -= self.g[offset:offset + N]
+            self.x_S[:] = sl.lu_solve(self.S, rhs)
+        self.com.Bcast([self.x_S, MPI.DOUBLE], root=0)
+
+        for s, rows in zip(self.neighbours, self.coupling):
+            b_local[rows] -= self.x_S[s*N:(s + 1)*N]
+        x = self.lu.solve(b_local)
+        U = np.empty(self.shape[0]*N) if self.rank == 0 else None
+        self.com.Gatherv([x, MPI.DOUBLE], [U, self.counts, self.displs, MPI.DOUBLE] if self.rank == 0 else None, root=0)
+        if self.rank == 0:
+            for i, s in enumerate(self.separators):
+                U[s*N:(s + 1)*N] = self.x_S[i*N:(i + 1)*N]
+        return U
+
+    def solve(self, b, x0=None):
+        self.command[0] = SOLVE
+        self.com.Bcast([self.command, self.MPI.INT64_T], root=0)
+        return self.parallel_solve(np.ascontiguousarray(b, dtype=np.float64))
+
+    def close(self):
+        """ Lets the other ranks leave serve(). """
+        self.command[0] = STOP
+        self.com.Bcast([self.command, self.MPI.INT64_T], root=0)
+
+    def serve(self):
+        """ Takes part in the solves of rank 0 until it calls close(). """
+        while True:
+            self.com.Bcast([self.command, self.MPI.INT64_T], root=0)
+            if self.command[0] == STOP:
+                return
+            self.parallel_solve(None)
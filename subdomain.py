@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+    A room of an arbitrary layout (see layout.py) as a subdomain of the
+    Dirichlet-Neumann iteration.
+
+    The unknowns are numbered row by row as in Room, row 0 at the top. Every
+    node next to a side gets the fixed temperature of the wall, heater or
+    window there, or the interface data: the temperature on the interface
+    for a Dirichlet room, and the flux for a Neumann room (which has -3 on
+    the diagonal there, as room 1 and 3).
+"""
+import numpy as np
+import scipy.sparse as sp
+
+import assembly
+import boundary
+import solvers
+from assembly import SIDES
+
+
+class Subdomain(object):
+
+    def __init__(self, spec, layout, dx, solver='splu', tol=1e-6, preconditioner='multigrid'):
+        self.spec = spec
+        self.name = spec.name
+        self.role = spec.role
+        self.dx = dx
+        self.M = int(round(spec.height/dx)) - 1  # number of rows of nodes
+        self.N = int(round(spec.width/dx)) - 1   # number of cols of nodes
+        self.shape = (self.M, self.N)
+        self.u = None
+        self.u_km1 = None
+
+        # Fixed part of b, and the node indices of every interface of the
+        # room (ordered by the coordinate along the interface, so that they
+        # match the nodes of the room on the other side).
+        size = self.M*self.N
+        self.boundary = boundary.Boundary(self.M, self.N)
+        self.interfaces = []
+        fixed_sum = 0.0
+        fixed_count = 0
+        neumann_sides = []
+        partial = np.zeros(size)
+        for side in SIDES:
+            index, t = self.side_nodes(side)
+            kind = np.array(['wall']*len(index), dtype=object)
+            for segment in spec.boundaries:
+                if segment['side'] == side:
+                    start = segment.get('start', -np.inf)
+                    end = segment.get('end', np.inf)
+                    kind[(t >= start - 1e-9) & (t <= end + 1e-9)] = segment['type']
+            temp = np.array([layout.temperatures[name] for name in kind], dtype=float)
+
+            free = np.ones(len(index), dtype=bool)
+            for interface in layout.interfaces:
+                if (interface.dirichlet is spec and interface.dirichlet_side == side) or \
+                   (interface.neumann is spec and interface.neumann_side == side):
+                    inside = (t > interface.start + 1e-9) & (t < interface.end - 1e-9)
+                    order = np.argsort(t[inside])
+                    self.interfaces.append((interface, index[inside][order]))
+                    free &= ~inside
+            if self.role == 'neumann' and not free.any():
+                neumann_sides.append(side)
+            elif self.role == 'neumann':
+                partial[index[~free]] += 1
+
+            for name in layout.temperatures:
+                if (free & (kind == name)).any():
+                    self.boundary.add_fixed(index[free & (kind == name)], name)
+            fixed_sum += temp[free].sum()
+            fixed_count += free.sum()
+        self.neumann = tuple(neumann_sides)
+        self.b = self.boundary.assemble(layout.temperatures)
+        self.b_fixed = self.boundary.b_fixed
+        # Initial guess for the interface values of a Neumann room: the mean
+        # temperature of its walls, heaters and windows.
+        self.initial_temp = fixed_sum/fixed_count if fixed_count else layout.temperatures['wall']
+
+        # Neumann data on part of a side only changes single diagonal
+        # elements, which the matrix-free solvers can not handle.
+        A = None
+        if solvers.is_matrix_free(solver):
+            if partial.any():
+                raise ValueError('Room ' + self.name + ' has Neumann data on part of a side, use an assembled solver.')
+        else:
+            A = assembly.five_point_operator(self.M, self.N, neumann=self.neumann)
+            if partial.any():
+                A = (A + sp.diags(partial)).tocsc()
+        self.A = A
+        self.linear_solver = solvers.make_solver(solver, A, self.shape, self.neumann, tol=tol/10,
+                                                 preconditioner=preconditioner)
+
+    def side_nodes(self, side):
+        """ Returns the indices of the nodes next to a side, and their
+            coordinates along it (y for left/right, x for top/bottom).
+        """
+        M, N = self.M, self.N
+        index = np.arange(M*N)[self.boundary.side(side)]
+        if side in ('left', 'right'):
+            return index, self.spec.y + self.spec.height - self.dx*(np.arange(M) + 1)
+        return index, self.spec.x + self.dx*(np.arange(N) + 1)
+
+    def update_b(self, data):
+        """ data[k] is the interface data of interface k: temperatures for a
+            Dirichlet room and fluxes for a Neumann room. Two interfaces can
+            share a corner node, so the data is added to a copy of b_fixed
+            (instead of Boundary.scatter()).
+        """
+        np.copyto(self.b, self.b_fixed)
+        for interface, index in self.interfaces:
+            self.b[index] -= data[interface.index]
+
+    def solve(self, data):
+        self.update_b(data)
+        return self.linear_solver.solve(self.b, x0=self.u_km1)
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+    Many scenarios (wall, heater and window temperatures) at about the cost of
+    one solve.
+
+    The temperatures only enter b, so the solution is linear in them: with
+    the solutions for a unit temperature on the walls, on the heaters and on
+    the windows (the basis), every scenario is a combination of three fields.
+    The three basis solutions are computed in one batched Room.solve(), with
+    three columns in b, u and the interface vectors ('basis' mode). In the
+    'block' mode all scenarios are solved together as columns instead.
+
+    A table of scenarios is a CSV file with a header, e.g.
+
+        wall_temp,heater_temp,win_temp
+        15,40,5
+        18,60,-10
+
+        python main.py -d 1/20 --sweep scenarios.csv --backend threads
+"""
+import numpy as np
+
+import communication
+import room
+
+
+COLUMNS = ('wall_temp', 'heater_temp', 'win_temp')
+DEFAULTS = {'wall_temp': 15, 'heater_temp': 40, 'win_temp': 5}
+MODES = ('basis', 'block')
+
+
+def load_scenarios(filename, defaults=None):
+    """ Returns the scenarios of a CSV file as an array with one row
+        (wall_temp, heater_temp, win_temp) per scenario. Missing columns get
+        the values in defaults.
+    """
+    defaults = dict(DEFAULTS, **(defaults or {}))
+    table = np.genfromtxt(filename, delimiter=',', names=True, ndmin=1)
+    for name in table.dtype.names:
+        if name not in COLUMNS:
+            raise ValueError('Unknown column in ' + str(filename) + ': ' + name + '. Use ' + ', '.join(COLUMNS))
+    return np.column_stack([table[name] if name in table.dtype.names else np.ones(len(table))*defaults[name]
+                            for name in COLUMNS])
+
+
+def run_sweep(com, kwargs, scenarios, mode='basis'):
+    """ One rank of a sweep over the scenarios (one row per scenario). Room 2
+        returns a dict with the fields U1, U2 and U3 of all scenarios (one
+        row per scenario) and the number of iterations; the other ranks
+        return None.
+    """
+    if mode not in MODES:
+        raise ValueError('Unknown sweep mode: ' + str(mode) + '. Choose from ' + ', '.join(MODES))
+    kwargs = {key: value for key, value in kwargs.items() if key not in COLUMNS}
+    scenarios = np.asarray(scenarios, dtype=float)
+    if mode == 'basis':
+        temps = np.eye(3)
+        # Scenario s is sum_i scenarios[s, i]*basis_i, so its error is at
+        # most sum_i |scenarios[s, i]| times the error of the basis.
+        kwargs['tol'] = kwargs.get('tol', 1e-6)/max(np.abs(scenarios).sum(axis=1).max(), 1)
+    else:
+        temps = scenarios.T
+
+    room_nr = com.Get_rank() + 1
+    room_object = room.Room(com=com, room=room_nr, wall_temp=temps[0], heater_temp=temps[1], win_temp=temps[2], **kwargs)
+    U, gamma = room_object.solve()
+    if room_nr != 2:
+        communication.send_result(com, U, gamma, dest=1)
+        return None
+
+    N = room_object.N
+    K = temps.shape[1]
+    U1 = communication.recv_result(com, source=0, size=N*N*K, N=N*K)[0].reshape(N*N, K)
+    U3 = communication.recv_result(com, source=2, size=N*N*K, N=N*K)[0].reshape(N*N, K)
+    fields = {'U1': U1, 'U2': U, 'U3': U3}
+    for name in fields:
+        if mode == 'basis':
+            fields[name] = fields[name] @ scenarios.T
+        fields[name] = fields[name].T
+    fields['iterations'] = room_object.max_iters
+    return fields
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+    The solution cache of main.py (see cache.py) with --output: the rooms
+    write their fields to the map instead of gathering them, and should
+    still store their solutions, so that the next run starts warm.
+
+        python -m pytest -q test_cache.py
+"""
+import os
+import re
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def iterations(tmp_path, output):
+    command = [sys.executable, os.path.join(HERE, 'main.py'), '-d', '1/20', '--backend', 'threads',
+               '--cache', str(tmp_path/'cache'), '--output', str(tmp_path/output)]
+    result = subprocess.run(command, cwd=HERE, capture_output=True, text=True, timeout=120,
+                            env=dict(os.environ, MPLBACKEND='Agg'))
+    assert result.returncode == 0, result.stderr
+    return int(re.search(r'finished after (\d+) iterations', result.stdout).group(1))
+
+
+def test_output_and_cache(tmp_path):
+    cold = iterations(tmp_path, 'first')
+    assert os.listdir(tmp_path/'cache')
+    warm = iterations(tmp_path, 'second')
+    assert warm < cold
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+    The orderings of the interface iteration under mpirun, with an eager limit
+    of 64 bytes, so that every interface message is sent with the rendezvous
+    protocol: a blocking Send then waits until the receive is posted, and two
+    rooms that send to each other at the same time deadlock. The in-process
+    backends of local_comm.py buffer all sends and can not show this.
+
+        python -m pytest -q test_mpi.py
+"""
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import room
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.mark.skipif(shutil.which('mpirun') is None, reason='needs mpirun')
+@pytest.mark.parametrize('ordering', room.ORDERINGS)
+def test_small_eager_limit(ordering):
+    pytest.importorskip('mpi4py')
+    command = ['mpirun', '--allow-run-as-root', '--oversubscribe', '--mca', 'btl', 'self,tcp',
+               '--mca', 'btl_tcp_eager_limit', '64', '-np', '3',
+               sys.executable, os.path.join(HERE, 'main.py'), '-d', '1/40', '--ordering', ordering]
+    try:
+        result = subprocess.run(command, cwd=HERE, capture_output=True, text=True, timeout=120)
+    except subprocess.TimeoutExpired:
+        pytest.fail('The ordering ' + ordering + ' did not finish in 120 s (deadlock).')
+    assert result.returncode == 0, result.stderr
+    assert 'Algorithm finished after' in result.stdout
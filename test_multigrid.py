@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+    MultigridSolver warns when it stops at max_cycles without reaching tol.
+
+        python -m pytest -q test_multigrid.py
+"""
+import warnings
+
+import numpy as np
+import pytest
+
+import assembly
+from multigrid import MultigridSolver
+
+
+def test_warns_without_convergence():
+    solver = MultigridSolver(None, (19, 19), tol=1e-12, max_cycles=1)
+    with pytest.warns(RuntimeWarning, match='did not reach the tolerance'):
+        solver.solve(np.ones(19*19))
+
+
+def test_converges_without_warning():
+    A = assembly.five_point_operator(19, 19)
+    b = np.ones(19*19)
+    solver = MultigridSolver(None, (19, 19), tol=1e-10)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        x = solver.solve(b)
+    assert np.abs(A @ x - b).max() < 1e-6
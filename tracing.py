@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+    Per-iteration records of the Dirichlet-Neumann iteration.
+
+    A Room with a callback calls it once per iteration with a record (dict):
+
+        room, iteration
+        start, end          wall clock time [s] of the start and end of the iteration
+        recv_time           time blocked waiting for the data of the other rooms [s]
+        solve_time          time of the update of b and the linear solve [s]
+        update_norm         2-norm of the change of the field since the last iteration
+        interface_norm      room 1 and 3: 2-norm of the change of the interface values,
+                            room 2: 2-norm of the Neumann data it sends
+        bytes_sent, bytes_received
+
+    Without a callback nothing is recorded. A Recorder keeps the records of
+    one rank; the records of all ranks are merged into one trace file, either
+    JSON lines (.jsonl, one record per line) or the Chrome trace format (any
+    other extension, open it in chrome://tracing or https://ui.perfetto.dev),
+    which shows the time every room spends solving and waiting on the others.
+
+        python main.py -d 1/40 --backend threads --trace trace.json
+"""
+import glob
+import json
+import os
+import sys
+
+
+class Recorder(object):
+    """ Callback that keeps the records of the rooms of one rank. """
+    def __init__(self, rank):
+        self.rank = rank
+        self.records = []
+
+    def __call__(self, record):
+        record['rank'] = self.rank
+        self.records.append(record)
+
+
+def print_record(record):
+    """ Callback that prints every iteration (used by Room with debug=True). """
+    line = 'Room ' + str(record['room']) + ', iteration ' + str(record['iteration']) + ': solve ' \
+        + str(round(1000*record['solve_time'], 3)) + ' ms, waited ' + str(round(1000*record['recv_time'], 3)) + ' ms'
+    if record['update_norm'] is not None:
+        line += ', update = ' + str(record['update_norm'])
+    print(line)
+    sys.stdout.flush()
+
+
+def chrome_events(records):
+    """ The records as events of the Chrome trace format: one row (thread)
+        per rank, with a span for the wait and one for the solve of every
+        iteration, and the update norms as counters.
+    """
+    events = []
+    rooms = {}
+    for record in records:
+        rooms[record['rank']] = record['room']
+    for rank, room_nr in sorted(rooms.items()):
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': 0, 'tid': rank,
+                       'args': {'name': 'Room ' + str(room_nr) + ' (rank ' + str(rank) + ')'}})
+    t0 = min(record['start'] for record in records) if records else 0
+    for record in records:
+        start = 1e6*(record['start'] - t0)
+        args = {key: record[key] for key in ('iteration', 'update_norm', 'interface_norm', 'bytes_sent', 'bytes_received')}
+        events.append({'name': 'wait', 'cat': 'communication', 'ph': 'X', 'pid': 0, 'tid': record['rank'],
+                       'ts': start, 'dur': 1e6*record['recv_time'], 'args': args})
+        events.append({'name': 'solve', 'cat': 'compute', 'ph': 'X', 'pid': 0, 'tid': record['rank'],
+                       'ts': start + 1e6*record['recv_time'], 'dur': 1e6*record['solve_time'], 'args': args})
+        if record['update_norm'] is not None:
+            events.append({'name': 'update norm room ' + str(record['room']), 'ph': 'C', 'pid': 0,
+                           'ts': 1e6*(record['end'] - t0), 'args': {'value': record['update_norm']}})
+    return events
+
+
+def write(records, filename):
+    """ Writes the records, sorted by start time, as JSON lines (.jsonl) or
+        in the Chrome trace format.
+    """
+    records = sorted(records, key=lambda record: record['start'])
+    with open(filename, 'w') as f:
+        if filename.endswith('.jsonl'):
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        else:
+            json.dump({'traceEvents': chrome_events(records), 'displayTimeUnit': 'ms'}, f)
+
+
+def part_file(filename, rank):
+    return filename + '.rank' + str(rank) + '.jsonl'
+
+
+def write_part(records, filename, rank):
+    """ Writes the records of one rank, to be merged with merge_parts(). """
+    with open(part_file(filename, rank), 'w') as f:
+        for record in records:
+            f.write(json.dumps(record) + '\n')
+
+
+def merge_parts(filename):
+    """ Merges the parts of all ranks into filename and removes them. """
+    records = []
+    for part in sorted(glob.glob(glob.escape(filename) + '.rank*.jsonl')):
+        with open(part) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+        os.remove(part)
+    write(records, filename)
+    return records
@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+    Time-dependent heat distribution.
+
+    The temperature satisfies u_t = alpha*Laplace(u), and with the (unscaled)
+    operator A and right-hand side b of a room, Laplace(u) = (A u - b)/dx^2.
+    With r = alpha*dt/dx^2, the time steps are
+
+        backward Euler:  (A - I/r) u^{n+1} = b^{n+1} - u^n/r
+        Crank-Nicolson:  (A - 2I/r) u^{n+1} = b^{n+1} - 2u^n/r - (A u^n - b^n)
+
+    where b includes the interface data. Every time step is a
+    Dirichlet-Neumann iteration (Room.solve()) for the shifted operator, with
+    the u^n terms as source. The shifted operator is factorized once, when
+    the rooms are created, and the interface iteration of a step starts from
+    the interface values of the previous step.
+
+    Snapshots are written to one .npy file per room (opened as a memmap, so
+    they are not kept in memory), and room 2 writes the times to times.npy.
+
+        python main.py -d 1/20 --transient 86400 --dt 60 --snapshots out --backend threads
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+import assembly
+import room
+
+
+DAY = 24*3600.0
+METHODS = ('BE', 'CN')
+
+# Thermal diffusivity of air [m^2/s].
+ALPHA_AIR = 2.2e-5
+
+
+def day_profile(wall_temp=15, heater_temp=40, win_temp=5):
+    """ Returns temperatures(t) -> (wall, heater, window) for t in seconds:
+        the heaters are on from 6 to 22 (at the wall temperature otherwise),
+        and the window temperature varies by 5 degrees around win_temp over
+        the day, coldest at 4 in the morning.
+    """
+    def temperatures(t):
+        hour = (t % DAY)/3600
+        heater = heater_temp if 6 <= hour < 22 else wall_temp
+        window = win_temp - 5*np.cos(2*np.pi*(hour - 4)/24)
+        return wall_temp, heater, window
+    return temperatures
+
+
+class Transient(object):
+    """ One room of a transient simulation. All ranks take the same steps. """
+
+    def __init__(self, com, room_nr, dx, dt, method='BE', alpha=ALPHA_AIR, temperatures=None,
+                 initial_temp=None, **kwargs):
+        assert (method in METHODS), 'The time stepping method should be BE or CN.'
+        self.dt = dt
+        self.method = method
+        self.temperatures = temperatures if temperatures is not None else day_profile()
+        r = alpha*dt/dx**2
+        self.sigma = 1/r if method == 'BE' else 2/r
+        wall, heater, window = self.temperatures(0)
+        self.room = room.Room(com=com, room=room_nr, dx=dx, shift=self.sigma, verbose=False,
+                              wall_temp=wall, heater_temp=heater, win_temp=window, **kwargs)
+        self.max_iters = self.room.max_iters
+        self.t = 0.0
+        self.steps = 0
+        self.iterations = 0
+
+        # The apartment starts at a uniform temperature (by default the wall
+        # temperature), with matching interface values and no flux.
+        if initial_temp is None:
+            initial_temp = wall
+        self.u = np.ones(self.room.b.shape)*initial_temp
+        N = self.room.N
+        if room_nr == 2:
+            self.room.update_b_room2(gamma1=np.ones(N)*initial_temp, gamma2=np.ones(N)*initial_temp)
+        else:
+            self.room.update_b_room1_room3(gamma=np.zeros(N))
+            self.room.gamma0 = np.ones(N)*initial_temp
+        self.room.u_km1 = self.u
+        self.laplacian = None
+        if method == 'CN':
+            # A u^n - b^n, which is all that is needed of the last step.
+            A = assembly.five_point_operator(*self.room.shape, neumann=self.room.neumann)
+            self.laplacian = A @ self.u - self.room.b
+
+    def step(self):
+        """ Takes one time step. """
+        self.t += self.dt
+        wall, heater, window = self.temperatures(self.t)
+        self.room.wall_temp, self.room.heater_temp, self.room.window_temp = wall, heater, window
+        self.room.create_b()
+        if self.method == 'BE':
+            self.room.source = -self.sigma*self.u
+        else:
+            self.room.source = -self.sigma*self.u - self.laplacian
+
+        # Room 2 sets max_iters to the number of iterations it needed.
+        self.room.max_iters = self.max_iters
+        u, gamma = self.room.solve()
+        if self.room.room == 2:
+            self.iterations += self.room.max_iters
+        else:
+            self.room.gamma0 = gamma
+        if self.method == 'CN':
+            # (A - sigma I) u = b + source, so A u - b = source + sigma u.
+            self.laplacian = self.room.source + self.sigma*u
+        self.u = u
+        self.steps += 1
+        return u
+
+
+def run_transient(com, kwargs, t_end, dt, method='BE', snapshots=None, snapshot_every=10):
+    """ One rank of a transient simulation from 0 to t_end. Room 2 returns
+        a dict with the number of steps, interface iterations and steps per
+        second, the other ranks None.
+    """
+    room_nr = com.Get_rank() + 1
+    kwargs = dict(kwargs)   # the thread backends share kwargs between the ranks
+    temperatures = day_profile(**{key: kwargs.pop(key) for key in ('wall_temp', 'heater_temp', 'win_temp') if key in kwargs})
+    dx = kwargs.pop('dx')
+    simulation = Transient(com, room_nr, dx, dt, method=method, temperatures=temperatures, **kwargs)
+    steps = int(round(t_end/dt))
+
+    output = None
+    if snapshots is not None:
+        os.makedirs(snapshots, exist_ok=True)
+        count = steps//snapshot_every + 1
+        output = np.lib.format.open_memmap(os.path.join(snapshots, 'room%d.npy' % room_nr), mode='w+',
+                                           dtype=np.float64, shape=(count, simulation.u.size))
+        output[0] = simulation.u
+        if room_nr == 2:
+            np.save(os.path.join(snapshots, 'times.npy'), dt*snapshot_every*np.arange(count))
+
+    time1 = time.time()
+    for n in range(1, steps + 1):
+        u = simulation.step()
+        if output is not None and n % snapshot_every == 0:
+            output[n//snapshot_every] = u
+    time2 = time.time()
+    if output is not None:
+        output.flush()
+        del output
+
+    if room_nr != 2:
+        return None
+    result = {'steps': steps, 'iterations': simulation.iterations, 'time': time2 - time1,
+              'steps_per_second': steps/(time2 - time1)}
+    print(str(steps) + ' time steps (' + method + ', dt = ' + str(dt) + ' s) in ' + str(round(time2 - time1, 2))
+          + ' s: ' + str(round(result['steps_per_second'], 1)) + ' steps/s, '
+          + str(round(simulation.iterations/steps, 1)) + ' interface iterations per step.')
+    sys.stdout.flush()
+    return result